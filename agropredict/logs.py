@@ -0,0 +1,165 @@
+# agropredict/logs.py
+"""
+Logging no bloqueante para los workers.
+
+Los loggers escriben en un QueueHandler con cola acotada; un QueueListener
+en un hilo aparte formatea los registros como JSON y los escribe en un
+archivo con rotación por tamaño o por tiempo. Si el disco se atrasa y la
+cola se llena, el registro se descarta según la política configurada en
+vez de bloquear la request:
+
+- 'descartar_nuevo': se pierde el registro entrante.
+- 'descartar_antiguo': se saca el más antiguo de la cola para hacerle lugar.
+
+Los descartes se cuentan y se informan con un registro WARNING apenas la
+cola vuelve a tener espacio.
+
+Cada proceso tiene su propio listener; con varios workers de gunicorn
+conviene un archivo por proceso (LOG_FILE con {pid}) para que la rotación
+de uno no interfiera con otro.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+
+POLITICAS = ('descartar_nuevo', 'descartar_antiguo')
+ROTACIONES = ('tamano', 'tiempo')
+
+# Atributos estándar de LogRecord; el resto se considera contexto extra
+_ATRIBUTOS_RECORD = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class FormateadorJSON(logging.Formatter):
+    """Un objeto JSON por línea con los campos del registro y los extra."""
+
+    def format(self, record):
+        datos = {
+            'fecha': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+            'modulo': record.module,
+            'linea': record.lineno,
+            'proceso': record.process,
+            'hilo': record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            datos['excepcion'] = record.exc_text
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_RECORD and clave not in datos:
+                datos[clave] = valor
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class ColaAcotadaHandler(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloquea: aplica la política de descarte si la cola está llena."""
+
+    def __init__(self, cola, politica='descartar_nuevo'):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de descarte inválida: {politica}")
+        super().__init__(cola)
+        self.politica = politica
+        self.descartados = 0
+        self._lock_descartes = threading.Lock()
+
+    def prepare(self, record):
+        # Se resuelve el mensaje y la traza en el hilo del llamador (los
+        # argumentos podrían cambiar después), pero el formateo JSON queda
+        # para el hilo del listener
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.descartados:
+            self._informar_descartes()
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        if self.politica == 'descartar_antiguo':
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        with self._lock_descartes:
+            self.descartados += 1
+
+    def _informar_descartes(self):
+        with self._lock_descartes:
+            descartados, self.descartados = self.descartados, 0
+        aviso = logging.makeLogRecord({
+            'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+            'msg': f'{descartados} registros de log descartados por cola llena',
+            'descartados': descartados, 'politica': self.politica,
+        })
+        try:
+            self.queue.put_nowait(aviso)
+        except queue.Full:
+            with self._lock_descartes:
+                self.descartados += descartados
+
+
+class ListenerCola(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Al detenerse espera (acotado) a que haya lugar en lugar de fallar
+        # con la cola llena
+        try:
+            self.queue.put(self._sentinel, timeout=5)
+        except queue.Full:
+            pass
+
+    def stop(self):
+        # atexit puede llamarlo después de una detención explícita
+        if self._thread is not None:
+            super().stop()
+
+
+def crear_handler_archivo(archivo, rotacion='tamano', max_bytes=10 * 1024 * 1024,
+                          copias=5, cuando='midnight'):
+    """Handler de archivo con rotación por tamaño o por tiempo y formato JSON."""
+    if rotacion not in ROTACIONES:
+        raise ValueError(f"Rotación inválida: {rotacion}")
+    archivo = str(archivo).format(pid=os.getpid())
+    if rotacion == 'tamano':
+        handler = logging.handlers.RotatingFileHandler(
+            archivo, maxBytes=max_bytes, backupCount=copias, encoding='utf-8', delay=True,
+        )
+    else:
+        handler = logging.handlers.TimedRotatingFileHandler(
+            archivo, when=cuando, backupCount=copias, encoding='utf-8', delay=True, utc=True,
+        )
+    handler.setFormatter(FormateadorJSON())
+    return handler
+
+
+def crear_handler_cola(archivo, tamano_cola=10000, politica='descartar_nuevo', **opciones_archivo):
+    """
+    Fábrica para settings.LOGGING ('()': 'agropredict.logs.crear_handler_cola').
+
+    Arranca el QueueListener que escribe en el archivo y lo detiene (vaciando
+    la cola) al terminar el proceso.
+    """
+    cola = queue.Queue(maxsize=tamano_cola)
+    destino = crear_handler_archivo(archivo, **opciones_archivo)
+    listener = ListenerCola(cola, destino, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    handler = ColaAcotadaHandler(cola, politica)
+    handler.listener = listener
+    return handler
@@ -4,4 +4,10 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agropredict.settings')
 
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# La copia en memoria de las predicciones se carga en segundo plano desde
+# ya, no en la primera solicitud que la necesite
+from predicciones.services import instantanea  # noqa: E402
+
+instantanea.precargar()
@@ -28,7 +28,7 @@ class PrediccionAdmin(admin.ModelAdmin):
         'id', 'tipo_arbol', 'comuna', 'usuario', 'hectareas', 
         'produccion_por_hectarea', 'confiabilidad', 'estado', 'fecha_creacion'
     )
-    list_filter = ('estado', 'tipo_arbol', 'comuna__region', 'fecha_creacion')
+    list_filter = ('estado', 'tipo_arbol', 'region', 'fecha_creacion')
     search_fields = (
         'usuario__username', 'usuario__first_name', 'usuario__last_name',
         'tipo_arbol__tipo', 'comuna__nombre'
@@ -49,6 +49,10 @@ class PrediccionAdmin(admin.ModelAdmin):
         ('Resultados', {
             'fields': ('produccion_total', 'produccion_por_hectarea', 'confiabilidad')
         }),
+        ('Flujo de Caja', {
+            'fields': ('van', 'tir', 'periodo_recuperacion', 'flujos_caja'),
+            'classes': ('collapse',)
+        }),
         ('Fechas', {
             'fields': ('fecha_creacion', 'fecha_actualizacion'),
             'classes': ('collapse',)
@@ -1,6 +1,79 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+
+
+def ajustar_sqlite(sender, connection, **kwargs):
+    """Aplica settings.SQLITE_PRAGMAS a cada conexión SQLite nueva."""
+    if connection.vendor != 'sqlite':
+        return
+    from django.conf import settings
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if pragmas:
+        with connection.cursor() as cursor:
+            for nombre, valor in pragmas.items():
+                cursor.execute(f'PRAGMA {nombre} = {valor}')
+
+
+def recordar_aporte(sender, instance, raw=False, using=None, **kwargs):
+    """Antes de guardar una predicción existente, lee su aporte actual a los resúmenes."""
+    if raw:
+        return
+    from .services import tendencias
+    anterior = None
+    if not instance._state.adding and instance.pk is not None:
+        anterior = sender._base_manager.using(using).filter(
+            pk=instance.pk
+        ).values(*tendencias.CAMPOS).first()
+    instance._aporte_anterior = anterior
+
+
+def actualizar_resumenes(sender, instance, raw=False, **kwargs):
+    """Aplica a los resúmenes de tendencia la diferencia de la predicción guardada."""
+    if raw:
+        return
+    from .services import tendencias
+    anterior = tendencias.aporte(getattr(instance, '_aporte_anterior', None))
+    nuevo = tendencias.aporte(tendencias.valores(instance))
+    if nuevo != anterior:
+        tendencias.aplicar(tendencias.combinar((nuevo, 1), (anterior, -1)))
+
+
+def descontar_resumenes(sender, instance, **kwargs):
+    """Resta de los resúmenes de tendencia una predicción eliminada."""
+    from .services import tendencias
+    tendencias.aplicar(tendencias.combinar((tendencias.aporte(tendencias.valores(instance)), -1)))
+
+
+def registrar_borrado(sender, instance, using=None, **kwargs):
+    """Deja constancia del borrado para la copia en memoria y el ETag del dashboard."""
+    from .models import PrediccionEliminada
+    PrediccionEliminada.objects.using(using).create(prediccion_id=instance.pk)
+
+
+def invalidar_geocodificacion(sender, **kwargs):
+    """Una comuna o región cambió: el índice de geocodificación se revisa en la próxima consulta."""
+    from .services import geocodificacion
+    geocodificacion.invalidar()
+
 
 class PrediccionesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'predicciones'
-    verbose_name = 'Predicciones Agrícolas'
\ No newline at end of file
+    verbose_name = 'Predicciones Agrícolas'
+
+    def ready(self):
+        connection_created.connect(ajustar_sqlite, dispatch_uid='predicciones_ajustar_sqlite')
+
+        prediccion = self.get_model('Prediccion')
+        pre_save.connect(recordar_aporte, sender=prediccion, dispatch_uid='predicciones_recordar_aporte')
+        post_save.connect(actualizar_resumenes, sender=prediccion, dispatch_uid='predicciones_actualizar_resumenes')
+        post_delete.connect(descontar_resumenes, sender=prediccion, dispatch_uid='predicciones_descontar_resumenes')
+        post_delete.connect(registrar_borrado, sender=prediccion, dispatch_uid='predicciones_registrar_borrado')
+
+        for modelo in (self.get_model('Comuna'), self.get_model('Region')):
+            for senal in (post_save, post_delete):
+                senal.connect(
+                    invalidar_geocodificacion, sender=modelo,
+                    dispatch_uid=f'predicciones_invalidar_geocodificacion_{modelo.__name__}_{senal is post_save}',
+                )
@@ -0,0 +1,276 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test import Client
+from predicciones.models import Prediccion
+from predicciones.services import datos_sinteticos, instantanea, lectura_predicciones
+from pathlib import Path
+import datetime
+import django
+import json
+import platform
+import subprocess
+import time
+import numpy as np
+
+DIRECTORIO = Path(settings.BASE_DIR) / 'benchmarks'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark hot paths (scoring, dashboard, list, detail, analysis, comparison) '
+        'on synthetic data at several scales and compare against a stored baseline. '
+        'Runs against a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[10000, 100000, 1000000],
+                            help='Number of predictions for each scale (ascending)')
+        parser.add_argument('--repeat', type=int, default=20, help='Measured runs per case')
+        parser.add_argument('--warmup', type=int, default=2, help='Unmeasured runs per case')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default=str(DIRECTORIO / 'resultados.json'))
+        parser.add_argument('--baseline', default=str(DIRECTORIO / 'baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store these results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p50 slowdown vs baseline before flagging a regression')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the benchmark database between runs')
+        parser.add_argument('--cases', nargs='+', help='Only run these cases')
+        parser.add_argument('--max-seconds', type=float, default=10.0,
+                            help='If one run of a case takes longer, record a single sample and move on')
+
+    def handle(self, *args, **options):
+        escalas = sorted(options['scales'])
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'], serialize=False)
+        try:
+            resultados = self.ejecutar(escalas, options)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0, keepdb=options['keepdb'])
+
+        informe = {'metadata': self.metadata(options), 'resultados': resultados}
+        baseline_path = Path(options['baseline'])
+        regresiones = []
+        if baseline_path.exists() and not options['save_baseline']:
+            baseline = json.loads(baseline_path.read_text())
+            informe['comparacion'], regresiones = self.comparar(
+                resultados, baseline.get('resultados', {}), options['tolerance']
+            )
+
+        self.escribir(Path(options['output']), informe)
+        if options['save_baseline']:
+            self.escribir(baseline_path, informe)
+            self.stdout.write(f'Baseline saved to {baseline_path}')
+
+        if regresiones:
+            for r in regresiones:
+                self.stdout.write(self.style.ERROR(r))
+            raise CommandError(f'{len(regresiones)} regression(s) against baseline')
+        self.stdout.write(self.style.SUCCESS('Benchmark completed'))
+
+    # ------------------------------------------------------------------
+    # Ejecución
+    # ------------------------------------------------------------------
+    def ejecutar(self, escalas, options):
+        rng = np.random.default_rng(options['seed'])
+        usuario, comunas, tipos = datos_sinteticos.crear_referencias(semilla=options['seed'])
+        cliente = Client(HTTP_HOST='localhost')
+        resultados = {}
+
+        for escala in escalas:
+            faltantes = escala - Prediccion.objects.count()
+            if faltantes > 0:
+                self.stdout.write(f'Seeding {faltantes} predictions (scale {escala})')
+                inicio = time.perf_counter()
+                for _ in datos_sinteticos.generar_predicciones(faltantes, usuario, comunas, tipos, rng):
+                    pass
+                self.stdout.write(f'  seeded in {time.perf_counter() - inicio:.1f}s')
+            # Como al iniciar un worker: la copia en memoria queda cargada antes
+            # de atender solicitudes y no dentro del primer caso medido
+            instantanea.sincronizar()
+
+            casos = self.casos(cliente, rng, comunas, tipos)
+            if options['cases']:
+                desconocidos = set(options['cases']) - set(casos)
+                if desconocidos:
+                    raise CommandError(f'Unknown cases: {", ".join(sorted(desconocidos))}')
+                casos = {k: v for k, v in casos.items() if k in options['cases']}
+            resultados[str(escala)] = {}
+            for nombre, funcion in casos.items():
+                medicion = self.medir(funcion, options['repeat'], options['warmup'], options['max_seconds'])
+                resultados[str(escala)][nombre] = medicion
+                self.stdout.write(
+                    f'[{escala:>9}] {nombre:<40} p50={medicion["p50_ms"]:>9.2f}ms '
+                    f'p95={medicion["p95_ms"]:>9.2f}ms queries={medicion["queries_max"]}'
+                )
+        return resultados
+
+    def casos(self, cliente, rng, comunas, tipos):
+        ids = np.array(Prediccion.objects.values_list('id', flat=True).order_by('id'))
+        total_paginas = max(1, -(-len(ids) // 10))
+
+        def id_aleatorio():
+            return int(rng.choice(ids))
+
+        def calcular_prediccion():
+            Prediccion.objects.select_related('tipo_arbol').get(pk=id_aleatorio()).calcular_prediccion()
+
+        def calcular_prediccion_lote():
+            # Mismo camino que la acción del admin: 100 predicciones una a una
+            seleccion = rng.choice(ids, 100, replace=False).tolist()
+            for prediccion in Prediccion.objects.select_related('tipo_arbol').filter(pk__in=seleccion):
+                prediccion.calcular_prediccion()
+
+        def puntaje_vectorizado():
+            entradas = datos_sinteticos.muestrear_entradas(10000, comunas, tipos, rng)
+            datos_sinteticos.puntuar_entradas(entradas, tipos, rng)
+
+        def get(url, estado=200, **cabeceras):
+            respuesta = cliente.get(url, **cabeceras)
+            if respuesta.status_code != estado:
+                raise CommandError(f'GET {url} returned {respuesta.status_code}')
+            return respuesta
+
+        etag_stats = []
+
+        def api_dashboard_stats_304():
+            # El ETag se toma en la primera ejecución (la de prueba de medir) y
+            # no al armar los casos: los de cálculo escriben predicciones y lo cambian
+            if not etag_stats:
+                etag_stats.append(get('/api/dashboard/stats/')['ETag'])
+            get('/api/dashboard/stats/', 304, HTTP_IF_NONE_MATCH=etag_stats[0])
+
+        def predicciones_orm_10k():
+            # Camino con objetos del ORM para comparar con api_predicciones:
+            # instancias completas + dict por fila + json estándar
+            filas = []
+            for p in Prediccion.objects.select_related('tipo_arbol', 'comuna', 'region').order_by('id')[:10000]:
+                filas.append({
+                    campo: getattr(p, campo) for campo in lectura_predicciones.CAMPOS_DEFECTO
+                    if campo not in ('tipo_arbol', 'comuna', 'region')
+                } | {'tipo_arbol': p.tipo_arbol.tipo, 'comuna': p.comuna.nombre,
+                     'region': p.region.nombre if p.region else None})
+            json.dumps({'resultados': filas}, cls=DjangoJSONEncoder)
+
+        return {
+            'calcular_prediccion': calcular_prediccion,
+            'calcular_prediccion_lote_100': calcular_prediccion_lote,
+            'puntaje_vectorizado_10k': puntaje_vectorizado,
+            'dashboard': lambda: get('/dashboard/'),
+            'api_dashboard_stats': lambda: get('/api/dashboard/stats/'),
+            'api_dashboard_stats_304': api_dashboard_stats_304,
+            'api_predicciones_10k': lambda: get('/api/predicciones/?limite=10000'),
+            'api_predicciones_10k_4_campos': lambda: get(
+                '/api/predicciones/?limite=10000&fields=id,tipo_arbol,region,roi_proyectado'
+            ),
+            'predicciones_orm_10k': predicciones_orm_10k,
+            'lista_predicciones_primera_pagina': lambda: get('/predicciones/'),
+            'lista_predicciones_pagina_media': lambda: get(f'/predicciones/?page={total_paginas // 2}'),
+            'lista_predicciones_ultima_pagina': lambda: get(f'/predicciones/?page={total_paginas}'),
+            'prediccion_detalle': lambda: get(f'/prediccion/{id_aleatorio()}/'),
+            'analisis_prediccion_detalle': lambda: get(f'/analisis/{id_aleatorio()}/'),
+            'comparacion_predicciones': lambda: get(
+                '/comparacion/?' + '&'.join(f'predicciones={i}' for i in rng.choice(ids, 5, replace=False))
+            ),
+        }
+
+    def medir(self, funcion, repeticiones, calentamiento, max_segundos):
+        tiempos = []
+        consultas = []
+
+        def una_vez():
+            # Se cuentan las ejecuciones directamente: connection.queries está
+            # acotado a 9000 entradas y subestimaría las vistas con N+1
+            contador = [0]
+
+            def contar(execute, sql, params, many, context):
+                contador[0] += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(contar):
+                inicio = time.perf_counter()
+                funcion()
+                duracion = time.perf_counter() - inicio
+            return duracion, contador[0]
+
+        # Una ejecución de prueba decide si el caso cabe en el presupuesto
+        duracion, n_consultas = una_vez()
+        truncado = duracion > max_segundos
+        if truncado:
+            tiempos.append(duracion * 1000)
+            consultas.append(n_consultas)
+        else:
+            for _ in range(max(0, calentamiento - 1)):
+                una_vez()
+            for _ in range(repeticiones):
+                duracion, n_consultas = una_vez()
+                tiempos.append(duracion * 1000)
+                consultas.append(n_consultas)
+
+        tiempos = np.array(tiempos)
+        return {
+            'repeticiones': len(tiempos),
+            'truncado': truncado,
+            'p50_ms': round(float(np.percentile(tiempos, 50)), 3),
+            'p95_ms': round(float(np.percentile(tiempos, 95)), 3),
+            'p99_ms': round(float(np.percentile(tiempos, 99)), 3),
+            'media_ms': round(float(tiempos.mean()), 3),
+            'min_ms': round(float(tiempos.min()), 3),
+            'max_ms': round(float(tiempos.max()), 3),
+            'queries_p50': int(np.median(consultas)),
+            'queries_max': int(max(consultas)),
+        }
+
+    # ------------------------------------------------------------------
+    # Comparación y salida
+    # ------------------------------------------------------------------
+    def comparar(self, actuales, baseline, tolerancia):
+        comparacion = {}
+        regresiones = []
+        for escala, casos in actuales.items():
+            for nombre, medicion in casos.items():
+                base = baseline.get(escala, {}).get(nombre)
+                if not base:
+                    continue
+                ratio = medicion['p50_ms'] / base['p50_ms'] if base['p50_ms'] else None
+                comparacion.setdefault(escala, {})[nombre] = {
+                    'p50_ratio': round(ratio, 3) if ratio else None,
+                    'queries_delta': medicion['queries_max'] - base['queries_max'],
+                }
+                if ratio and ratio > 1 + tolerancia:
+                    regresiones.append(
+                        f'[{escala}] {nombre}: p50 {base["p50_ms"]:.2f}ms -> {medicion["p50_ms"]:.2f}ms ({ratio:.2f}x)'
+                    )
+                if medicion['queries_max'] > base['queries_max']:
+                    regresiones.append(
+                        f'[{escala}] {nombre}: queries {base["queries_max"]} -> {medicion["queries_max"]}'
+                    )
+        return comparacion, regresiones
+
+    def metadata(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'numpy': np.__version__,
+            'plataforma': platform.platform(),
+            'base_de_datos': connection.vendor,
+            'semilla': options['seed'],
+            'repeticiones': options['repeat'],
+        }
+
+    def escribir(self, ruta, informe):
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_text(json.dumps(informe, indent=2, ensure_ascii=False))
+        self.stdout.write(f'Results written to {ruta}')
@@ -0,0 +1,146 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from pathlib import Path
+import datetime
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import numpy as np
+
+DIRECTORIO = Path(settings.BASE_DIR) / 'benchmarks'
+
+# Lo que hace un worker al arrancar: configurar Django y cargar las URLs
+# (que importan las vistas)
+ARRANQUE_WORKER = 'import django; django.setup(); import agropredict.urls'
+
+PATRON_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure startup time in fresh interpreters: worker boot (django.setup + URLconf '
+        'import, with -X importtime breakdown) and "manage.py check". Results are appended '
+        'to a history file and compared against a stored baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes per measurement')
+        parser.add_argument('--top', type=int, default=15, help='Slowest imports to show')
+        parser.add_argument('--baseline', default=str(DIRECTORIO / 'arranque_baseline.json'))
+        parser.add_argument('--history', default=str(DIRECTORIO / 'arranque_historial.jsonl'))
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store these results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed median slowdown vs baseline before flagging a regression')
+
+    def handle(self, *args, **options):
+        entorno = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'agropredict.settings')}
+        worker, importaciones = [], []
+        for _ in range(options['runs']):
+            inicio = time.perf_counter()
+            proceso = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', ARRANQUE_WORKER],
+                cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True,
+            )
+            worker.append((time.perf_counter() - inicio) * 1000)
+            if proceso.returncode != 0:
+                raise CommandError(f'Worker boot failed:\n{proceso.stderr[-2000:]}')
+            importaciones.append(self.parsear(proceso.stderr))
+
+        check = []
+        for _ in range(options['runs']):
+            inicio = time.perf_counter()
+            proceso = subprocess.run(
+                [sys.executable, 'manage.py', 'check'],
+                cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True,
+            )
+            check.append((time.perf_counter() - inicio) * 1000)
+            if proceso.returncode != 0:
+                raise CommandError(f'manage.py check failed:\n{proceso.stderr[-2000:]}')
+
+        # Mediana por paquete entre corridas (tiempo acumulado, ms)
+        modulos = {}
+        for corrida in importaciones:
+            for nombre, acumulado in corrida.items():
+                modulos.setdefault(nombre, []).append(acumulado)
+        lentos = sorted(((n, float(np.median(v))) for n, v in modulos.items()), key=lambda m: -m[1])
+
+        resultado = {
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': self.commit(),
+            'python': platform.python_version(),
+            'corridas': options['runs'],
+            'arranque_worker_ms': round(float(np.median(worker)), 1),
+            'manage_check_ms': round(float(np.median(check)), 1),
+            'paquetes_mas_lentos': {n: round(ms, 1) for n, ms in lentos[:options['top']]},
+        }
+
+        self.stdout.write(f'Worker boot (median of {options["runs"]}): {resultado["arranque_worker_ms"]:.1f} ms')
+        self.stdout.write(f'manage.py check (median):   {resultado["manage_check_ms"]:.1f} ms')
+        self.stdout.write('Slowest packages (cumulative import time):')
+        for nombre, ms in lentos[:options['top']]:
+            self.stdout.write(f'  {ms:8.1f} ms  {nombre}')
+
+        historial = Path(options['history'])
+        historial.parent.mkdir(parents=True, exist_ok=True)
+        with historial.open('a', encoding='utf-8') as archivo:
+            archivo.write(json.dumps(resultado, ensure_ascii=False) + '\n')
+        self.stdout.write(f'Appended to {historial}')
+
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+            self.stdout.write(f'Baseline saved to {baseline_path}')
+        elif baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())
+            regresiones = []
+            for clave in ('arranque_worker_ms', 'manage_check_ms'):
+                ratio = resultado[clave] / baseline[clave] if baseline.get(clave) else None
+                if ratio:
+                    self.stdout.write(f'{clave}: {baseline[clave]:.1f} -> {resultado[clave]:.1f} ms ({ratio:.2f}x)')
+                if ratio and ratio > 1 + options['tolerance']:
+                    regresiones.append(f'{clave}: {baseline[clave]:.1f} -> {resultado[clave]:.1f} ms ({ratio:.2f}x)')
+            if regresiones:
+                for r in regresiones:
+                    self.stdout.write(self.style.ERROR(r))
+                raise CommandError(f'{len(regresiones)} startup regression(s) against baseline')
+        self.stdout.write(self.style.SUCCESS('Startup benchmark completed'))
+
+    def parsear(self, salida):
+        """
+        Tiempo acumulado (ms) por paquete raíz en la salida de -X importtime.
+
+        Se suma cada import de un paquete hecho desde fuera de él (desde otro
+        paquete o desde el primer nivel), de modo que openai, pandas o numpy
+        aparecen con su costo total aunque los importe otro módulo.
+        """
+        lineas = []
+        for linea in salida.splitlines():
+            coincidencia = PATRON_IMPORTTIME.match(linea)
+            if coincidencia:
+                nivel = (len(coincidencia.group(3)) - 1) // 2
+                lineas.append((nivel, coincidencia.group(4).split('.')[0], int(coincidencia.group(2)) / 1000))
+
+        # importtime lista los hijos antes que el padre: al revés queda en preorden
+        paquetes = {}
+        pila = []
+        for nivel, raiz, acumulado in reversed(lineas):
+            while pila and pila[-1][0] >= nivel:
+                pila.pop()
+            if not pila or pila[-1][1] != raiz:
+                paquetes[raiz] = paquetes.get(raiz, 0) + acumulado
+            pila.append((nivel, raiz))
+        return paquetes
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,184 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connection, connections, transaction, OperationalError
+from predicciones.models import Prediccion
+from predicciones.services import datos_sinteticos
+import multiprocessing
+import random
+import tempfile
+import time
+import os
+import numpy as np
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure concurrent write throughput against a throwaway copy of the configured '
+        'database: several worker processes (like gunicorn workers) each create and '
+        'score predictions, one transaction per prediction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8],
+                            help='Concurrent worker processes (one run per value)')
+        parser.add_argument('--writes', type=int, default=200, help='Predictions written by each worker')
+        parser.add_argument('--readers', type=int, default=2,
+                            help='Processes running dashboard/list queries while the writers run')
+        parser.add_argument('--untuned', action='store_true',
+                            help='SQLite only: skip SQLITE_PRAGMAS and use the driver default busy timeout')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('This benchmark needs the fork start method (Linux/macOS)')
+
+        es_sqlite = connection.vendor == 'sqlite'
+        if options['untuned']:
+            if not es_sqlite:
+                raise CommandError('--untuned only applies to SQLite')
+            settings.SQLITE_PRAGMAS = {}
+            connection.settings_dict['OPTIONS'].pop('timeout', None)
+
+        nombre_original = connection.settings_dict['NAME']
+        if es_sqlite:
+            # La base de prueba de SQLite es en memoria por defecto: los
+            # workers necesitan un archivo compartido
+            directorio = tempfile.mkdtemp(prefix='agropredict-bench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(directorio, 'escrituras.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.describir(es_sqlite, options)
+            for workers in options['workers']:
+                self.ejecutar(workers, options)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+    def describir(self, es_sqlite, options):
+        if es_sqlite:
+            with connection.cursor() as cursor:
+                valores = {}
+                for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                    cursor.execute(f'PRAGMA {pragma}')
+                    valores[pragma] = cursor.fetchone()[0]
+            self.stdout.write('SQLite ' + ', '.join(f'{k}={v}' for k, v in valores.items()))
+        else:
+            self.stdout.write(f'{connection.vendor} (CONN_MAX_AGE={connection.settings_dict["CONN_MAX_AGE"]})')
+
+    def ejecutar(self, workers, options):
+        datos_sinteticos.crear_referencias(comunas_por_region=2, semilla=options['seed'])
+        connections.close_all()  # cada proceso hijo abre su propia conexión
+
+        contexto = multiprocessing.get_context('fork')
+        resultados = contexto.Queue()
+        lecturas = contexto.Queue()
+        largada = contexto.Event()
+        fin = contexto.Event()
+        procesos = [
+            contexto.Process(target=escribir, args=(i, options['writes'], options['seed'], largada, resultados))
+            for i in range(workers)
+        ]
+        lectores = [
+            contexto.Process(target=leer, args=(largada, fin, lecturas))
+            for _ in range(options['readers'])
+        ]
+        for proceso in procesos + lectores:
+            proceso.start()
+        inicio = time.perf_counter()
+        largada.set()
+        salidas = [resultados.get() for _ in procesos]
+        duracion = time.perf_counter() - inicio
+        fin.set()
+        salidas_lectura = [lecturas.get() for _ in lectores]
+        for proceso in procesos + lectores:
+            proceso.join()
+        errores = [s['error'] for s in salidas + salidas_lectura if 'error' in s]
+        if errores:
+            raise CommandError(f'Worker failed: {errores[0]}')
+
+        latencias = np.concatenate([s['latencias'] for s in salidas]) * 1000
+        exitosas = len(latencias)
+        bloqueos = sum(s['bloqueos'] for s in salidas)
+        self.stdout.write(
+            f'workers={workers:<3} writes={exitosas:<6} {exitosas / duracion:8.1f} writes/s  '
+            f'p50={np.percentile(latencias, 50):7.1f}ms p95={np.percentile(latencias, 95):7.1f}ms '
+            f'max={latencias.max():8.1f}ms  locked_errors={bloqueos}'
+        )
+        if lectores:
+            self.stdout.write(
+                f'{"":<25}reads={sum(s["lecturas"] for s in salidas_lectura):<6} '
+                f'{sum(s["lecturas"] for s in salidas_lectura) / duracion:8.1f} reads/s   '
+                f'locked_errors={sum(s["bloqueos"] for s in salidas_lectura)}'
+            )
+
+
+def escribir(numero, escrituras, semilla, largada, resultados):
+    """Proceso hijo: crea y calcula `escrituras` predicciones, una transacción cada una."""
+    try:
+        resultados.put(_escribir(numero, escrituras, semilla, largada))
+    except Exception as e:
+        largada.wait()
+        resultados.put({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        connection.close()
+
+
+def _escribir(numero, escrituras, semilla, largada):
+    azar = random.Random(semilla + numero)
+    random.seed(semilla + numero)
+    usuario_id, tipos, comunas = referencias()
+    latencias = []
+    bloqueos = 0
+    largada.wait()
+    for _ in range(escrituras):
+        inicio = time.perf_counter()
+        try:
+            with transaction.atomic():
+                prediccion = Prediccion.objects.create(
+                    usuario_id=usuario_id,
+                    tipo_arbol=azar.choice(tipos),
+                    comuna_id=azar.choice(comunas),
+                    hectareas=round(azar.uniform(1, 20), 1),
+                    edad_arboles=azar.randint(1, 30),
+                    densidad_plantacion=azar.randint(150, 800),
+                    tipo_riego='goteo',
+                    tipo_suelo='franco',
+                    fertilizacion='mixta',
+                )
+                prediccion.calcular_prediccion()
+        except OperationalError:
+            bloqueos += 1
+            continue
+        latencias.append(time.perf_counter() - inicio)
+    return {'latencias': np.array(latencias), 'bloqueos': bloqueos}
+
+
+def leer(largada, fin, resultados):
+    """Proceso lector: consultas del dashboard y de la lista hasta que terminen los escritores."""
+    from django.db.models import Avg, Count
+    try:
+        total = bloqueos = 0
+        largada.wait()
+        while not fin.is_set():
+            try:
+                Prediccion.objects.filter(estado='completada').aggregate(
+                    total=Count('id'), produccion=Avg('produccion_por_hectarea'),
+                )
+                list(Prediccion.objects.select_related('tipo_arbol', 'comuna').order_by('-fecha_creacion')[:10])
+                total += 1
+            except OperationalError:
+                bloqueos += 1
+        resultados.put({'lecturas': total, 'bloqueos': bloqueos})
+    except Exception as e:
+        resultados.put({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        connection.close()
+
+
+def referencias():
+    from django.contrib.auth.models import User
+    from predicciones.models import Comuna, TipoArbol
+    return (
+        User.objects.get(username='anonimo').pk,
+        list(TipoArbol.objects.all()),
+        list(Comuna.objects.values_list('pk', flat=True)),
+    )
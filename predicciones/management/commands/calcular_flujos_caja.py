@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from predicciones.models import Prediccion
+from predicciones.services import flujo_caja
+import time
+
+class Command(BaseCommand):
+    help = 'Calculate NPV, IRR, payback and yearly cash flows for existing predictions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows evaluated per batch')
+        parser.add_argument('--all', action='store_true', help='Include predictions that are not completed')
+
+    def handle(self, *args, **options):
+        queryset = Prediccion.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(estado='completada')
+
+        tasa, anos = flujo_caja.parametros_economicos()
+        self.stdout.write(f'Calculating cash flows (rate {tasa:.2%}, {anos} years)')
+        inicio = time.perf_counter()
+        total = flujo_caja.actualizar_predicciones(queryset, tamano_lote=options['batch_size'])
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} predictions updated in {duracion:.2f}s'
+        ))
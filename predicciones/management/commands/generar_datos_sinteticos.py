@@ -0,0 +1,109 @@
+from django.core.management.base import BaseCommand, CommandError
+from predicciones.models import Prediccion
+from predicciones.services import datos_sinteticos
+import argparse
+import json
+import time
+import numpy as np
+
+
+def parse_weights(valor):
+    """'palto=3,cerezo=2' -> {'palto': 3.0, 'cerezo': 2.0}"""
+    pesos = {}
+    for parte in valor.split(','):
+        clave, _, peso = parte.partition('=')
+        try:
+            pesos[clave.strip()] = float(peso)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'invalid weight "{parte}", expected key=number')
+    return pesos
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate large volumes of synthetic predictions across all regions, communes '
+        'and tree types. Results are computed in bulk and rows are inserted with '
+        'bulk_create in batches, each inside its own transaction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000000, help='Number of predictions to create')
+        parser.add_argument('--batch-size', type=int, default=20000, help='Rows per bulk_create/transaction')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (same seed, same data)')
+        parser.add_argument('--communes-per-region', type=int, default=20,
+                            help='Synthetic communes to create per region if missing')
+        parser.add_argument('--history-days', type=int, default=730,
+                            help='Spread creation dates uniformly over this many past days (0 = now)')
+        parser.add_argument('--tree-types', type=parse_weights, help='Weights, e.g. palto=3,cerezo=2')
+        parser.add_argument('--regions', type=parse_weights, help='Weights by region code, e.g. RM=5,MA=3')
+        parser.add_argument('--irrigation', type=parse_weights, help='Weights, e.g. goteo=6,gravedad=1')
+        parser.add_argument('--soil', type=parse_weights, help='Weights, e.g. franco=2,arenoso=1')
+        parser.add_argument('--fertilization', type=parse_weights, help='Weights, e.g. mixta=2,ninguna=1')
+        parser.add_argument('--status', type=parse_weights, help='Weights, e.g. completada=9,error=1')
+        parser.add_argument('--hectares', type=float, nargs=2, metavar=('MU', 'SIGMA'),
+                            help='Lognormal parameters for hectares')
+        parser.add_argument('--age', type=int, nargs=2, metavar=('MIN', 'MAX'), help='Tree age range in years')
+        parser.add_argument('--density', type=int, nargs=2, metavar=('MIN', 'MAX'),
+                            help='Planting density range (trees/ha)')
+        parser.add_argument('--distributions', help='JSON file overriding any distribution '
+                                                    '(same keys as DISTRIBUCIONES_DEFECTO)')
+
+    def handle(self, *args, **options):
+        if options['count'] <= 0 or options['batch_size'] <= 0:
+            raise CommandError('--count and --batch-size must be positive')
+
+        try:
+            distribuciones = datos_sinteticos.combinar_distribuciones(self.distribuciones(options))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        rng = np.random.default_rng(options['seed'])
+        usuario, comunas, tipos = datos_sinteticos.crear_referencias(
+            comunas_por_region=options['communes_per_region'], semilla=options['seed'],
+        )
+        self.stdout.write(
+            f'Generating {options["count"]} predictions over {len(comunas)} communes '
+            f'and {len(tipos)} tree types (seed {options["seed"]})'
+        )
+
+        inicio = time.perf_counter()
+        try:
+            for creadas in datos_sinteticos.generar_predicciones(
+                options['count'], usuario, comunas, tipos, rng,
+                tamano_lote=options['batch_size'],
+                distribuciones=distribuciones,
+                dias_historia=options['history_days'],
+            ):
+                transcurrido = time.perf_counter() - inicio
+                self.stdout.write(
+                    f'  {creadas:>10} rows  {transcurrido:7.1f}s  {creadas / transcurrido:10.0f} rows/s'
+                )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        total = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {options["count"]} predictions in {total:.1f}s '
+            f'({options["count"] / total:.0f} rows/s). Total in database: {Prediccion.objects.count()}'
+        ))
+
+    def distribuciones(self, options):
+        personalizadas = {}
+        if options['distributions']:
+            try:
+                with open(options['distributions'], encoding='utf-8') as archivo:
+                    personalizadas.update(json.load(archivo))
+            except (OSError, json.JSONDecodeError) as e:
+                raise CommandError(f'Could not read distributions file: {e}')
+
+        for opcion, clave in (('tree_types', 'tipos'), ('regions', 'regiones'), ('irrigation', 'riego'),
+                              ('soil', 'suelo'), ('fertilization', 'fertilizacion'), ('status', 'estado')):
+            if options[opcion]:
+                personalizadas[clave] = options[opcion]
+        if options['hectares']:
+            personalizadas['hectareas'] = dict(zip(('media', 'sigma'), options['hectares']))
+        if options['age']:
+            personalizadas['edad_arboles'] = dict(zip(('min', 'max'), options['age']))
+        if options['density']:
+            personalizadas['densidad_plantacion'] = dict(zip(('min', 'max'), options['density']))
+        return personalizadas
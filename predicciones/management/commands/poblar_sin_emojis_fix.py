@@ -86,9 +86,11 @@ class Command(BaseCommand):
 
         # Create example predictions
         self.stdout.write('+ Creating example predictions')
+        trees = list(TipoArbol.objects.all())
+        communes = list(Comuna.objects.all())
         for i in range(3):
-            tree = TipoArbol.objects.order_by('?').first()
-            commune = Comuna.objects.order_by('?').first()
+            tree = random.choice(trees)
+            commune = random.choice(communes)
             pred = Prediccion(
                 usuario=user,
                 tipo_arbol=tree,
@@ -101,7 +103,7 @@ class Command(BaseCommand):
                 fertilizacion='mixta'
             )
             pred.estado='procesando'
-            pred.save()
+            # calcular_prediccion guarda la instancia
             pred.calcular_prediccion()
             self.stdout.write(f'Prediction created: {pred}')
 
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from predicciones.models import ResumenDiario, ResumenMensual
+from predicciones.services import tendencias
+import datetime
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the daily and monthly trend rollups (ResumenDiario/ResumenMensual) from '
+        'the predictions table. Use it once after migrating and whenever predictions were '
+        'changed outside save()/delete() (raw SQL, QuerySet.update).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=datetime.date.fromisoformat,
+                            help='Only rebuild from this date (YYYY-MM-DD, rounded down to the month)')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        diarios, mensuales = tendencias.reconstruir(options['since'])
+        self.stdout.write(
+            f'Rebuilt {diarios} daily and {mensuales} monthly rows in {time.perf_counter() - inicio:.1f}s '
+            f'(totals: {ResumenDiario.objects.count()} daily, {ResumenMensual.objects.count()} monthly)'
+        )
+        self.stdout.write(self.style.SUCCESS('Trend rollups rebuilt'))
@@ -0,0 +1,78 @@
+# predicciones/middleware.py
+import os
+import time
+from contextlib import ExitStack
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .services import metricas, perfiles
+
+
+class MetricasMiddleware:
+    """
+    Registra latencia, consultas SQL y tiempo en base de datos por vista.
+
+    Las series se etiquetan con el nombre de la URL (no la ruta), así
+    /prediccion/1/ y /prediccion/2/ comparten serie. Si METRICS_ENABLED es
+    False el middleware no se instala y no agrega costo alguno.
+    """
+
+    def __init__(self, get_response):
+        if not metricas.habilitado():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        contador = metricas.ContadorConsultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(contador))
+            response = self.get_response(request)
+        duracion = time.perf_counter() - inicio
+
+        match = getattr(request, 'resolver_match', None)
+        vista = match.view_name if match else 'sin_ruta'
+        metricas.registro.observar(
+            'agropredict_request_duration_seconds',
+            {'vista': vista, 'metodo': request.method, 'estado': response.status_code},
+            duracion,
+        )
+        metricas.registro.observar('agropredict_request_db_queries', {'vista': vista}, contador.consultas)
+        metricas.registro.observar('agropredict_request_db_duration_seconds', {'vista': vista}, contador.segundos)
+        return response
+
+
+class PerfiladorMiddleware:
+    """
+    Perfila con cProfile las requests marcadas (ver services/perfiles.py) y
+    guarda el resultado en logs/perfiles/. Va después de
+    AuthenticationMiddleware para poder reconocer a los usuarios staff.
+    """
+
+    def __init__(self, get_response):
+        if not perfiles.configuracion()['habilitado']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = perfiles.configuracion()
+        motivo = perfiles.motivo_perfilado(request, config)
+        if motivo is None:
+            return self.get_response(request)
+
+        response, perfil, segundos = perfiles.perfilar(lambda: self.get_response(request))
+        if perfil is not None:
+            match = getattr(request, 'resolver_match', None)
+            perfiles.guardar(perfil, {
+                'vista': match.view_name if match else 'sin_ruta',
+                'ruta': request.get_full_path(),
+                'metodo': request.method,
+                'estado': response.status_code,
+                'duracion_ms': segundos * 1000,
+                'motivo': motivo,
+                'pid': os.getpid(),
+                'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+            }, config)
+        return response
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predicciones', '0002_comuna_latitud_comuna_longitud_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prediccion',
+            name='flujos_caja',
+            field=models.JSONField(blank=True, help_text='Flujos netos anuales en CLP (año 0 = inversión)', null=True),
+        ),
+        migrations.AddField(
+            model_name='prediccion',
+            name='periodo_recuperacion',
+            field=models.FloatField(blank=True, help_text='Años para recuperar la inversión (flujos descontados)', null=True),
+        ),
+        migrations.AddField(
+            model_name='prediccion',
+            name='tir',
+            field=models.FloatField(blank=True, help_text='Tasa interna de retorno (%)', null=True),
+        ),
+        migrations.AddField(
+            model_name='prediccion',
+            name='van',
+            field=models.FloatField(blank=True, help_text='Valor actual neto en CLP al horizonte de proyección', null=True),
+        ),
+    ]
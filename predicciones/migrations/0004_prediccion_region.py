@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copiar_regiones(apps, schema_editor):
+    """Completa region con la región de la comuna de cada predicción."""
+    Comuna = apps.get_model('predicciones', 'Comuna')
+    Prediccion = apps.get_model('predicciones', 'Prediccion')
+    db = schema_editor.connection.alias
+    # Una actualización por región (pocas) en lugar de una por fila
+    regiones = {}
+    for comuna_id, region_id in Comuna.objects.using(db).values_list('pk', 'region_id'):
+        regiones.setdefault(region_id, []).append(comuna_id)
+    for region_id, comunas in regiones.items():
+        Prediccion.objects.using(db).filter(comuna_id__in=comunas).update(region_id=region_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predicciones', '0003_flujo_caja_descontado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='prediccion',
+            name='region',
+            field=models.ForeignKey(editable=False, help_text='Región de la comuna (desnormalizada, se mantiene en save())', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='predicciones', to='predicciones.region'),
+        ),
+        migrations.RunPython(copiar_regiones, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='prediccion',
+            index=models.Index(fields=['estado', 'region', 'tipo_arbol'], name='pred_estado_region_tipo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prediccion',
+            index=models.Index(fields=['estado', 'tipo_arbol', 'region'], name='pred_estado_tipo_region_idx'),
+        ),
+    ]
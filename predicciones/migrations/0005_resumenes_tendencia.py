@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predicciones', '0004_prediccion_region'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenMensual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(help_text='Inicio del periodo (día o primer día del mes)')),
+                ('total', models.IntegerField(default=0, help_text='Predicciones creadas en el periodo')),
+                ('completadas', models.IntegerField(default=0)),
+                ('hectareas', models.FloatField(default=0)),
+                ('produccion_total', models.FloatField(default=0, help_text='Toneladas')),
+                ('inversion_total', models.FloatField(default=0, help_text='CLP')),
+                ('consumo_agua_total', models.FloatField(default=0, help_text='m³')),
+                ('region', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='predicciones.region')),
+                ('tipo_arbol', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='predicciones.tipoarbol')),
+            ],
+            options={
+                'verbose_name': 'Resumen Mensual',
+                'verbose_name_plural': 'Resúmenes Mensuales',
+                'ordering': ['fecha'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(help_text='Inicio del periodo (día o primer día del mes)')),
+                ('total', models.IntegerField(default=0, help_text='Predicciones creadas en el periodo')),
+                ('completadas', models.IntegerField(default=0)),
+                ('hectareas', models.FloatField(default=0)),
+                ('produccion_total', models.FloatField(default=0, help_text='Toneladas')),
+                ('inversion_total', models.FloatField(default=0, help_text='CLP')),
+                ('consumo_agua_total', models.FloatField(default=0, help_text='m³')),
+                ('region', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='predicciones.region')),
+                ('tipo_arbol', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='predicciones.tipoarbol')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario',
+                'verbose_name_plural': 'Resúmenes Diarios',
+                'ordering': ['fecha'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='resumenmensual',
+            constraint=models.UniqueConstraint(fields=('fecha', 'tipo_arbol', 'region'), name='resumen_mensual_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumendiario',
+            constraint=models.UniqueConstraint(fields=('fecha', 'tipo_arbol', 'region'), name='resumen_diario_unico'),
+        ),
+    ]
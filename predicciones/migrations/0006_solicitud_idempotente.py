@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predicciones', '0005_resumenes_tendencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolicitudIdempotente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=255, unique=True)),
+                ('ruta', models.CharField(max_length=255)),
+                ('huella', models.CharField(help_text='SHA-256 del cuerpo de la solicitud', max_length=64)),
+                ('estado_http', models.IntegerField(null=True)),
+                ('tipo_contenido', models.CharField(blank=True, max_length=100)),
+                ('contenido', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Solicitud Idempotente',
+                'verbose_name_plural': 'Solicitudes Idempotentes',
+            },
+        ),
+    ]
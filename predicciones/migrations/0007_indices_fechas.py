@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predicciones', '0006_solicitud_idempotente'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prediccion',
+            index=models.Index(fields=['fecha_creacion'], name='pred_fecha_creacion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prediccion',
+            index=models.Index(fields=['estado', 'fecha_creacion'], name='pred_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prediccion',
+            index=models.Index(fields=['fecha_actualizacion'], name='pred_fecha_actualizacion_idx'),
+        ),
+    ]
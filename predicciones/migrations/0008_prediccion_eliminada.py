@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predicciones', '0007_indices_fechas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrediccionEliminada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prediccion_id', models.BigIntegerField()),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Predicción Eliminada',
+                'verbose_name_plural': 'Predicciones Eliminadas',
+            },
+        ),
+    ]
@@ -2,8 +2,8 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 import random
-import requests
 from django.conf import settings
+from .services import flujo_caja, puntaje
 
 class Region(models.Model):
     nombre = models.CharField(max_length=100)
@@ -28,6 +28,15 @@ class Comuna(models.Model):
     def __str__(self):
         return f"{self.nombre}, {self.region.nombre}"
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Si la comuna cambió de región, arrastrar la copia de sus predicciones
+        # (y sus totales en los resúmenes de tendencia)
+        from .services import tendencias
+        afectadas = Prediccion.objects.filter(comuna=self).exclude(region_id=self.region_id)
+        if afectadas.exists():
+            tendencias.cambiar_region(afectadas, self.region_id)
+    
     class Meta:
         verbose_name = "Comuna"
         verbose_name_plural = "Comunas"
@@ -107,9 +116,28 @@ class Prediccion(models.Model):
         ('error', 'Error'),
     ]
     
+    # Consumo de agua por defecto (m³/ha) cuando el tipo no tiene consumo_agua_m3_ton
+    AGUA_BASE_POR_HECTAREA = {
+        'palto': 8000,
+        'naranjo': 6500,
+        'limonero': 6000,
+        'manzano': 4500,
+        'cerezo': 5500,
+        'nogal': 7000,
+        'almendro': 5000,
+        'olivo': 3500,
+        'durazno': 5000,
+        'peral': 4800,
+    }
+    
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='predicciones')
     tipo_arbol = models.ForeignKey(TipoArbol, on_delete=models.CASCADE)
     comuna = models.ForeignKey(Comuna, on_delete=models.CASCADE)
+    # Copia de comuna.region para agregar por región sin unir Comuna y Region
+    region = models.ForeignKey(
+        Region, on_delete=models.CASCADE, null=True, editable=False, related_name='predicciones',
+        help_text="Región de la comuna (desnormalizada, se mantiene en save())"
+    )
     
     # Datos del cultivo
     hectareas = models.FloatField(validators=[MinValueValidator(0.1)])
@@ -159,11 +187,39 @@ class Prediccion(models.Model):
     consumo_agua_total = models.FloatField(null=True, blank=True, help_text="Consumo total de agua en m³")
     consumo_agua_por_hectarea = models.FloatField(null=True, blank=True, help_text="Consumo de agua por hectárea en m³")
     
+    # FLUJO DE CAJA DESCONTADO
+    van = models.FloatField(null=True, blank=True, help_text="Valor actual neto en CLP al horizonte de proyección")
+    tir = models.FloatField(null=True, blank=True, help_text="Tasa interna de retorno (%)")
+    periodo_recuperacion = models.FloatField(null=True, blank=True, help_text="Años para recuperar la inversión (flujos descontados)")
+    flujos_caja = models.JSONField(null=True, blank=True, help_text="Flujos netos anuales en CLP (año 0 = inversión)")
+    
     # Control de estado
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._comuna_guardada = instancia.__dict__.get('comuna_id')
+        return instancia
+    
+    def save(self, *args, **kwargs):
+        """Mantiene `region` igual a la región de la comuna."""
+        if self.comuna_id is not None and (
+            self.region_id is None or self.comuna_id != getattr(self, '_comuna_guardada', None)
+        ):
+            if Prediccion.comuna.is_cached(self) and self.comuna.pk == self.comuna_id:
+                region_id = self.comuna.region_id
+            else:
+                region_id = Comuna.objects.filter(pk=self.comuna_id).values_list('region_id', flat=True).first()
+            if region_id != self.region_id:
+                self.region_id = region_id
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'region'}
+        super().save(*args, **kwargs)
+        self._comuna_guardada = self.comuna_id
+    
     def calcular_prediccion(self):
         """Simula el cálculo de predicción usando factores diversos"""
         # Obtener rendimiento base del tipo de árbol
@@ -189,6 +245,9 @@ class Prediccion(models.Model):
         # NUEVO: Calcular análisis económico
         self._calcular_analisis_economico()
         
+        # Calcular VAN, TIR y periodo de recuperación
+        self._calcular_flujo_caja()
+        
         # Calcular confiabilidad (entre 70% y 95%)
         base_confiabilidad = 85
         variacion = random.uniform(-15, 10)
@@ -204,20 +263,7 @@ class Prediccion(models.Model):
             self.consumo_agua_por_hectarea = self.consumo_agua_total / self.hectareas
         else:
             # Valores por defecto si no hay datos específicos
-            agua_base_por_hectarea = {
-                'palto': 8000,
-                'naranjo': 6500,
-                'limonero': 6000,
-                'manzano': 4500,
-                'cerezo': 5500,
-                'nogal': 7000,
-                'almendro': 5000,
-                'olivo': 3500,
-                'durazno': 5000,
-                'peral': 4800,
-            }
-            
-            self.consumo_agua_por_hectarea = agua_base_por_hectarea.get(self.tipo_arbol.tipo, 5000)
+            self.consumo_agua_por_hectarea = self.AGUA_BASE_POR_HECTAREA.get(self.tipo_arbol.tipo, 5000)
             self.consumo_agua_total = self.consumo_agua_por_hectarea * self.hectareas
     
     def _calcular_analisis_economico(self):
@@ -240,6 +286,21 @@ class Prediccion(models.Model):
                 ganancia_neta = self.ingresos_proyectados_5anos - self.inversion_estimada
                 self.roi_proyectado = (ganancia_neta / self.inversion_estimada) * 100
     
+    def _calcular_flujo_caja(self):
+        """Calcula VAN, TIR y recuperación con flujos descontados"""
+        if not self.tipo_arbol.precio_promedio_ton or not self.produccion_por_hectarea:
+            return
+        
+        resultado = flujo_caja.evaluar(
+            self.produccion_por_hectarea,
+            self.edad_arboles,
+            self.hectareas,
+            self.tipo_arbol.precio_promedio_ton,
+            self.tipo_arbol.costo_plantacion_hectarea,
+            self.tipo_arbol.costo_mantenimiento_anual,
+        )
+        flujo_caja.asignar_resultados(self, resultado)
+    
     def _factor_edad(self):
         """Factor basado en la edad de los árboles"""
         if self.edad_arboles <= 3:
@@ -262,33 +323,15 @@ class Prediccion(models.Model):
     
     def _factor_riego(self):
         """Factor basado en el tipo de riego"""
-        factores = {
-            'goteo': 1.1,
-            'micro_aspersion': 1.05,
-            'aspersion': 0.95,
-            'gravedad': 0.85
-        }
-        return factores.get(self.tipo_riego, 1.0)
+        return puntaje.FACTORES_RIEGO.get(self.tipo_riego, 1.0)
     
     def _factor_suelo(self):
         """Factor basado en el tipo de suelo"""
-        factores = {
-            'franco': 1.1,
-            'arcilloso': 0.95,
-            'limoso': 1.0,
-            'arenoso': 0.9
-        }
-        return factores.get(self.tipo_suelo, 1.0)
+        return puntaje.FACTORES_SUELO.get(self.tipo_suelo, 1.0)
     
     def _factor_fertilizacion(self):
         """Factor basado en el tipo de fertilización"""
-        factores = {
-            'mixta': 1.15,
-            'quimica': 1.05,
-            'organica': 1.0,
-            'ninguna': 0.8
-        }
-        return factores.get(self.fertilizacion, 1.0)
+        return puntaje.FACTORES_FERTILIZACION.get(self.fertilizacion, 1.0)
     
     def _factor_regional(self):
         """Factor basado en la región (simulado)"""
@@ -317,6 +360,17 @@ class Prediccion(models.Model):
         verbose_name = "Predicción"
         verbose_name_plural = "Predicciones"
         ordering = ['-fecha_creacion']
+        indexes = [
+            # Agregados del dashboard, detalle y análisis (filtran por estado
+            # y agrupan por región o por tipo de árbol)
+            models.Index(fields=['estado', 'region', 'tipo_arbol'], name='pred_estado_region_tipo_idx'),
+            models.Index(fields=['estado', 'tipo_arbol', 'region'], name='pred_estado_tipo_region_idx'),
+            # Listados por fecha (recientes del dashboard, lista, selector de comparación)
+            models.Index(fields=['fecha_creacion'], name='pred_fecha_creacion_idx'),
+            models.Index(fields=['estado', 'fecha_creacion'], name='pred_estado_fecha_idx'),
+            # Cambios desde la última marca (services/instantanea)
+            models.Index(fields=['fecha_actualizacion'], name='pred_fecha_actualizacion_idx'),
+        ]
 
 # NUEVO MODELO PARA DATOS CLIMÁTICOS
 class DatoClimatico(models.Model):
@@ -352,4 +406,68 @@ class AnalisisPrediccion(models.Model):
     
     class Meta:
         verbose_name = "Análisis de Predicción"
-        verbose_name_plural = "Análisis de Predicciones"
\ No newline at end of file
+        verbose_name_plural = "Análisis de Predicciones"
+# RESÚMENES DE TENDENCIA (se mantienen en services/tendencias.py)
+class ResumenTendencia(models.Model):
+    """Totales de las predicciones creadas en un periodo, por tipo de árbol y región."""
+    fecha = models.DateField(help_text="Inicio del periodo (día o primer día del mes)")
+    tipo_arbol = models.ForeignKey(TipoArbol, on_delete=models.CASCADE)
+    region = models.ForeignKey(Region, on_delete=models.CASCADE, null=True)
+    
+    total = models.IntegerField(default=0, help_text="Predicciones creadas en el periodo")
+    completadas = models.IntegerField(default=0)
+    # Sumas sobre las predicciones completadas
+    hectareas = models.FloatField(default=0)
+    produccion_total = models.FloatField(default=0, help_text="Toneladas")
+    inversion_total = models.FloatField(default=0, help_text="CLP")
+    consumo_agua_total = models.FloatField(default=0, help_text="m³")
+    
+    class Meta:
+        abstract = True
+        ordering = ['fecha']
+
+class ResumenDiario(ResumenTendencia):
+    class Meta(ResumenTendencia.Meta):
+        verbose_name = "Resumen Diario"
+        verbose_name_plural = "Resúmenes Diarios"
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'tipo_arbol', 'region'], name='resumen_diario_unico'),
+        ]
+
+class ResumenMensual(ResumenTendencia):
+    class Meta(ResumenTendencia.Meta):
+        verbose_name = "Resumen Mensual"
+        verbose_name_plural = "Resúmenes Mensuales"
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'tipo_arbol', 'region'], name='resumen_mensual_unico'),
+        ]
+
+# RESPUESTAS GUARDADAS PARA REINTENTOS (cabecera Idempotency-Key)
+class SolicitudIdempotente(models.Model):
+    clave = models.CharField(max_length=255, unique=True)
+    ruta = models.CharField(max_length=255)
+    huella = models.CharField(max_length=64, help_text="SHA-256 del cuerpo de la solicitud")
+    estado_http = models.IntegerField(null=True)
+    tipo_contenido = models.CharField(max_length=100, blank=True)
+    contenido = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.clave} ({self.ruta})"
+    
+    class Meta:
+        verbose_name = "Solicitud Idempotente"
+        verbose_name_plural = "Solicitudes Idempotentes"
+
+# PREDICCIONES BORRADAS (los borrados no dejan fecha_actualizacion: la copia en
+# memoria y el ETag del dashboard los siguen por el id de este registro)
+class PrediccionEliminada(models.Model):
+    prediccion_id = models.BigIntegerField()
+    fecha = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Predicción #{self.prediccion_id}"
+    
+    class Meta:
+        verbose_name = "Predicción Eliminada"
+        verbose_name_plural = "Predicciones Eliminadas"
@@ -0,0 +1,91 @@
+# predicciones/routers.py
+"""
+Réplica de lectura para las vistas analíticas.
+
+Las vistas decoradas con `usar_replica` leen desde settings.DATABASE_REPLICA_ALIAS;
+todo lo demás (y todas las escrituras) va a 'default'. Tras un POST u otra
+petición de escritura, ReplicaStickyMiddleware deja una cookie de corta
+duración y mientras esté vigente el mismo navegador vuelve a leer del
+primario, para ver sus propios cambios aunque la réplica tenga retraso.
+"""
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+COOKIE_ESCRITURA = 'agropredict_escritura'
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_alias_lectura = ContextVar('alias_lectura', default=None)
+
+
+def alias_replica():
+    """Alias de la réplica o None si no hay una configurada."""
+    alias = getattr(settings, 'DATABASE_REPLICA_ALIAS', None)
+    return alias if alias in settings.DATABASES else None
+
+
+def ventana_pegajosa():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+
+def escritura_reciente(request):
+    try:
+        marca = float(request.COOKIES.get(COOKIE_ESCRITURA, ''))
+    except ValueError:
+        return False
+    return time.time() - marca < ventana_pegajosa()
+
+
+def usar_replica(vista):
+    """Las consultas de la vista (incluido el render) leen de la réplica."""
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        alias = alias_replica()
+        if alias is None or escritura_reciente(request):
+            return vista(request, *args, **kwargs)
+        token = _alias_lectura.set(alias)
+        try:
+            return vista(request, *args, **kwargs)
+        finally:
+            _alias_lectura.reset(token)
+
+    return envoltura
+
+
+class RouterReplica:
+    """Lecturas a la réplica solo dentro de `usar_replica`; escrituras siempre al primario."""
+
+    def db_for_read(self, model, **hints):
+        return _alias_lectura.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primario y réplica contienen los mismos datos
+        alias = {'default', alias_replica()}
+        if obj1._state.db in alias and obj2._state.db in alias:
+            return True
+        return None
+
+
+class ReplicaStickyMiddleware:
+    """Marca con una cookie a los clientes que acaban de escribir."""
+
+    def __init__(self, get_response):
+        if alias_replica() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in METODOS_SEGUROS and response.status_code < 400:
+            response.set_cookie(
+                COOKIE_ESCRITURA, f'{time.time():.3f}',
+                max_age=ventana_pegajosa(), httponly=True, samesite='Lax',
+            )
+        return response
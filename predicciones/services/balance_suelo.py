@@ -0,0 +1,274 @@
+# predicciones/services/balance_suelo.py
+"""
+Balance hídrico diario del suelo (modelo de balde, FAO-56) para muchas
+parcelas a la vez.
+
+Cada parcela es un balde con el agua aprovechable de la zona de raíces
+(`capacidad`, mm). Cada día:
+
+1. De la lluvia y el riego, lo que supera `infiltracion_max` escurre.
+2. La ETc = Kc x ET0 se reduce con Ks = almacenamiento / ((1 - p) x
+   capacidad) cuando el agotamiento supera la fracción p (`agotamiento`)
+   de la capacidad; esos son los días con déficit.
+3. Lo que rebalsa la capacidad percola en profundidad.
+
+El bucle recorre los días y cada paso opera sobre todas las parcelas con
+NumPy, así una temporada de 10 mil parcelas son unas pocas centenas de
+operaciones vectorizadas.
+
+Las series diarias pueden venir de la solicitud o de DatoClimatico
+(`serie_comuna`): el modelo no guarda lluvia ni ET0, así que la ET0 se
+estima con Hargreaves desde la temperatura media diaria observada
+(interpolada entre observaciones) y la lluvia es cero salvo que se entregue.
+"""
+import datetime
+
+import numpy as np
+from django.db.models import Avg
+from django.db.models.functions import TruncDate
+
+from ..models import DatoClimatico
+from .demanda_hidrica import CURVA_PLANA, CURVAS_KC, ET0_MENSUAL
+
+MAX_DIAS = 366
+MAX_PARCELAS = 20000
+# El almacenamiento de cada día (`diario`) solo se devuelve hasta este número de parcelas
+MAX_PARCELAS_DIARIO = 200
+
+AGOTAMIENTO_DEFECTO = 0.5
+PROFUNDIDAD_RAICES_M = 1.0
+# Agua aprovechable (mm por metro de suelo) e infiltración máxima diaria (mm) por tipo de suelo
+AGUA_APROVECHABLE_MM_M = {'arenoso': 70, 'franco': 150, 'limoso': 180, 'arcilloso': 170}
+INFILTRACION_MAX_MM = {'arenoso': 250, 'franco': 120, 'limoso': 80, 'arcilloso': 40}
+
+# Hargreaves: sin temperaturas máxima y mínima se supone esta amplitud diaria (°C)
+AMPLITUD_TERMICA = 12.0
+
+
+def kc_diario(tipos, inicio, dias):
+    """Matriz (parcelas, dias) de Kc según la curva mensual de la especie de cada parcela."""
+    unicos, inversa = np.unique(np.asarray(tipos, dtype=str), return_inverse=True)
+    meses = np.array(
+        [(inicio + datetime.timedelta(days=d)).month - 1 for d in range(dias)], dtype=np.int64
+    )
+    tabla = np.array([CURVAS_KC.get(t, CURVA_PLANA) for t in unicos.tolist()], dtype=np.float32)
+    return tabla[:, meses][inversa]
+
+
+def radiacion_extraterrestre(latitud, dias_del_anio):
+    """Ra (mm/día equivalentes) para una latitud en grados (FAO-56, ec. 21)."""
+    fi = np.radians(latitud)
+    angulo = 2 * np.pi * np.asarray(dias_del_anio) / 365
+    dr = 1 + 0.033 * np.cos(angulo)
+    declinacion = 0.409 * np.sin(angulo - 1.39)
+    ws = np.arccos(np.clip(-np.tan(fi) * np.tan(declinacion), -1, 1))
+    ra = 24 * 60 / np.pi * 0.0820 * dr * (
+        ws * np.sin(fi) * np.sin(declinacion) + np.cos(fi) * np.cos(declinacion) * np.sin(ws)
+    )
+    return 0.408 * ra
+
+
+def hargreaves(temperatura, latitud, fechas, amplitud=AMPLITUD_TERMICA):
+    """ET0 diaria (mm) desde la temperatura media (°C)."""
+    ra = radiacion_extraterrestre(latitud, [f.timetuple().tm_yday for f in fechas])
+    return np.maximum(0.0023 * ra * (np.asarray(temperatura) + 17.8) * np.sqrt(amplitud), 0)
+
+
+def et0_climatologica(inicio, dias):
+    """ET0 diaria desde la referencia mensual (mm/mes repartidos en los días del mes)."""
+    fechas = [inicio + datetime.timedelta(days=d) for d in range(dias)]
+    dias_mes = np.array([
+        ((f.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)).day
+        for f in fechas
+    ])
+    return ET0_MENSUAL[[f.month - 1 for f in fechas]] / dias_mes
+
+
+def serie_comuna(comuna, inicio, dias):
+    """
+    Serie diaria de ET0 para `comuna` desde sus observaciones en
+    DatoClimatico: {'et0', 'lluvia', 'dias_observados'}. Sin observaciones
+    en el período se usa la ET0 de referencia mensual.
+    """
+    latitud = comuna.latitud if comuna.latitud is not None else comuna.region.latitud
+    fin = inicio + datetime.timedelta(days=dias)
+    observadas = list(
+        DatoClimatico.objects
+        .filter(comuna=comuna)
+        .annotate(dia=TruncDate('fecha'))
+        .filter(dia__gte=inicio, dia__lt=fin)
+        .values('dia').annotate(temperatura=Avg('temperatura_actual')).order_by('dia')
+        .values_list('dia', 'temperatura')
+    )
+    if not observadas or latitud is None:
+        et0 = et0_climatologica(inicio, dias)
+    else:
+        posiciones = [(dia - inicio).days for dia, _ in observadas]
+        temperatura = np.interp(np.arange(dias), posiciones, [t for _, t in observadas])
+        fechas = [inicio + datetime.timedelta(days=d) for d in range(dias)]
+        et0 = hargreaves(temperatura, latitud, fechas)
+    return {'et0': et0, 'lluvia': np.zeros(dias), 'dias_observados': len(observadas)}
+
+
+class Balde:
+    """Estado del suelo de muchas parcelas; `paso` avanza un día."""
+
+    def __init__(self, capacidad, agotamiento=AGOTAMIENTO_DEFECTO, infiltracion_max=np.inf, inicial=1.0):
+        self.capacidad = np.asarray(capacidad, dtype=float)
+        self.infiltracion_max = np.broadcast_to(np.asarray(infiltracion_max, dtype=float), self.capacidad.shape)
+        # Bajo este almacenamiento la planta reduce su transpiración
+        self.umbral = (1 - np.asarray(agotamiento, dtype=float)) * self.capacidad
+        self.almacenamiento = np.asarray(inicial, dtype=float) * self.capacidad
+
+    @property
+    def agotamiento(self):
+        """Lámina (mm) que falta para llenar el balde."""
+        return self.capacidad - self.almacenamiento
+
+    def paso(self, etc, entrada):
+        """
+        Un día con ETc potencial y entrada (lluvia + riego) en mm por
+        parcela; devuelve (etc_real, escorrentia, percolacion, con_deficit).
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ks = np.where(self.umbral > 0, np.minimum(self.almacenamiento / self.umbral, 1.0), 1.0)
+        infiltrada = np.minimum(entrada, self.infiltracion_max)
+        etc_real = np.minimum(ks * etc, self.almacenamiento + infiltrada)
+        almacenamiento = self.almacenamiento + infiltrada - etc_real
+        percolacion = np.maximum(almacenamiento - self.capacidad, 0)
+        self.almacenamiento = almacenamiento - percolacion
+        return etc_real, entrada - infiltrada, percolacion, ks < 1
+
+
+def _por_dia(valor, parcelas, dias, nombre):
+    """
+    Serie común (dias,) o por parcela (parcelas, dias) como (dias, 1) o
+    (dias, parcelas); con `dias` None se toma el largo de la serie.
+    """
+    try:
+        serie = np.asarray(valor, dtype=float)
+    except (TypeError, ValueError):
+        raise ValueError(f"Valores inválidos en '{nombre}'.")
+    if serie.ndim == 0:
+        serie = np.broadcast_to(serie, (dias or 0,))
+    dias = serie.shape[-1] if dias is None else dias
+    if serie.shape == (dias,):
+        return serie[:, None]
+    if serie.shape == (parcelas, dias):
+        return np.ascontiguousarray(serie.T)
+    raise ValueError(f"'{nombre}' debe tener {dias} valores o una lista de {dias} por parcela.")
+
+
+def simular(et0, kc, capacidad, lluvia=0, riego=0, agotamiento=AGOTAMIENTO_DEFECTO,
+            infiltracion_max=np.inf, inicial=1.0, diario=False):
+    """
+    Simula la temporada completa de todas las parcelas.
+
+    `et0`, `lluvia` y `riego` son series diarias (mm) comunes o por parcela;
+    `kc` es un valor por parcela o una matriz (parcelas, dias). Devuelve
+    columnas por parcela: etc_potencial, etc_real, deficit (mm),
+    escorrentia, percolacion, almacenamiento_final (mm) y dias_deficit; con
+    `diario`, además el almacenamiento de cada día (parcelas, dias).
+    """
+    capacidad = np.atleast_1d(np.asarray(capacidad, dtype=float))
+    parcelas = len(capacidad)
+    et0 = _por_dia(et0, parcelas, None, 'et0')
+    dias = len(et0)
+    if not 1 <= dias <= MAX_DIAS:
+        raise ValueError(f"La serie debe tener entre 1 y {MAX_DIAS} días.")
+    if np.any(capacidad <= 0):
+        raise ValueError("La capacidad de agua aprovechable debe ser positiva.")
+    lluvia = _por_dia(lluvia, parcelas, dias, 'lluvia')
+    riego = _por_dia(riego, parcelas, dias, 'riego')
+    kc = np.asarray(kc)
+    kc = np.broadcast_to(np.atleast_1d(kc)[:, None], (parcelas, dias)).T if kc.ndim <= 1 \
+        else np.ascontiguousarray(kc.T)
+
+    balde = Balde(capacidad, agotamiento, infiltracion_max, inicial)
+    totales = {c: np.zeros(parcelas) for c in ('etc_potencial', 'etc_real', 'escorrentia', 'percolacion')}
+    dias_deficit = np.zeros(parcelas, dtype=np.int64)
+    almacenamiento = np.empty((dias, parcelas), dtype=np.float32) if diario else None
+    for d in range(dias):
+        etc = kc[d] * et0[d]
+        etc_real, escorrentia, percolacion, con_deficit = balde.paso(etc, lluvia[d] + riego[d])
+        totales['etc_potencial'] += etc
+        totales['etc_real'] += etc_real
+        totales['escorrentia'] += escorrentia
+        totales['percolacion'] += percolacion
+        dias_deficit += con_deficit
+        if diario:
+            almacenamiento[d] = balde.almacenamiento
+
+    resultado = {c: np.round(v, 1) for c, v in totales.items()}
+    resultado['deficit'] = np.round(totales['etc_potencial'] - totales['etc_real'], 1)
+    resultado['almacenamiento_final'] = np.round(balde.almacenamiento, 1)
+    resultado['dias_deficit'] = dias_deficit
+    if diario:
+        resultado['almacenamiento'] = np.round(almacenamiento.T, 1)
+    return resultado
+
+
+def leer_parcelas(datos, dias, inicio, adicionales=None):
+    """
+    Parámetros por parcela de la solicitud (columnas o escalares):
+    kc o tipo_arbol, capacidad_mm o tipo_suelo (con profundidad_raices_m),
+    agotamiento, infiltracion_max e inicial. `adicionales` ({campo: float o
+    str}) lee otras columnas con el mismo largo, que se devuelven con su
+    nombre (None si faltan). Lanza ValueError si no son válidos.
+    """
+    campos = dict.fromkeys(
+        ('kc', 'capacidad_mm', 'profundidad_raices_m', 'agotamiento', 'infiltracion_max', 'inicial'), float,
+    )
+    campos.update(tipo_arbol=str, tipo_suelo=str, **(adicionales or {}))
+    columnas = {}
+    for campo, tipo in campos.items():
+        if datos.get(campo) is not None:
+            try:
+                columnas[campo] = np.asarray(datos[campo], dtype=tipo)
+            except (TypeError, ValueError):
+                raise ValueError(f"Valores inválidos en '{campo}'.")
+    if any(v.ndim > 1 for v in columnas.values()):
+        raise ValueError("Los parámetros de parcela deben ser escalares o listas.")
+    if 'kc' not in columnas and 'tipo_arbol' not in columnas:
+        raise ValueError("Indique 'kc' o 'tipo_arbol'.")
+    if 'capacidad_mm' not in columnas and 'tipo_suelo' not in columnas:
+        raise ValueError("Indique 'capacidad_mm' o 'tipo_suelo'.")
+    try:
+        forma = np.broadcast_shapes(*(v.shape for v in columnas.values()))
+    except ValueError:
+        raise ValueError("Todas las listas deben tener el mismo largo.")
+    parcelas = forma[0] if forma else 1
+    if parcelas > MAX_PARCELAS:
+        raise ValueError(f"Máximo {MAX_PARCELAS} parcelas por solicitud.")
+    columnas = {k: np.broadcast_to(v, (parcelas,)) for k, v in columnas.items()}
+
+    suelos = columnas.get('tipo_suelo')
+    if suelos is not None:
+        desconocidos = set(suelos.tolist()) - set(AGUA_APROVECHABLE_MM_M)
+        if desconocidos:
+            raise ValueError(f"Tipos de suelo desconocidos: {', '.join(sorted(desconocidos))}")
+    if 'capacidad_mm' in columnas:
+        capacidad = columnas['capacidad_mm']
+    else:
+        profundidad = columnas.get('profundidad_raices_m', PROFUNDIDAD_RAICES_M)
+        capacidad = np.array([AGUA_APROVECHABLE_MM_M[s] for s in suelos.tolist()]) * profundidad
+    if 'infiltracion_max' in columnas:
+        infiltracion_max = columnas['infiltracion_max']
+    elif suelos is not None:
+        infiltracion_max = np.array([INFILTRACION_MAX_MM[s] for s in suelos.tolist()], dtype=float)
+    else:
+        infiltracion_max = np.inf
+
+    agotamiento = columnas.get('agotamiento', AGOTAMIENTO_DEFECTO)
+    inicial = columnas.get('inicial', 1.0)
+    if np.any((np.asarray(agotamiento) < 0) | (np.asarray(agotamiento) >= 1)):
+        raise ValueError("'agotamiento' debe estar entre 0 y 1 (sin incluir el 1).")
+    if np.any((np.asarray(inicial) < 0) | (np.asarray(inicial) > 1)):
+        raise ValueError("'inicial' (fracción llena al comenzar) debe estar entre 0 y 1.")
+    kc = columnas['kc'] if 'kc' in columnas else kc_diario(columnas['tipo_arbol'], inicio, dias)
+    parametros = {
+        'kc': kc, 'capacidad': capacidad, 'agotamiento': agotamiento,
+        'infiltracion_max': infiltracion_max, 'inicial': inicial,
+    }
+    parametros.update({campo: columnas.get(campo) for campo in adicionales or ()})
+    return parametros
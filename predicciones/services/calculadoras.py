@@ -0,0 +1,239 @@
+# predicciones/services/calculadoras.py
+"""
+Fórmulas de las calculadoras agrícolas como funciones puras.
+
+Cada función acepta escalares o arreglos (listas / ndarray) y opera de forma
+vectorizada con NumPy, de modo que la misma lógica sirve para el formulario
+HTML (un solo valor) y para las APIs por lote (miles de parcelas).
+Los resultados se devuelven como diccionarios de columnas (ndarray).
+"""
+import numpy as np
+
+# Coeficientes de extracción (kg por tonelada de rendimiento)
+COEF_EXTRACCION = {'N': 3.5, 'P2O5': 1.5, 'K2O': 5.5}
+# Conversión ppm -> kg/ha (capa de 30 cm, densidad aparente 1.3)
+FACTOR_SUELO = 3900 / 1000000
+# 1 mm de lámina = 10 m³/ha
+M3_HA_POR_MM = 10
+
+FORMULA_NPK_DEFECTO = '15-15-15'
+
+
+def _arreglo(valor, dtype=float):
+    return np.asarray(valor, dtype=dtype)
+
+
+def parsear_formula_npk(formula):
+    """Convierte fórmulas 'N-P-K' (una o muchas) en fracciones N, P y K."""
+    formulas = np.asarray(formula, dtype=object)
+    unicas, inversa = np.unique(formulas.astype(str), return_inverse=True)
+    tabla = np.empty((len(unicas), 3))
+    for i, texto in enumerate(unicas):
+        partes = texto.split('-')
+        if len(partes) != 3:
+            raise ValueError(f"Fórmula NPK inválida: '{texto}'")
+        tabla[i] = [float(p) / 100 for p in partes]
+    fracciones = tabla[inversa.reshape(formulas.shape)]
+    return fracciones[..., 0], fracciones[..., 1], fracciones[..., 2]
+
+
+def _dosis_por_nutriente(requerido, fraccion):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(fraccion > 0, requerido / np.where(fraccion > 0, fraccion, 1), 0.0)
+
+
+def fertilizacion(rendimiento_esperado, nitrogeno_suelo=0, fosforo_suelo=0,
+                  potasio_suelo=0, superficie=1, formula_npk=FORMULA_NPK_DEFECTO):
+    """Dosis de fertilizante NPK por hectárea y total (kg)."""
+    rendimiento = _arreglo(rendimiento_esperado)
+    n_fert, p_fert, k_fert = parsear_formula_npk(formula_npk)
+
+    req_n = np.maximum(0, rendimiento * COEF_EXTRACCION['N'] - _arreglo(nitrogeno_suelo) * FACTOR_SUELO)
+    req_p = np.maximum(0, rendimiento * COEF_EXTRACCION['P2O5'] - _arreglo(fosforo_suelo) * FACTOR_SUELO * 0.8)
+    req_k = np.maximum(0, rendimiento * COEF_EXTRACCION['K2O'] - _arreglo(potasio_suelo) * FACTOR_SUELO * 0.9)
+
+    dosis = np.maximum.reduce([
+        _dosis_por_nutriente(req_n, n_fert),
+        _dosis_por_nutriente(req_p, p_fert),
+        _dosis_por_nutriente(req_k, k_fert),
+    ])
+    return {
+        'dosis_npk_ha': np.round(dosis, 1),
+        'dosis_total': np.round(dosis * _arreglo(superficie), 1),
+    }
+
+
+def agua(et0, kc=1, eficiencia=0.7, frecuencia=7):
+    """Lámina diaria, lámina por evento (mm) y volumen por evento (m³/ha)."""
+    lamina_diaria = _arreglo(et0) * _arreglo(kc)
+    lamina_evento = lamina_diaria * _arreglo(frecuencia) / _arreglo(eficiencia)
+    return {
+        'lamina_diaria': np.round(lamina_diaria, 1),
+        'lamina_evento': np.round(lamina_evento, 1),
+        'volumen_evento': np.round(lamina_evento * M3_HA_POR_MM, 1),
+    }
+
+
+def roi(inversion, beneficio_anual):
+    """ROI simple (%) y payback (años). Payback es NaN si no hay beneficio."""
+    inversion = _arreglo(inversion)
+    beneficio = _arreglo(beneficio_anual)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi_pct = np.where(inversion > 0, beneficio / inversion * 100, 0.0)
+        payback = np.where(beneficio > 0, inversion / beneficio, np.nan)
+    return {
+        'roi': np.round(roi_pct, 1),
+        'payback': np.round(payback, 1),
+    }
+
+
+def siembra(densidad_planta=3000, supervivencia=0.9):
+    """Plantas necesarias considerando la tasa de supervivencia."""
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        plantas = np.rint(_arreglo(densidad_planta) / _arreglo(supervivencia))
+    # Fuera de este rango la conversión a enteros no está definida
+    if not np.all(np.isfinite(plantas) & (np.abs(plantas) < 2 ** 63)):
+        raise ValueError("La densidad y la supervivencia no dan un número de plantas válido")
+    return {'plantas_necesarias': plantas.astype(np.int64)}
+
+
+def balance_hidrico(precipitacion=0, etc=0, infiltracion=0):
+    """Balance simple precipitación - ETc - infiltración (mm)."""
+    balance = _arreglo(precipitacion) - _arreglo(etc) - _arreglo(infiltracion)
+    return {'balance': np.round(balance, 1)}
+
+
+# Parámetros aceptados por cada calculadora: nombre -> (valor por defecto, tipo)
+PARAMETROS = {
+    'fertilizacion': {
+        'rendimiento_esperado': (0, float),
+        'nitrogeno_suelo': (0, float),
+        'fosforo_suelo': (0, float),
+        'potasio_suelo': (0, float),
+        'superficie': (1, float),
+        'formula_npk': (FORMULA_NPK_DEFECTO, str),
+    },
+    'agua': {
+        'et0': (0, float),
+        'kc': (1, float),
+        'eficiencia': (0.7, float),
+        'frecuencia': (7, int),
+    },
+    'roi': {
+        'inversion': (0, float),
+        'beneficio_anual': (0, float),
+    },
+    'siembra': {
+        'densidad_planta': (3000, float),
+        'supervivencia': (0.9, float),
+    },
+    'balance_hidrico': {
+        'precipitacion': (0, float),
+        'etc': (0, float),
+        'infiltracion': (0, float),
+    },
+}
+
+# Rango válido de los parámetros numéricos: (mínimo, máximo, mínimo incluido).
+# None es sin límite; los parámetros sin rango solo deben ser finitos.
+RANGOS = {
+    'rendimiento_esperado': (0, None, True),
+    'nitrogeno_suelo': (0, None, True),
+    'fosforo_suelo': (0, None, True),
+    'potasio_suelo': (0, None, True),
+    'superficie': (0, None, True),
+    'et0': (0, None, True),
+    'kc': (0, None, True),
+    'eficiencia': (0, 1, False),
+    'frecuencia': (1, None, True),
+    'densidad_planta': (0, None, False),
+    'supervivencia': (0, 1, False),
+    'precipitacion': (0, None, True),
+    'etc': (0, None, True),
+    'infiltracion': (0, None, True),
+}
+
+CALCULADORAS = {
+    'fertilizacion': fertilizacion,
+    'agua': agua,
+    'roi': roi,
+    'siembra': siembra,
+    'balance_hidrico': balance_hidrico,
+}
+
+
+def calcular_lote(nombre, columnas, max_filas=None):
+    """
+    Ejecuta la calculadora `nombre` sobre un diccionario de columnas.
+
+    Cada columna puede ser una lista o un escalar (que se repite en todas
+    las filas). Devuelve (n_filas, resultados) con resultados en columnas.
+    Lanza ValueError si hay columnas de largo distinto o valores inválidos.
+    """
+    parametros = PARAMETROS[nombre]
+    desconocidos = set(columnas) - set(parametros)
+    if desconocidos:
+        raise ValueError(f"Parámetros desconocidos: {', '.join(sorted(desconocidos))}")
+
+    argumentos = {}
+    for campo, (defecto, tipo) in parametros.items():
+        valor = columnas.get(campo, defecto)
+        try:
+            argumentos[campo] = np.asarray(valor, dtype=object if tipo is str else tipo)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Valores inválidos en '{campo}'")
+        if argumentos[campo].ndim > 1:
+            raise ValueError(f"'{campo}' debe ser un escalar o una lista")
+        if tipo is not str:
+            _validar_rango(campo, argumentos[campo])
+
+    try:
+        forma = np.broadcast_shapes(*(a.shape for a in argumentos.values()))
+    except ValueError:
+        raise ValueError("Todas las listas deben tener el mismo largo")
+    n_filas = forma[0] if forma else 1
+    if max_filas is not None and n_filas > max_filas:
+        raise ValueError(f"Máximo {max_filas} filas por solicitud")
+
+    argumentos = {k: np.broadcast_to(v, (n_filas,)) for k, v in argumentos.items()}
+    # Un desborde en valores extremos queda como infinito (null en a_lista)
+    with np.errstate(over='ignore'):
+        return n_filas, CALCULADORAS[nombre](**argumentos)
+
+
+def fuera_de_rango(campo, valores):
+    """Máscara de los valores no finitos o fuera de RANGOS[campo]."""
+    valores = np.asarray(valores, dtype=float)
+    fuera = ~np.isfinite(valores)
+    minimo, maximo, incluye_minimo = RANGOS.get(campo, (None, None, True))
+    with np.errstate(invalid='ignore'):
+        if minimo is not None:
+            fuera |= valores < minimo if incluye_minimo else valores <= minimo
+        if maximo is not None:
+            fuera |= valores > maximo
+    return fuera
+
+
+def rango_valido(campo):
+    """Descripción del rango de un parámetro ("un número finito mayor que 0 y menor o igual a 1")."""
+    minimo, maximo, incluye_minimo = RANGOS.get(campo, (None, None, True))
+    limites = []
+    if minimo is not None:
+        limites.append(f"mayor o igual a {minimo}" if incluye_minimo else f"mayor que {minimo}")
+    if maximo is not None:
+        limites.append(f"menor o igual a {maximo}")
+    return ' '.join(['un número finito'] + ([' y '.join(limites)] if limites else []))
+
+
+def _validar_rango(campo, valores):
+    """Lanza ValueError si algún valor no es finito o cae fuera de RANGOS[campo]."""
+    if np.any(fuera_de_rango(campo, valores)):
+        raise ValueError(f"'{campo}' debe ser {rango_valido(campo)}")
+
+
+def a_lista(columna):
+    """Convierte una columna NumPy en lista JSON (NaN e infinitos -> None)."""
+    columna = np.asarray(columna)
+    if columna.dtype.kind == 'f':
+        return np.where(np.isfinite(columna), columna, None).tolist()
+    return columna.tolist()
@@ -0,0 +1,171 @@
+# predicciones/services/clima.py
+"""
+Grilla de clima por comuna, completada por interpolación.
+
+Cada comuna con observaciones en DatoClimatico usa la más reciente; las
+demás reciben la media ponderada por el inverso de la distancia (IDW) de
+las VECINOS_IDW comunas observadas más cercanas. Las distancias salen de
+una sola matriz haversine (comunas x estaciones) por actualización.
+
+La grilla se calcula una vez por proceso y se rehace solo si cambian las
+observaciones o las coordenadas, revisándolo como máximo cada
+SNAPSHOT_REFRESH_SECONDS; leerla después no consulta la base.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from ..models import Comuna, DatoClimatico
+from ..routers import alias_replica
+from .geocodificacion import haversine_km
+
+VECINOS_IDW = 6
+POTENCIA_IDW = 2
+
+
+def idw(distancias, valores, vecinos=VECINOS_IDW, potencia=POTENCIA_IDW):
+    """
+    Interpolación por inverso de la distancia.
+
+    `distancias` es (destinos, estaciones) y `valores` (estaciones, variables);
+    devuelve (destinos, variables). Un destino a distancia 0 de una estación
+    toma su valor.
+    """
+    vecinos = min(vecinos, distancias.shape[1])
+    cercanas = np.argpartition(distancias, vecinos - 1, axis=1)[:, :vecinos]
+    d = np.take_along_axis(distancias, cercanas, axis=1)
+    with np.errstate(divide='ignore'):
+        pesos = 1.0 / d ** potencia
+    # Distancia 0: solo cuenta esa estación
+    exactas = d == 0
+    pesos = np.where(exactas.any(axis=1, keepdims=True), exactas.astype(float), pesos)
+    pesos /= pesos.sum(axis=1, keepdims=True)
+    return np.einsum('dk,dkv->dv', pesos, valores[cercanas])
+
+
+class Grilla:
+    """Clima de todas las comunas con coordenadas (inmutable)."""
+
+    def __init__(self, comunas, observaciones):
+        # comunas: [(id, latitud, longitud, nombre)]
+        # observaciones: {comuna_id: (temperatura, humedad, descripcion, icono, fecha)}
+        self.comuna_ids = np.array([c[0] for c in comunas], dtype=np.int64)
+        self.nombres = [c[3] for c in comunas]
+        n = len(comunas)
+        self.temperatura = np.full(n, np.nan)
+        self.humedad = np.full(n, np.nan)
+        self.observada = np.zeros(n, dtype=bool)
+        self.distancia_km = np.full(n, np.nan)  # a la estación más cercana
+        self.observaciones = observaciones
+        self._posicion = {c: i for i, c in enumerate(self.comuna_ids.tolist())}
+
+        estaciones = [i for i, c in enumerate(self.comuna_ids.tolist()) if c in observaciones]
+        if not estaciones or not n:
+            return
+        lat = np.radians(np.array([c[1] for c in comunas], dtype=float))
+        lon = np.radians(np.array([c[2] for c in comunas], dtype=float))
+        ids = self.comuna_ids.tolist()
+        valores = np.array([observaciones[ids[i]][:2] for i in estaciones], dtype=float)
+
+        distancias = haversine_km(lat[:, None], lon[:, None], lat[estaciones], lon[estaciones])
+        interpolados = idw(distancias, valores)
+        self.temperatura, self.humedad = interpolados[:, 0], interpolados[:, 1]
+        self.distancia_km = distancias.min(axis=1)
+        self.observada[estaciones] = True
+        # Las comunas observadas conservan su valor aunque compartan coordenadas con otra
+        self.temperatura[estaciones], self.humedad[estaciones] = valores[:, 0], valores[:, 1]
+        self.distancia_km[estaciones] = 0.0
+
+    def __len__(self):
+        return len(self.comuna_ids)
+
+    def comuna(self, comuna_id):
+        """Clima de una comuna o None si no hay datos para estimarlo."""
+        i = self._posicion.get(comuna_id)
+        if i is None or np.isnan(self.temperatura[i]):
+            return None
+        datos = {
+            'temperatura': round(float(self.temperatura[i]), 1),
+            'humedad': int(round(float(self.humedad[i]))),
+            'observada': bool(self.observada[i]),
+            'distancia_km': round(float(self.distancia_km[i]), 1),
+        }
+        observacion = self.observaciones.get(comuna_id)
+        if observacion is not None:
+            datos.update(descripcion=observacion[2], icono=observacion[3], fecha=observacion[4])
+        return datos
+
+    def columnas(self):
+        """Toda la grilla en columnas (para la API)."""
+        con_datos = ~np.isnan(self.temperatura)
+        return {
+            'comuna_id': self.comuna_ids[con_datos].tolist(),
+            'comuna': [n for n, con in zip(self.nombres, con_datos.tolist()) if con],
+            'temperatura': np.round(self.temperatura[con_datos], 1).tolist(),
+            'humedad': np.round(self.humedad[con_datos]).astype(int).tolist(),
+            'observada': self.observada[con_datos].tolist(),
+            'distancia_km': np.round(self.distancia_km[con_datos], 1).tolist(),
+        }
+
+
+class ClimaInterpolado:
+    """Grilla del proceso, rehecha cuando cambian observaciones o coordenadas."""
+
+    def __init__(self):
+        self.grilla = Grilla([], {})
+        self.version = None
+        self.revisada = None
+        self._candado = threading.Lock()
+
+    def _comunas(self, alias):
+        # Ubicación de la comuna o, si no la tiene, la de su región
+        return list(
+            Comuna.objects.using(alias).annotate(
+                lat=Coalesce('latitud', 'region__latitud'), lon=Coalesce('longitud', 'region__longitud'),
+            ).filter(lat__isnull=False, lon__isnull=False).order_by('id').values_list('id', 'lat', 'lon', 'nombre')
+        )
+
+    def _version(self, alias, comunas):
+        # Las sumas detectan ediciones de filas existentes (no mueven el id)
+        observaciones = DatoClimatico.objects.using(alias).aggregate(
+            ultima=Max('id'), total=Count('id'), temperatura=Sum('temperatura_actual'), humedad=Sum('humedad'),
+        )
+        return tuple(observaciones.values()), hash(tuple(comunas))
+
+    def _construir(self, alias, comunas):
+        ultima = DatoClimatico.objects.using(alias).filter(comuna=OuterRef('comuna')).order_by('-fecha', '-id')
+        recientes = DatoClimatico.objects.using(alias).filter(id=Subquery(ultima.values('id')[:1]))
+        observaciones = {
+            fila[0]: fila[1:] for fila in recientes.values_list(
+                'comuna_id', 'temperatura_actual', 'humedad', 'descripcion_clima', 'icono_clima', 'fecha',
+            )
+        }
+        return Grilla(comunas, observaciones)
+
+    def obtener(self):
+        intervalo = getattr(settings, 'SNAPSHOT_REFRESH_SECONDS', 5)
+        revisada = self.revisada
+        if revisada is not None and time.monotonic() - revisada < intervalo:
+            return self.grilla
+        with self._candado:
+            if self.revisada is None or time.monotonic() - self.revisada >= intervalo:
+                alias = alias_replica() or 'default'
+                comunas = self._comunas(alias)
+                version = self._version(alias, comunas)
+                if version != self.version:
+                    self.grilla = self._construir(alias, comunas)
+                    self.version = version
+                self.revisada = time.monotonic()
+        return self.grilla
+
+
+_clima = ClimaInterpolado()
+
+
+def obtener():
+    """Grilla de clima vigente."""
+    return _clima.obtener()
@@ -0,0 +1,196 @@
+# predicciones/services/csv_parcelas.py
+"""
+Procesamiento por bloques de planillas CSV de parcelas.
+
+Lee el archivo con pandas en bloques de tamaño fijo, calcula para cada bloque
+las dosis de fertilización y los volúmenes de riego con las funciones
+vectorizadas de `calculadoras`, y entrega el CSV enriquecido bloque a bloque.
+La memoria usada depende del tamaño de bloque, no del largo del archivo.
+"""
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+from . import calculadoras
+
+TAMANO_BLOQUE = 20000
+
+# Encabezados alternativos aceptados en la planilla -> nombre interno
+ALIAS_COLUMNAS = {
+    'area': 'superficie',
+    'hectareas': 'superficie',
+    'formula': 'formula_npk',
+    'n_suelo': 'nitrogeno_suelo',
+    'p_suelo': 'fosforo_suelo',
+    'k_suelo': 'potasio_suelo',
+    'rendimiento': 'rendimiento_esperado',
+}
+
+COLUMNAS_ENTRADA = {
+    **calculadoras.PARAMETROS['fertilizacion'],
+    **calculadoras.PARAMETROS['agua'],
+}
+
+# Primera celda de la fila que cierra un resultado incompleto
+MARCA_ERROR = '#ERROR'
+
+PATRON_FORMULA = r'^\s*\d+(?:\.\d+)?-\d+(?:\.\d+)?-\d+(?:\.\d+)?\s*$'
+
+
+class ErrorPlanilla(ValueError):
+    """La planilla no tiene el formato esperado."""
+
+
+def normalizar_encabezado(nombre):
+    nombre = str(nombre).strip().lower()
+    return ALIAS_COLUMNAS.get(nombre, nombre)
+
+
+def _columna_numerica(bloque, campo, defecto, tipo):
+    if campo not in bloque:
+        return np.full(len(bloque), defecto, dtype=float)
+    valores = pd.to_numeric(bloque[campo], errors='coerce')
+    if tipo is int:
+        valores = valores.round()
+    return valores.to_numpy(dtype=float)
+
+
+def _invalidos(parcelas, campo, valores):
+    """Filas con un valor escrito para `campo` que no es número o está fuera de rango."""
+    if campo not in parcelas:
+        return np.zeros(len(parcelas), dtype=bool)
+    escrito = parcelas[campo].fillna('').str.strip().ne('').to_numpy()
+    return escrito & calculadoras.fuera_de_rango(campo, valores)
+
+
+def calcular_bloque(bloque):
+    """
+    Agrega las columnas de resultado a un bloque (DataFrame) de parcelas.
+
+    Las filas con valores inválidos quedan sin el resultado afectado
+    (fertilización o riego) y con el motivo en la columna 'errores'.
+    """
+    parcelas = bloque.rename(columns=normalizar_encabezado)
+    entradas = {}
+    errores = np.full(len(bloque), '', dtype=object)
+    invalida = {'fertilizacion': np.zeros(len(bloque), dtype=bool), 'agua': np.zeros(len(bloque), dtype=bool)}
+    for campo, (defecto, tipo) in COLUMNAS_ENTRADA.items():
+        if tipo is str:
+            continue
+        entradas[campo] = _columna_numerica(parcelas, campo, defecto, tipo)
+        filas = _invalidos(parcelas, campo, entradas[campo])
+        if filas.any():
+            errores[filas] += f"{campo} debe ser {calculadoras.rango_valido(campo)}; "
+            for calculo in invalida:
+                # superficie también multiplica el volumen de riego
+                if campo in calculadoras.PARAMETROS[calculo] or campo == 'superficie':
+                    invalida[calculo] |= filas
+
+    if 'formula_npk' in parcelas:
+        formulas = parcelas['formula_npk'].fillna(calculadoras.FORMULA_NPK_DEFECTO).astype(str)
+    else:
+        formulas = pd.Series(calculadoras.FORMULA_NPK_DEFECTO, index=bloque.index)
+    formula_valida = formulas.str.match(PATRON_FORMULA).to_numpy()
+    errores[~formula_valida] += "formula_npk debe tener la forma N-P-K (p. ej. 15-15-15); "
+    formulas = formulas.where(formula_valida, '0-0-0').str.strip().to_numpy(dtype=object)
+
+    fert = calculadoras.fertilizacion(
+        rendimiento_esperado=entradas['rendimiento_esperado'],
+        nitrogeno_suelo=entradas['nitrogeno_suelo'],
+        fosforo_suelo=entradas['fosforo_suelo'],
+        potasio_suelo=entradas['potasio_suelo'],
+        superficie=entradas['superficie'],
+        formula_npk=formulas,
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        riego = calculadoras.agua(
+            et0=entradas['et0'],
+            kc=entradas['kc'],
+            eficiencia=entradas['eficiencia'],
+            frecuencia=entradas['frecuencia'],
+        )
+
+    fert_valida = formula_valida & ~invalida['fertilizacion']
+    riego_valido = ~invalida['agua']
+    resultado = bloque.copy()
+    for campo in ('dosis_npk_ha', 'dosis_total'):
+        resultado[campo] = np.where(fert_valida & np.isfinite(fert[campo]), fert[campo], np.nan)
+    for campo in ('lamina_diaria', 'lamina_evento', 'volumen_evento'):
+        resultado[campo] = np.where(riego_valido & np.isfinite(riego[campo]), riego[campo], np.nan)
+    # Volumen por evento para toda la parcela (m³)
+    resultado['volumen_evento_total'] = np.round(resultado['volumen_evento'] * entradas['superficie'], 1)
+    resultado['errores'] = [e.rstrip('; ') for e in errores]
+    return resultado
+
+
+def detectar_separador(archivo):
+    """Detecta ',' / ';' / tabulador a partir del inicio del archivo."""
+    muestra = archivo.read(4096)
+    archivo.seek(0)
+    if isinstance(muestra, bytes):
+        muestra = muestra.decode('utf-8', errors='ignore')
+    try:
+        return csv.Sniffer().sniff(muestra, delimiters=',;\t').delimiter
+    except csv.Error:
+        return ','
+
+
+def leer_bloques(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """Itera el CSV en DataFrames de a lo más `tamano_bloque` filas."""
+    try:
+        lector = pd.read_csv(
+            archivo, chunksize=tamano_bloque, sep=detectar_separador(archivo),
+            dtype=str, skipinitialspace=True, encoding='utf-8-sig',
+        )
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise ErrorPlanilla(f"No se pudo leer el CSV: {e}")
+    yield from lector
+
+
+def procesar_csv(archivo, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Devuelve un generador de fragmentos de texto CSV con los resultados.
+
+    El primer bloque se lee y valida antes de devolver el generador, para que
+    los errores de formato se puedan informar antes de empezar a responder.
+    Si un bloque posterior no se puede leer, la respuesta ya comenzó: se
+    termina con una fila marcadora (MARCA_ERROR) en vez de cortarse sin aviso.
+    """
+    bloques = leer_bloques(archivo, tamano_bloque)
+    try:
+        primero = next(bloques)
+    except StopIteration:
+        raise ErrorPlanilla("El archivo no contiene filas")
+    except (pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise ErrorPlanilla(f"No se pudo leer el CSV: {e}")
+
+    columnas = [normalizar_encabezado(c) for c in primero.columns]
+    if not {'rendimiento_esperado', 'et0'} & set(columnas):
+        raise ErrorPlanilla("La planilla debe incluir 'rendimiento_esperado' o 'et0'")
+
+    def generar():
+        encabezado = True
+        bloque = primero
+        filas = 0
+        while bloque is not None:
+            salida = io.StringIO()
+            calcular_bloque(bloque).to_csv(salida, index=False, header=encabezado)
+            encabezado = False
+            filas += len(bloque)
+            yield salida.getvalue()
+            try:
+                bloque = next(bloques, None)
+            except (pd.errors.ParserError, UnicodeDecodeError) as e:
+                yield fila_error(f"No se pudo leer el CSV después de la fila {filas}: {str(e).strip()}")
+                return
+
+    return generar()
+
+
+def fila_error(mensaje):
+    """Fila CSV que marca un resultado incompleto."""
+    salida = io.StringIO()
+    csv.writer(salida, lineterminator='\n').writerow([MARCA_ERROR, mensaje])
+    return salida.getvalue()
@@ -0,0 +1,335 @@
+# predicciones/services/datos_sinteticos.py
+"""
+Generación de datos sintéticos para pruebas de carga y benchmarks.
+
+Crea los datos de referencia (regiones, comunas y tipos de árbol con precios)
+y predicciones en lotes con un INSERT por executemany, con distribuciones configurables y
+los resultados de cada lote calculados con el modelo vectorizado de `puntaje`.
+"""
+import unicodedata
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from ..models import Region, Comuna, TipoArbol, Prediccion
+from . import puntaje, tendencias
+
+# codigo, nombre, latitud, longitud. Los códigos son los de poblar_* (BB
+# para Biobío); Ñuble no viene en esos datos y se agrega con NB
+REGIONES = [
+    ('AP', 'Región de Arica y Parinacota', -18.48, -70.31),
+    ('TA', 'Región de Tarapacá', -20.21, -69.33),
+    ('AN', 'Región de Antofagasta', -23.65, -70.40),
+    ('AT', 'Región de Atacama', -27.37, -70.33),
+    ('CO', 'Región de Coquimbo', -29.95, -71.34),
+    ('VA', 'Región de Valparaíso', -33.05, -71.62),
+    ('RM', 'Región Metropolitana', -33.45, -70.67),
+    ('OH', "Región de O'Higgins", -34.17, -70.74),
+    ('MA', 'Región del Maule', -35.43, -71.66),
+    ('NB', 'Región de Ñuble', -36.61, -72.10),
+    ('BB', 'Región del Biobío', -36.83, -73.05),
+    ('AR', 'Región de La Araucanía', -38.74, -72.60),
+    ('LR', 'Región de Los Ríos', -39.82, -73.25),
+    ('LL', 'Región de Los Lagos', -41.47, -72.94),
+    ('AI', 'Región de Aysén', -45.57, -72.07),
+    ('MG', 'Región de Magallanes', -53.16, -70.91),
+]
+
+# tipo, nombre científico, rendimiento (ton/ha), precio (CLP/ton),
+# plantación (CLP/ha), mantenimiento anual (CLP/ha)
+TIPOS_ARBOL = [
+    ('palto', 'Persea americana', 12.5, 1500000, 12000000, 3500000),
+    ('naranjo', 'Citrus sinensis', 30.0, 450000, 8000000, 2500000),
+    ('limonero', 'Citrus limon', 35.0, 500000, 8000000, 2500000),
+    ('manzano', 'Malus domestica', 45.0, 350000, 15000000, 4000000),
+    ('cerezo', 'Prunus avium', 8.5, 3000000, 18000000, 5000000),
+    ('nogal', 'Juglans regia', 4.0, 2800000, 10000000, 2800000),
+    ('almendro', 'Prunus dulcis', 2.5, 4500000, 9000000, 2500000),
+    ('olivo', 'Olea europaea', 8.0, 700000, 6000000, 1800000),
+    ('durazno', 'Prunus persica', 25.0, 400000, 9000000, 3000000),
+    ('peral', 'Pyrus communis', 35.0, 380000, 12000000, 3500000),
+]
+
+RIEGOS = ['goteo', 'micro_aspersion', 'aspersion', 'gravedad']
+SUELOS = ['franco', 'arcilloso', 'limoso', 'arenoso']
+FERTILIZACIONES = ['mixta', 'quimica', 'organica', 'ninguna']
+
+# Distribuciones por defecto. Las categóricas son pesos relativos (se
+# normalizan); las claves ausentes tienen peso 0 salvo que el diccionario
+# esté vacío, en cuyo caso la distribución es uniforme.
+DISTRIBUCIONES_DEFECTO = {
+    'tipos': {
+        'palto': 18, 'cerezo': 16, 'nogal': 14, 'manzano': 12, 'almendro': 8,
+        'olivo': 8, 'naranjo': 7, 'limonero': 7, 'durazno': 5, 'peral': 5,
+    },
+    'regiones': {
+        'RM': 14, 'VA': 12, 'OH': 16, 'MA': 16, 'CO': 10, 'NB': 8, 'BB': 6,
+        'AR': 5, 'AT': 3, 'LR': 3, 'LL': 3, 'AP': 1, 'TA': 1, 'AN': 1, 'AI': 0.5, 'MG': 0.5,
+    },
+    'riego': {'goteo': 50, 'micro_aspersion': 25, 'aspersion': 15, 'gravedad': 10},
+    'suelo': {'franco': 40, 'arcilloso': 20, 'limoso': 20, 'arenoso': 20},
+    'fertilizacion': {'mixta': 35, 'quimica': 30, 'organica': 25, 'ninguna': 10},
+    'estado': {'completada': 95, 'pendiente': 3, 'error': 2},
+    # Hectáreas ~ lognormal(media, sigma) recortada a [0.1, 500]
+    'hectareas': {'media': 1.2, 'sigma': 0.8},
+    'edad_arboles': {'min': 1, 'max': 40},
+    'densidad_plantacion': {'min': 100, 'max': 1200},
+}
+
+CAMPOS_RESULTADO = [
+    'produccion_por_hectarea', 'produccion_total', 'consumo_agua_por_hectarea',
+    'consumo_agua_total', 'inversion_estimada', 'ingresos_proyectados_5anos',
+    'roi_proyectado', 'van', 'tir', 'periodo_recuperacion',
+]
+
+
+def _clave_nombre(nombre):
+    """Nombre sin tildes, signos ni mayúsculas ("Región de O'Higgins" -> "regiondeohiggins")."""
+    sin_tildes = unicodedata.normalize('NFKD', nombre).encode('ascii', 'ignore').decode()
+    return ''.join(c for c in sin_tildes.lower() if c.isalnum())
+
+
+def crear_referencias(comunas_por_region=20, semilla=0):
+    """
+    Crea (o reutiliza) regiones, comunas, tipos de árbol y el usuario anónimo.
+
+    Las regiones ya cargadas se reconocen por código o por nombre (sin
+    tildes), así que solo se crean las que realmente faltan.
+
+    Devuelve (usuario, comunas, tipos) con las comunas y tipos como listas.
+    """
+    rng = np.random.default_rng(semilla)
+
+    cargadas = list(Region.objects.all())
+    por_codigo = {r.codigo: r for r in cargadas}
+    por_nombre = {_clave_nombre(r.nombre): r for r in cargadas}
+    for codigo, nombre, lat, lon in REGIONES:
+        region = por_codigo.get(codigo) or por_nombre.get(_clave_nombre(nombre))
+        if region is None:
+            region = Region.objects.create(codigo=codigo, nombre=nombre, latitud=lat, longitud=lon)
+        elif region.latitud is None or region.longitud is None:
+            # Las regiones de poblar_* vienen sin coordenadas
+            Region.objects.filter(pk=region.pk).update(latitud=lat, longitud=lon)
+        codigo = region.codigo
+        existentes = set(region.comunas.values_list('codigo', flat=True))
+        nuevas = [
+            Comuna(
+                nombre=f'Comuna {codigo} {i:03d}',
+                codigo=f'{codigo}{i:03d}',
+                region=region,
+                latitud=lat + rng.normal(0, 0.4),
+                longitud=lon + rng.normal(0, 0.3),
+            )
+            for i in range(1, comunas_por_region + 1)
+            if f'{codigo}{i:03d}' not in existentes
+        ]
+        Comuna.objects.bulk_create(nuevas)
+
+    for tipo, cientifico, rendimiento, precio, plantacion, mantenimiento in TIPOS_ARBOL:
+        economicos = {
+            'precio_promedio_ton': precio,
+            'costo_plantacion_hectarea': plantacion,
+            'costo_mantenimiento_anual': mantenimiento,
+            'consumo_agua_m3_ton': Prediccion.AGUA_BASE_POR_HECTAREA[tipo] / rendimiento,
+        }
+        tipo_arbol, creado = TipoArbol.objects.get_or_create(tipo=tipo, defaults={
+            'nombre_cientifico': cientifico,
+            'rendimiento_base': rendimiento,
+            **economicos,
+        })
+        # Los tipos cargados por poblar_* vienen sin datos económicos: se
+        # completan solo los campos en cero para no pisar valores reales
+        faltantes = {k: v for k, v in economicos.items() if not getattr(tipo_arbol, k)}
+        if not creado and faltantes:
+            TipoArbol.objects.filter(pk=tipo_arbol.pk).update(**faltantes)
+
+    usuario, _ = User.objects.get_or_create(
+        username='anonimo', defaults={'first_name': 'Usuario', 'last_name': 'Anonimo'}
+    )
+    comunas = list(Comuna.objects.select_related('region').order_by('pk'))
+    tipos = list(TipoArbol.objects.order_by('pk'))
+    return usuario, comunas, tipos
+
+
+def combinar_distribuciones(personalizadas=None):
+    """Distribuciones por defecto con las claves de `personalizadas` reemplazadas."""
+    distribuciones = {k: dict(v) for k, v in DISTRIBUCIONES_DEFECTO.items()}
+    for clave, valor in (personalizadas or {}).items():
+        if clave not in distribuciones:
+            raise ValueError(f"Distribución desconocida: {clave}")
+        distribuciones[clave] = dict(valor)
+    return distribuciones
+
+
+def _probabilidades(claves, pesos):
+    """Vector de probabilidades para `claves` según un diccionario de pesos."""
+    if not pesos:
+        return np.full(len(claves), 1 / len(claves))
+    p = np.array([float(pesos.get(c, 0)) for c in claves])
+    if p.sum() <= 0:
+        raise ValueError("Los pesos deben sumar más que cero para las opciones disponibles")
+    return p / p.sum()
+
+
+def _muestrear(rng, opciones, pesos, n):
+    return rng.choice(opciones, n, p=_probabilidades(opciones, pesos))
+
+
+def muestrear_entradas(n, comunas, tipos, rng, distribuciones=None):
+    """Entradas aleatorias de formulario para `n` predicciones."""
+    d = distribuciones or DISTRIBUCIONES_DEFECTO
+
+    # Comuna: primero la región según su peso, luego uniforme dentro de ella
+    codigos_region = np.array([c.region.codigo for c in comunas])
+    regiones = np.unique(codigos_region)
+    peso_region = _probabilidades(regiones, d['regiones'])
+    comunas_por_region = np.array([(codigos_region == r).sum() for r in regiones])
+    p_comuna = (peso_region / comunas_por_region)[np.searchsorted(regiones, codigos_region)]
+
+    hectareas = d['hectareas']
+    edad = d['edad_arboles']
+    densidad = d['densidad_plantacion']
+    return {
+        'tipo_idx': rng.choice(len(tipos), n, p=_probabilidades([t.tipo for t in tipos], d['tipos'])),
+        'comuna_idx': rng.choice(len(comunas), n, p=p_comuna / p_comuna.sum()),
+        'hectareas': np.round(rng.lognormal(hectareas['media'], hectareas['sigma'], n).clip(0.1, 500), 1),
+        'edad_arboles': rng.integers(edad['min'], edad['max'] + 1, n),
+        'densidad_plantacion': rng.integers(densidad['min'], densidad['max'] + 1, n),
+        'tipo_riego': _muestrear(rng, RIEGOS, d['riego'], n),
+        'tipo_suelo': _muestrear(rng, SUELOS, d['suelo'], n),
+        'fertilizacion': _muestrear(rng, FERTILIZACIONES, d['fertilizacion'], n),
+        'estado': _muestrear(rng, [e for e, _ in Prediccion.ESTADO_CHOICES], d['estado'], n),
+    }
+
+
+def puntuar_entradas(entradas, tipos, rng):
+    """Aplica el modelo vectorizado a un lote de entradas (muestreadas o recibidas por la API)."""
+    tipo_idx = entradas['tipo_idx']
+
+    def columna(atributo):
+        return np.array([getattr(t, atributo) for t in tipos], dtype=float)[tipo_idx]
+
+    agua_base = np.array(
+        [Prediccion.AGUA_BASE_POR_HECTAREA.get(t.tipo, 5000) for t in tipos], dtype=float
+    )[tipo_idx]
+    return puntaje.calcular_lote(
+        rendimiento_base=columna('rendimiento_base'),
+        edad_arboles=entradas['edad_arboles'],
+        densidad_plantacion=entradas['densidad_plantacion'],
+        tipo_riego=entradas['tipo_riego'],
+        tipo_suelo=entradas['tipo_suelo'],
+        fertilizacion=entradas['fertilizacion'],
+        hectareas=entradas['hectareas'],
+        consumo_agua_m3_ton=columna('consumo_agua_m3_ton'),
+        agua_base_por_hectarea=agua_base,
+        precio_promedio_ton=columna('precio_promedio_ton'),
+        costo_plantacion_hectarea=columna('costo_plantacion_hectarea'),
+        costo_mantenimiento_anual=columna('costo_mantenimiento_anual'),
+        rng=rng,
+    )
+
+
+def _a_lista(columna, completada):
+    """Columna NumPy -> lista Python con None para NaN y filas no completadas."""
+    valores = np.asarray(columna, dtype=float)
+    return np.where(np.isnan(valores) | ~completada, None, valores).tolist()
+
+
+def construir_lote(tamano, usuario, comunas, tipos, rng, distribuciones=None, dias_historia=0):
+    """Muestrea, puntúa y arma `tamano` instancias de Prediccion sin guardarlas."""
+    entradas = muestrear_entradas(tamano, comunas, tipos, rng, distribuciones)
+    resultado = puntuar_entradas(entradas, tipos, rng)
+    completada = entradas['estado'] == 'completada'
+
+    # Conversión a listas Python por columna (mucho más rápido que por celda)
+    columnas = {campo: _a_lista(resultado[campo], completada) for campo in CAMPOS_RESULTADO}
+    confiabilidad = np.where(completada, resultado['confiabilidad'], -1).tolist()
+    flujos = np.round(resultado['flujos'], 2)
+    flujos_validos = completada & ~np.isnan(flujos).any(axis=1)
+    flujos = flujos.tolist()
+    tipo_ids = np.array([t.pk for t in tipos])[entradas['tipo_idx']].tolist()
+    comuna_ids = np.array([c.pk for c in comunas])[entradas['comuna_idx']].tolist()
+    # El INSERT directo no pasa por save(): la región desnormalizada se copia aquí
+    region_ids = np.array([c.region_id for c in comunas])[entradas['comuna_idx']].tolist()
+    hectareas = entradas['hectareas'].tolist()
+    edades = entradas['edad_arboles'].tolist()
+    densidades = entradas['densidad_plantacion'].tolist()
+    riegos = entradas['tipo_riego'].tolist()
+    suelos = entradas['tipo_suelo'].tolist()
+    fertilizaciones = entradas['fertilizacion'].tolist()
+    estados = entradas['estado'].tolist()
+
+    ahora = timezone.now()
+    if dias_historia > 0:
+        segundos = np.sort(rng.uniform(0, dias_historia * 86400, tamano))[::-1]
+        fechas = [ahora - timedelta(seconds=s) for s in segundos.tolist()]
+    else:
+        fechas = [ahora] * tamano
+
+    objetos = []
+    for i in range(tamano):
+        objetos.append(Prediccion(
+            usuario_id=usuario.pk,
+            tipo_arbol_id=tipo_ids[i],
+            comuna_id=comuna_ids[i],
+            region_id=region_ids[i],
+            hectareas=hectareas[i],
+            edad_arboles=edades[i],
+            densidad_plantacion=densidades[i],
+            tipo_riego=riegos[i],
+            tipo_suelo=suelos[i],
+            fertilizacion=fertilizaciones[i],
+            estado=estados[i],
+            confiabilidad=confiabilidad[i] if confiabilidad[i] >= 0 else None,
+            flujos_caja=flujos[i] if flujos_validos[i] else None,
+            fecha_creacion=fechas[i],
+            fecha_actualizacion=fechas[i],
+            **{campo: columnas[campo][i] for campo in CAMPOS_RESULTADO},
+        ))
+    return objetos
+
+
+def generar_predicciones(n, usuario, comunas, tipos, rng, tamano_lote=10000,
+                         distribuciones=None, dias_historia=0):
+    """
+    Inserta `n` predicciones en lotes de `tamano_lote`.
+
+    Cada lote se muestrea, se puntúa vectorizado y se guarda con un único
+    executemany dentro de una transacción. Genera el total acumulado tras
+    cada lote para que el llamador pueda informar progreso.
+    """
+    distribuciones = combinar_distribuciones(distribuciones)
+    creadas = 0
+    while creadas < n:
+        tamano = min(tamano_lote, n - creadas)
+        objetos = construir_lote(tamano, usuario, comunas, tipos, rng, distribuciones, dias_historia)
+        with transaction.atomic():
+            _insertar_con_fechas(objetos)
+            tendencias.aplicar(tendencias.acumular(objetos))
+        creadas += tamano
+        yield creadas
+
+
+def _insertar_con_fechas(objetos):
+    """
+    INSERT de los objetos con sus fecha_creacion/fecha_actualizacion.
+
+    bulk_create pasa por pre_save, donde auto_now_add/auto_now reemplazan
+    las fechas por el instante actual; aquí los valores se preparan con
+    get_db_prep_save y se insertan con un único executemany, sin tocar los
+    campos del modelo ni reescribir las fechas después.
+    """
+    conexion = connections[router.db_for_write(Prediccion)]
+    campos = [c for c in Prediccion._meta.concrete_fields if not c.primary_key]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        conexion.ops.quote_name(Prediccion._meta.db_table),
+        ', '.join(conexion.ops.quote_name(c.column) for c in campos),
+        ', '.join(['%s'] * len(campos)),
+    )
+    with conexion.cursor() as cursor:
+        cursor.executemany(sql, [
+            [c.get_db_prep_save(getattr(o, c.attname), conexion) for c in campos] for o in objetos
+        ])
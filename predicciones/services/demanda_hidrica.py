@@ -0,0 +1,117 @@
+# predicciones/services/demanda_hidrica.py
+"""
+Demanda mensual de agua por región y tipo de árbol.
+
+El consumo anual de cada predicción (consumo_agua_total) se reparte en los
+12 meses en proporción a Kc x ET0: el coeficiente de cultivo mensual de su
+especie (CURVAS_KC) por la evapotranspiración de referencia (ET0_MENSUAL).
+
+El reparto es lineal, así que repartir cada predicción y luego sumar por
+región da lo mismo que repartir la suma de cada celda (tipo de árbol x
+región). Esas sumas ya están en la copia en memoria (services/instantanea):
+el cálculo es un producto (celdas x 12) que se guarda junto a esa copia.
+"""
+import csv
+import io
+
+import numpy as np
+
+from ..models import TipoArbol
+
+MESES = ('ene', 'feb', 'mar', 'abr', 'may', 'jun', 'jul', 'ago', 'sep', 'oct', 'nov', 'dic')
+
+# ET0 de referencia (mm/mes) de la zona central
+ET0_MENSUAL = np.array([190, 155, 125, 75, 45, 30, 32, 50, 75, 115, 150, 180], dtype=float)
+
+# Kc mensual (enero a diciembre, hemisferio sur). Los caducos no demandan
+# riego en receso invernal.
+CURVAS_KC = {
+    'palto': (0.75, 0.75, 0.72, 0.68, 0.62, 0.58, 0.58, 0.60, 0.64, 0.68, 0.72, 0.75),
+    'naranjo': (0.70, 0.70, 0.68, 0.65, 0.62, 0.60, 0.60, 0.62, 0.65, 0.68, 0.70, 0.70),
+    'limonero': (0.70, 0.70, 0.68, 0.65, 0.62, 0.60, 0.60, 0.62, 0.65, 0.68, 0.70, 0.70),
+    'olivo': (0.70, 0.70, 0.65, 0.60, 0.55, 0.50, 0.50, 0.55, 0.60, 0.65, 0.70, 0.70),
+    'manzano': (1.10, 1.10, 0.95, 0.75, 0.45, 0.00, 0.00, 0.00, 0.45, 0.70, 0.90, 1.05),
+    'peral': (1.10, 1.10, 0.95, 0.75, 0.45, 0.00, 0.00, 0.00, 0.45, 0.70, 0.90, 1.05),
+    'cerezo': (0.95, 0.90, 0.80, 0.65, 0.45, 0.00, 0.00, 0.00, 0.40, 0.65, 0.85, 0.95),
+    'durazno': (1.00, 1.00, 0.90, 0.70, 0.45, 0.00, 0.00, 0.00, 0.45, 0.70, 0.90, 1.00),
+    'almendro': (0.95, 0.90, 0.80, 0.65, 0.40, 0.00, 0.00, 0.00, 0.40, 0.60, 0.80, 0.90),
+    'nogal': (1.10, 1.10, 1.00, 0.70, 0.40, 0.00, 0.00, 0.00, 0.20, 0.60, 0.90, 1.05),
+}
+# Especie sin curva: reparto plano
+CURVA_PLANA = (1.0,) * 12
+
+AGRUPACIONES = ('region', 'tipo_arbol')
+
+
+def fracciones(tipo):
+    """Fracción del consumo anual de `tipo` que cae en cada mes (suma 1)."""
+    peso = np.array(CURVAS_KC.get(tipo, CURVA_PLANA)) * ET0_MENSUAL
+    return peso / peso.sum()
+
+
+def _por_celda(columnas):
+    """
+    (tipos, regiones, hectareas, mensual): sumas por celda tipo x región,
+    con mensual de forma (tipos, regiones, 12). Se guarda en las Columnas
+    y se recalcula si cambian los tipos de árbol.
+    """
+    tipos = tuple(TipoArbol.objects.order_by('id').values_list('id', 'tipo'))
+    guardado = getattr(columnas, '_demanda_hidrica', None)
+    if guardado is not None and guardado[0] == tipos:
+        return guardado[1]
+    por_id = dict(tipos)
+    matriz = np.array([fracciones(por_id.get(t)) for t in columnas.tipos.tolist()]).reshape(-1, 12)
+    anual = columnas.sumas['consumo_agua_total']
+    resultado = (columnas.tipos, columnas.regiones, columnas.sumas['hectareas'], anual[:, :, None] * matriz[:, None, :])
+    columnas._demanda_hidrica = (tipos, resultado)
+    return resultado
+
+
+def mensual(columnas, agrupar='region', region=None, tipo_arbol=None):
+    """
+    Demanda mensual (m³) de las predicciones completadas.
+
+    Devuelve filas {region[, tipo_arbol], hectareas, total_m3, mensual_m3}
+    ordenadas por total descendente; `agrupar` es 'region' o 'tipo_arbol'
+    (por región y tipo). Lanza ValueError con una agrupación desconocida.
+    """
+    if agrupar not in AGRUPACIONES:
+        raise ValueError(f"Agrupación desconocida: {agrupar!r} (use 'region' o 'tipo_arbol').")
+    tipos, regiones, hectareas, demanda = _por_celda(columnas)
+    filas_t = np.ones(len(tipos), dtype=bool) if tipo_arbol is None else tipos == tipo_arbol
+    columnas_r = np.ones(len(regiones), dtype=bool) if region is None else regiones == region
+
+    filas = []
+    for j in np.flatnonzero(columnas_r).tolist():
+        celdas = [(None, np.flatnonzero(filas_t))] if agrupar == 'region' else [
+            (int(tipos[i]), [i]) for i in np.flatnonzero(filas_t).tolist()
+        ]
+        for tipo, indices in celdas:
+            if not hectareas[indices, j].sum():
+                continue
+            fila = {'region': None if regiones[j] < 0 else int(regiones[j])}
+            if agrupar == 'tipo_arbol':
+                fila['tipo_arbol'] = tipo
+            valores = demanda[indices, j].sum(axis=0)
+            fila.update(
+                hectareas=round(float(hectareas[indices, j].sum()), 2),
+                total_m3=round(float(valores.sum()), 1),
+                mensual_m3=np.round(valores, 1).tolist(),
+            )
+            filas.append(fila)
+    filas.sort(key=lambda f: -f['total_m3'])
+    return filas
+
+
+def exportar_csv(filas):
+    """Filas de `mensual` (con nombres) como CSV, un mes por columna."""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    por_tipo = any('tipo_arbol' in f for f in filas)
+    escritor.writerow(['region'] + (['tipo_arbol'] if por_tipo else []) + ['hectareas'] + [f'{m}_m3' for m in MESES] + ['total_m3'])
+    for f in filas:
+        escritor.writerow(
+            [f.get('region__nombre') or ''] + ([f.get('tipo_arbol__tipo') or ''] if por_tipo else [])
+            + [f['hectareas']] + f['mensual_m3'] + [f['total_m3']]
+        )
+    return salida.getvalue()
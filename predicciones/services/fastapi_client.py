@@ -1,20 +1,37 @@
 # predicciones/services/fastapi_client.py
-import httpx
+import threading
+
 from django.conf import settings
+from .metricas import medir_http
 
 BASE = getattr(settings, "FASTAPI_BASE_URL", "http://localhost:8001")
 TIMEOUT = 5.0
 
+# httpx se importa y el cliente se crea en la primera llamada; el cliente
+# se reutiliza (pool de conexiones keep-alive) en las siguientes
+_cliente = None
+_lock = threading.Lock()
+
+
+def obtener_cliente():
+    global _cliente
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                import httpx
+                _cliente = httpx.Client(timeout=TIMEOUT)
+    return _cliente
+
 def ping():
     url = f"{BASE}/health"
-    with httpx.Client(timeout=TIMEOUT) as client:
-        r = client.get(url)
+    with medir_http("fastapi"):
+        r = obtener_cliente().get(url)
         r.raise_for_status()
         return r.json()
 
 def echo(msg: str):
     url = f"{BASE}/echo"
-    with httpx.Client(timeout=TIMEOUT) as client:
-        r = client.post(url, json={"msg": msg})
+    with medir_http("fastapi"):
+        r = obtener_cliente().post(url, json={"msg": msg})
         r.raise_for_status()
-        return r.json()
\ No newline at end of file
+        return r.json()
@@ -0,0 +1,223 @@
+# predicciones/services/flujo_caja.py
+"""
+Motor de flujo de caja descontado para las predicciones.
+
+Construye los flujos anuales de cada predicción a partir de una curva de
+rendimiento según la edad de los árboles y calcula VAN, TIR y periodo de
+recuperación. Todas las funciones operan sobre arreglos, de modo que un lote
+de predicciones se evalúa en una sola pasada (matriz predicciones × años).
+"""
+import numpy as np
+from django.conf import settings
+
+# Curva de rendimiento por edad (mismos tramos que Prediccion._factor_edad)
+LIMITES_EDAD = np.array([3, 7, 15])
+FACTORES_EDAD = np.array([0.3, 0.8, 1.0, 0.9])
+
+TASA_DESCUENTO_DEFECTO = 0.08
+ANOS_PROYECCION_DEFECTO = 5
+
+# Intervalo de búsqueda de la TIR
+TIR_MIN = -0.99
+TIR_MAX = 10.0
+
+
+def parametros_economicos():
+    """Tasa de descuento y horizonte desde settings.ECONOMIC_ANALYSIS_DEFAULTS."""
+    config = getattr(settings, 'ECONOMIC_ANALYSIS_DEFAULTS', {})
+    return (
+        config.get('TASA_DESCUENTO', TASA_DESCUENTO_DEFECTO),
+        int(config.get('AÑOS_PROYECCION', ANOS_PROYECCION_DEFECTO)),
+    )
+
+
+def factor_edad(edad):
+    """Factor de rendimiento para una o varias edades (años)."""
+    return FACTORES_EDAD[np.searchsorted(LIMITES_EDAD, np.asarray(edad), side='left')]
+
+
+def flujos_anuales(produccion_por_hectarea, edad_arboles, hectareas, precio_ton,
+                   costo_plantacion_hectarea, costo_mantenimiento_anual, anos):
+    """
+    Matriz (n, anos + 1) de flujos netos en CLP.
+
+    El año 0 es la inversión de plantación; los años 1..anos son ingresos
+    menos mantenimiento, con el rendimiento ajustado a la edad que tendrán
+    los árboles ese año (el año 1 corresponde a la edad actual).
+    """
+    produccion = np.atleast_1d(np.asarray(produccion_por_hectarea, dtype=float))
+    edad = np.atleast_1d(np.asarray(edad_arboles, dtype=float))
+    hectareas = np.atleast_1d(np.asarray(hectareas, dtype=float))
+    precio = np.atleast_1d(np.asarray(precio_ton, dtype=float))
+    plantacion = np.atleast_1d(np.asarray(costo_plantacion_hectarea, dtype=float))
+    mantenimiento = np.atleast_1d(np.asarray(costo_mantenimiento_anual, dtype=float))
+
+    anos_futuros = np.arange(anos)
+    rendimiento_base = produccion / factor_edad(edad)
+    rendimiento = rendimiento_base[:, None] * factor_edad(edad[:, None] + anos_futuros)
+
+    flujos = np.empty((len(produccion), anos + 1))
+    flujos[:, 0] = -plantacion * hectareas
+    flujos[:, 1:] = (rendimiento * precio[:, None] - mantenimiento[:, None]) * hectareas[:, None]
+    return flujos
+
+
+def factores_descuento(tasa, anos):
+    return (1 + np.asarray(tasa, dtype=float)[..., None]) ** -np.arange(anos + 1)
+
+
+def van(flujos, tasa):
+    """Valor actual neto de cada fila de flujos (evaluación de Horner, sin potencias)."""
+    descuento = 1 / (1 + np.asarray(tasa, dtype=float))
+    resultado = flujos[:, -1].copy()
+    for ano in range(flujos.shape[1] - 2, -1, -1):
+        resultado = resultado * descuento + flujos[:, ano]
+    return resultado
+
+
+def tir(flujos, iteraciones=60):
+    """
+    Tasa interna de retorno por bisección vectorizada.
+
+    Devuelve NaN para las filas sin cambio de signo del VAN en [TIR_MIN, TIR_MAX].
+    """
+    n = flujos.shape[0]
+    bajo = np.full(n, TIR_MIN)
+    alto = np.full(n, TIR_MAX)
+    van_bajo = van(flujos, bajo)
+    van_alto = van(flujos, alto)
+    valida = np.sign(van_bajo) != np.sign(van_alto)
+
+    for _ in range(iteraciones):
+        medio = (bajo + alto) / 2
+        van_medio = van(flujos, medio)
+        mismo_signo = np.sign(van_medio) == np.sign(van_bajo)
+        bajo = np.where(mismo_signo, medio, bajo)
+        van_bajo = np.where(mismo_signo, van_medio, van_bajo)
+        alto = np.where(mismo_signo, alto, medio)
+
+    return np.where(valida, (bajo + alto) / 2, np.nan)
+
+
+def periodo_recuperacion(flujos, tasa=None):
+    """
+    Años hasta que el flujo acumulado (descontado si se indica tasa) se vuelve
+    no negativo, interpolando dentro del año. NaN si no se recupera en el horizonte.
+    """
+    if tasa is not None:
+        flujos = flujos * factores_descuento(tasa, flujos.shape[1] - 1)
+    acumulado = np.cumsum(flujos, axis=1)
+    recuperado = acumulado >= 0
+    alcanza = recuperado.any(axis=1)
+    ano = np.argmax(recuperado, axis=1)
+
+    filas = np.arange(len(flujos))
+    previo = acumulado[filas, np.maximum(ano - 1, 0)]
+    flujo_ano = flujos[filas, ano]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraccion = np.where(flujo_ano > 0, -previo / flujo_ano, 0.0)
+    periodo = np.where(ano == 0, 0.0, ano - 1 + fraccion)
+    return np.where(alcanza, periodo, np.nan)
+
+
+def evaluar(produccion_por_hectarea, edad_arboles, hectareas, precio_ton,
+            costo_plantacion_hectarea, costo_mantenimiento_anual,
+            tasa=None, anos=None):
+    """
+    Evalúa un lote de predicciones.
+
+    Devuelve un diccionario con 'flujos' (n, anos + 1), 'van' (CLP),
+    'tir' (%), 'periodo_recuperacion' (años, descontado) y
+    'periodo_recuperacion_simple' (años, sin descontar).
+    """
+    tasa_defecto, anos_defecto = parametros_economicos()
+    tasa = tasa_defecto if tasa is None else tasa
+    anos = anos_defecto if anos is None else anos
+
+    flujos = flujos_anuales(
+        produccion_por_hectarea, edad_arboles, hectareas, precio_ton,
+        costo_plantacion_hectarea, costo_mantenimiento_anual, anos,
+    )
+    return {
+        'flujos': flujos,
+        'van': van(flujos, tasa),
+        'tir': tir(flujos) * 100,
+        'periodo_recuperacion': periodo_recuperacion(flujos, tasa),
+        'periodo_recuperacion_simple': periodo_recuperacion(flujos),
+    }
+
+
+def _a_campo(valor):
+    """NaN -> None para guardar en campos nulos."""
+    valor = float(valor)
+    return None if np.isnan(valor) else round(valor, 2)
+
+
+CAMPOS_ENTRADA = [
+    'id', 'produccion_por_hectarea', 'edad_arboles', 'hectareas',
+    'tipo_arbol__precio_promedio_ton', 'tipo_arbol__costo_plantacion_hectarea',
+    'tipo_arbol__costo_mantenimiento_anual',
+]
+CAMPOS_RESULTADO = ['van', 'tir', 'periodo_recuperacion', 'flujos_caja']
+
+
+def asignar_resultados(prediccion, resultado, fila=0):
+    """Copia la fila `fila` de un resultado de `evaluar` a una Prediccion."""
+    prediccion.van = _a_campo(resultado['van'][fila])
+    prediccion.tir = _a_campo(resultado['tir'][fila])
+    prediccion.periodo_recuperacion = _a_campo(resultado['periodo_recuperacion'][fila])
+    prediccion.flujos_caja = [round(v, 2) for v in resultado['flujos'][fila].tolist()]
+
+
+def actualizar_predicciones(queryset, tamano_lote=5000):
+    """
+    Recalcula y guarda VAN, TIR, recuperación y flujos para un queryset.
+
+    Lee solo las columnas necesarias con values_list, evalúa cada lote de
+    forma vectorizada y persiste con bulk_update. Devuelve las filas actualizadas.
+    """
+    modelo = queryset.model
+    filas = queryset.filter(
+        produccion_por_hectarea__isnull=False,
+        tipo_arbol__precio_promedio_ton__gt=0,
+    ).order_by('pk').values_list(*CAMPOS_ENTRADA)
+
+    # Paginación por clave (pk > último) para no escribir sobre un cursor abierto
+    total = 0
+    ultimo = 0
+    while True:
+        lote = list(filas.filter(pk__gt=ultimo)[:tamano_lote])
+        if not lote:
+            return total
+        total += _actualizar_lote(modelo, lote)
+        ultimo = lote[-1][0]
+
+
+def _actualizar_lote(modelo, lote):
+    datos = np.array([fila[1:] for fila in lote], dtype=float)
+    resultado = evaluar(*datos.T)
+    objetos = []
+    for i, fila in enumerate(lote):
+        prediccion = modelo(pk=fila[0])
+        asignar_resultados(prediccion, resultado, i)
+        objetos.append(prediccion)
+    modelo.objects.bulk_update(objetos, CAMPOS_RESULTADO)
+    return len(objetos)
+
+
+def curva_recuperacion(flujos, tasa=None):
+    """
+    Filas año a año para mostrar una curva de recuperación a partir de los
+    flujos guardados en Prediccion.flujos_caja.
+    """
+    if not flujos:
+        return []
+    tasa = parametros_economicos()[0] if tasa is None else tasa
+    flujos = np.asarray(flujos, dtype=float)
+    descontados = flujos * factores_descuento(tasa, len(flujos) - 1)
+    return [
+        {'ano': ano, 'flujo': flujo, 'acumulado': acumulado, 'acumulado_descontado': descontado}
+        for ano, (flujo, acumulado, descontado) in enumerate(zip(
+            flujos.tolist(), np.cumsum(flujos).tolist(), np.cumsum(descontados).tolist()
+        ))
+    ]
@@ -0,0 +1,200 @@
+# predicciones/services/geocodificacion.py
+"""
+Geocodificación inversa: coordenadas GPS -> comuna más cercana.
+
+El índice (en memoria, por proceso) es una grilla de celdas de
+TAMANO_CELDA grados sobre las comunas con coordenadas. Para cada celda se
+precalculan las comunas que pueden ser la más cercana a algún punto de la
+celda: por desigualdad triangular, las que están a no más de
+(distancia mínima al centro + 2 x semidiagonal) del centro. Una consulta
+calcula la distancia haversine de todos los puntos a la vez, pero solo
+contra esas pocas comunas; los puntos fuera de la grilla se comparan con
+todas.
+
+El índice se rehace cuando cambian las comunas: los receptores de
+save/delete de Comuna y Region (PrediccionesConfig.ready) fuerzan una
+revisión, y cada proceso compara además las coordenadas vigentes como
+máximo cada SNAPSHOT_REFRESH_SECONDS.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from ..models import Comuna
+from ..routers import alias_replica
+
+RADIO_TIERRA_KM = 6371.0088
+TAMANO_CELDA = 0.25  # grados
+MAX_PUNTOS = 50000
+# Puntos fuera de la grilla: se comparan con todas las comunas en tramos de este tamaño
+TRAMO_FUERA = 2000
+
+
+def haversine_km(lat1, lon1, lat2, lon2, cos1=None, cos2=None):
+    """
+    Distancia en km entre coordenadas en radianes (admite arreglos con
+    broadcasting); cos1/cos2 son los cosenos de las latitudes si ya se tienen.
+    """
+    cos1 = np.cos(lat1) if cos1 is None else cos1
+    cos2 = np.cos(lat2) if cos2 is None else cos2
+    a = np.sin((lat2 - lat1) / 2) ** 2 + cos1 * cos2 * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class Indice:
+    """Grilla de comunas candidatas por celda (inmutable: un cambio crea otro índice)."""
+
+    def __init__(self, comunas):
+        # comunas: [(id, nombre, region_id, region, latitud, longitud)]
+        self.ids = np.array([c[0] for c in comunas], dtype=np.int64)
+        self.nombres = [c[1] for c in comunas]
+        self.region_ids = [c[2] for c in comunas]
+        self.regiones = [c[3] for c in comunas]
+        latitud = np.array([c[4] for c in comunas], dtype=float).reshape(-1)
+        longitud = np.array([c[5] for c in comunas], dtype=float).reshape(-1)
+        self.lat, self.lon = np.radians(latitud), np.radians(longitud)
+        self.cos_lat = np.cos(self.lat)
+        if not len(comunas):
+            self.filas = self.columnas = 0
+            self.candidatos = np.empty((0, 0), dtype=np.int64)
+            return
+
+        # Grilla sobre las comunas con una celda de margen
+        self.lat0 = np.floor(latitud.min() / TAMANO_CELDA) * TAMANO_CELDA - TAMANO_CELDA
+        self.lon0 = np.floor(longitud.min() / TAMANO_CELDA) * TAMANO_CELDA - TAMANO_CELDA
+        self.filas = int(np.ceil((latitud.max() - self.lat0) / TAMANO_CELDA)) + 2
+        self.columnas = int(np.ceil((longitud.max() - self.lon0) / TAMANO_CELDA)) + 2
+
+        centro_lat = self.lat0 + (np.arange(self.filas) + 0.5) * TAMANO_CELDA
+        centro_lon = self.lon0 + (np.arange(self.columnas) + 0.5) * TAMANO_CELDA
+        centro_lat, centro_lon = (np.radians(v).reshape(-1, 1) for v in np.meshgrid(centro_lat, centro_lon, indexing='ij'))
+        medio = np.radians(TAMANO_CELDA / 2)
+        semidiagonal = np.maximum(
+            haversine_km(centro_lat, centro_lon, centro_lat + medio, centro_lon + medio),
+            haversine_km(centro_lat, centro_lon, centro_lat - medio, centro_lon + medio),
+        )
+        distancias = haversine_km(centro_lat, centro_lon, self.lat, self.lon)  # (celdas, comunas)
+        limite = distancias.min(axis=1, keepdims=True) + 2 * semidiagonal
+        distancias[distancias > limite] = np.inf
+        ancho = int((distancias <= limite).sum(axis=1).max())
+        orden = np.argsort(distancias, axis=1)[:, :ancho]
+        # -1 marca los huecos de las celdas con menos candidatas que el ancho
+        self.candidatos = np.where(np.take_along_axis(distancias, orden, axis=1) < np.inf, orden, -1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def buscar(self, latitud, longitud):
+        """
+        Comuna más cercana a cada punto (grados): (posiciones, distancias_km),
+        con posición -1 si no hay comunas con coordenadas.
+        """
+        lat, lon = np.radians(latitud), np.radians(longitud)
+        posiciones = np.full(len(lat), -1, dtype=np.int64)
+        distancias = np.full(len(lat), np.nan)
+        if not len(self):
+            return posiciones, distancias
+
+        fila = np.floor((latitud - self.lat0) / TAMANO_CELDA).astype(np.int64)
+        columna = np.floor((longitud - self.lon0) / TAMANO_CELDA).astype(np.int64)
+        dentro = (fila >= 0) & (fila < self.filas) & (columna >= 0) & (columna < self.columnas)
+
+        indices = np.flatnonzero(dentro)
+        candidatos = self.candidatos[fila[indices] * self.columnas + columna[indices]]
+        validos = candidatos >= 0
+        d = haversine_km(
+            lat[indices, None], lon[indices, None], self.lat[candidatos], self.lon[candidatos],
+            cos1=np.cos(lat[indices, None]), cos2=self.cos_lat[candidatos],
+        )
+        d[~validos] = np.inf
+        mejor = d.argmin(axis=1)
+        posiciones[indices] = candidatos[np.arange(len(indices)), mejor]
+        distancias[indices] = d[np.arange(len(indices)), mejor]
+
+        fuera = np.flatnonzero(~dentro)
+        for inicio in range(0, len(fuera), TRAMO_FUERA):
+            tramo = fuera[inicio:inicio + TRAMO_FUERA]
+            d = haversine_km(lat[tramo, None], lon[tramo, None], self.lat, self.lon, cos2=self.cos_lat)
+            posiciones[tramo] = d.argmin(axis=1)
+            distancias[tramo] = d.min(axis=1)
+        return posiciones, distancias
+
+
+def leer_puntos(datos):
+    """{'latitud': [...], 'longitud': [...]} -> dos arreglos en grados; lanza ValueError si no son válidos."""
+    try:
+        latitud = np.asarray(datos.get('latitud'), dtype=float)
+        longitud = np.asarray(datos.get('longitud'), dtype=float)
+    except (TypeError, ValueError):
+        raise ValueError("'latitud' y 'longitud' deben ser listas de números.")
+    if latitud.ndim != 1 or latitud.shape != longitud.shape:
+        raise ValueError("'latitud' y 'longitud' deben ser listas del mismo largo.")
+    if len(latitud) > MAX_PUNTOS:
+        raise ValueError(f"Máximo {MAX_PUNTOS} puntos por solicitud.")
+    if not (np.all(np.abs(latitud) <= 90) and np.all(np.abs(longitud) <= 180)):
+        raise ValueError("Coordenadas fuera de rango (latitud ±90, longitud ±180).")
+    return latitud, longitud
+
+
+class Geocodificador:
+    """Índice del proceso, rehecho cuando cambian las coordenadas de las comunas."""
+
+    def __init__(self):
+        self.indice = Indice([])
+        self.comunas = None
+        self.revisado = None
+        self._candado = threading.Lock()
+
+    def invalidar(self):
+        """Fuerza a revisar las comunas en la próxima consulta."""
+        self.revisado = None
+
+    def obtener(self):
+        intervalo = getattr(settings, 'SNAPSHOT_REFRESH_SECONDS', 5)
+        revisado = self.revisado
+        if revisado is not None and time.monotonic() - revisado < intervalo:
+            return self.indice
+        with self._candado:
+            if self.revisado is None or time.monotonic() - self.revisado >= intervalo:
+                comunas = list(
+                    Comuna.objects.using(alias_replica() or 'default')
+                    .filter(latitud__isnull=False, longitud__isnull=False)
+                    .order_by('id')
+                    .values_list('id', 'nombre', 'region_id', 'region__nombre', 'latitud', 'longitud')
+                )
+                if comunas != self.comunas:
+                    self.indice = Indice(comunas)
+                    self.comunas = comunas
+                self.revisado = time.monotonic()
+        return self.indice
+
+
+_geocodificador = Geocodificador()
+
+
+def invalidar():
+    _geocodificador.invalidar()
+
+
+def geocodificar(latitud, longitud, max_km=None):
+    """
+    Comuna más cercana a cada punto, en columnas: comuna_id, comuna,
+    region_id, region y distancia_km (None donde no hay comuna a menos de
+    `max_km`).
+    """
+    indice = _geocodificador.obtener()
+    posiciones, distancias = indice.buscar(latitud, longitud)
+    if max_km is not None:
+        posiciones[~(distancias <= max_km)] = -1
+    encontradas = posiciones >= 0
+    distancias = np.where(encontradas, np.round(distancias, 3), np.nan)
+    lista = posiciones.tolist()
+    return {
+        'comuna_id': [int(indice.ids[p]) if p >= 0 else None for p in lista],
+        'comuna': [indice.nombres[p] if p >= 0 else None for p in lista],
+        'region_id': [indice.region_ids[p] if p >= 0 else None for p in lista],
+        'region': [indice.regiones[p] if p >= 0 else None for p in lista],
+        'distancia_km': [None if d != d else d for d in distancias.tolist()],
+    }
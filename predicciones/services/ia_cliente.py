@@ -0,0 +1,30 @@
+# predicciones/services/ia_cliente.py
+"""
+Cliente de OpenRouter (API compatible con OpenAI) creado bajo demanda.
+
+El paquete openai tarda casi un segundo en importarse; se importa recién
+en la primera consulta de IA y no al cargar las vistas, de modo que los
+comandos de manage.py y el arranque de los workers no pagan ese costo.
+"""
+import os
+import threading
+
+OPENROUTER_API_KEY = os.getenv(
+    "OPENROUTER_API_KEY",
+    "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"
+)
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+_cliente = None
+_lock = threading.Lock()
+
+
+def obtener_cliente():
+    """Cliente OpenAI compartido por el proceso (se crea en el primer uso)."""
+    global _cliente
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                from openai import OpenAI
+                _cliente = OpenAI(api_key=OPENROUTER_API_KEY, base_url=OPENROUTER_BASE_URL)
+    return _cliente
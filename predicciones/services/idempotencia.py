@@ -0,0 +1,94 @@
+# predicciones/services/idempotencia.py
+"""
+Reintentos sin duplicados para las APIs de escritura.
+
+Una vista decorada con `idempotente` que recibe la cabecera Idempotency-Key
+se ejecuta una sola vez por clave: la respuesta exitosa queda guardada en
+la misma transacción que los datos y los reintentos con la misma clave y el
+mismo cuerpo la reciben de nuevo (con la cabecera Idempotent-Replayed) sin
+volver a ejecutar la vista. Las respuestas de error no se guardan, de modo
+que el cliente puede corregir la solicitud y reintentar con la misma clave.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from ..models import SolicitudIdempotente
+
+CABECERA = 'Idempotency-Key'
+CABECERA_REPETIDA = 'Idempotent-Replayed'
+LARGO_MAXIMO = 255
+
+
+def vigencia():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_TTL_HOURS', 24))
+
+
+def huella(cuerpo):
+    return hashlib.sha256(cuerpo).hexdigest()
+
+
+def repetir(registro, huella_actual):
+    """Respuesta guardada, o un error si la clave se usó con otro cuerpo."""
+    if registro.huella != huella_actual:
+        return JsonResponse(
+            {"error": f"La clave {CABECERA} ya se usó con un cuerpo distinto."}, status=422,
+        )
+    respuesta = HttpResponse(registro.contenido, status=registro.estado_http, content_type=registro.tipo_contenido)
+    respuesta[CABECERA_REPETIDA] = 'true'
+    return respuesta
+
+
+def idempotente(vista):
+    """Guarda la respuesta 2xx de la vista por Idempotency-Key (sin la cabecera no hace nada)."""
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        clave = request.headers.get(CABECERA)
+        if not clave:
+            return vista(request, *args, **kwargs)
+        if len(clave) > LARGO_MAXIMO:
+            return JsonResponse({"error": f"{CABECERA} admite hasta {LARGO_MAXIMO} caracteres."}, status=400)
+
+        huella_actual = huella(request.body)
+        # La clave, la ruta y el autor forman el identificador: la misma clave
+        # en otra ruta o de otro autor es otra operación y no debe devolver
+        # esta respuesta
+        autor = getattr(getattr(request, 'autor_api', None), 'pk', '')
+        clave = f'{request.path}:{autor}:{clave}'[:LARGO_MAXIMO]
+        with transaction.atomic():
+            limite = timezone.now() - vigencia()
+            registro = SolicitudIdempotente.objects.filter(clave=clave).first()
+            if registro is not None and registro.fecha_creacion < limite:
+                registro.delete()
+                registro = None
+            if registro is not None:
+                return repetir(registro, huella_actual)
+            try:
+                with transaction.atomic():
+                    # Reserva la clave: una solicitud concurrente con la misma
+                    # clave espera aquí y luego recibe la respuesta guardada
+                    registro = SolicitudIdempotente.objects.create(
+                        clave=clave, ruta=request.path, huella=huella_actual,
+                    )
+            except IntegrityError:
+                return repetir(SolicitudIdempotente.objects.get(clave=clave), huella_actual)
+
+            respuesta = vista(request, *args, **kwargs)
+            if not 200 <= respuesta.status_code < 300 or respuesta.streaming:
+                # Deshace la reserva (y lo que haya escrito la vista)
+                transaction.set_rollback(True)
+                return respuesta
+            registro.estado_http = respuesta.status_code
+            registro.tipo_contenido = respuesta.get('Content-Type', '')
+            registro.contenido = respuesta.content.decode(respuesta.charset)
+            registro.save(update_fields=['estado_http', 'tipo_contenido', 'contenido'])
+            SolicitudIdempotente.objects.filter(fecha_creacion__lt=limite).delete()
+        return respuesta
+
+    return envoltura
@@ -0,0 +1,509 @@
+# predicciones/services/instantanea.py
+"""
+Copia en memoria (por proceso) de las predicciones completadas, en columnas
+NumPy, para los promedios por región y por tipo de árbol de las páginas de
+detalle, análisis y comparación.
+
+La copia se carga al iniciar el worker (precargar) o, si no, en la primera
+consulta. Después, como máximo cada SNAPSHOT_REFRESH_SECONDS, un hilo en
+segundo plano lee solo lo que cambió, mientras las solicitudes siguen
+usando la copia vigente: las filas con fecha_actualizacion desde la última
+vista (la marca) menos SNAPSHOT_MARGIN_SECONDS, para no saltarse
+transacciones confirmadas tarde; las filas con id mayor que el último visto
+(las insertadas con fechas antiguas), y los ids del registro de borrados
+(PrediccionEliminada, que llena una señal post_delete). Las tres consultas
+usan índices; ninguna recorre la tabla. Las predicciones que dejaron de
+estar completadas salen de la copia.
+
+Para los percentiles se guardan además, por métrica y celda (tipo de árbol,
+región), los valores ordenados; una actualización pequeña inserta y quita
+valores con búsqueda binaria en lugar de reordenar todo.
+
+Los cambios hechos con QuerySet.update() sin tocar fecha_actualizacion no
+se ven hasta que el proceso reinicia.
+"""
+import datetime
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max
+from django.db.models.functions import Coalesce
+
+from ..models import Prediccion, PrediccionEliminada
+from . import similares
+
+# Columna -> dtype (las de texto no se guardan: los nombres se resuelven
+# aparte y las de choices se guardan como la posición de la opción)
+COLUMNAS = {
+    'id': np.int64,
+    'tipo_arbol_id': np.int64,
+    'region_id': np.int64,
+    'hectareas': np.float64,
+    'produccion_por_hectarea': np.float64,
+    'roi_proyectado': np.float64,
+    'inversion_estimada': np.float64,
+    'consumo_agua_por_hectarea': np.float64,
+    'consumo_agua_total': np.float64,
+    'van': np.float64,
+    'tir': np.float64,
+    # Para services/similares
+    'edad_arboles': np.int64,
+    'densidad_plantacion': np.int64,
+    'tipo_riego': np.int64,
+    'tipo_suelo': np.int64,
+    'fertilizacion': np.int64,
+    'latitud': np.float64,
+    'longitud': np.float64,
+}
+SIN_REGION = -1  # region_id nulo (las columnas enteras no admiten NaN)
+TODOS = object()  # en Columnas.agrupar: sin filtrar por esa clave
+
+# Métricas con percentil -> nombre (en todas, más es mejor)
+METRICAS_PERCENTIL = {
+    'roi_proyectado': 'ROI proyectado (%)',
+    'produccion_por_hectarea': 'Producción (ton/ha)',
+    'eficiencia_agua': 'Eficiencia hídrica (kg/m³)',
+}
+# Sobre esta cantidad de filas cambiadas se reordena todo en vez de insertar una a una
+MAX_CAMBIOS_INCREMENTALES = 2000
+
+
+def codigo(campo, valor):
+    """Posición de `valor` entre las choices de `campo` (-1 si no está)."""
+    opciones = [opcion for opcion, _ in Prediccion._meta.get_field(campo).choices]
+    return opciones.index(valor) if valor in opciones else -1
+
+
+def _columnas(filas):
+    """Lista de tuplas de values_list -> dict de arreglos por columna."""
+    matriz = np.array(filas, dtype=object).reshape(-1, len(COLUMNAS))
+    for i, nombre in enumerate(COLUMNAS):
+        if nombre in similares.CATEGORIAS and len(matriz):
+            valores, posiciones = np.unique(matriz[:, i].astype(str), return_inverse=True)
+            matriz[:, i] = np.array([codigo(nombre, v) for v in valores])[posiciones.reshape(-1)]
+    matriz = matriz.astype(float)  # None -> nan
+    datos = {}
+    for i, (nombre, tipo) in enumerate(COLUMNAS.items()):
+        columna = matriz[:, i]
+        if tipo is not np.float64:
+            columna = np.where(np.isnan(columna), SIN_REGION, columna).astype(tipo)
+        datos[nombre] = np.ascontiguousarray(columna)
+    return datos
+
+
+def _metrica(datos, nombre):
+    """Arreglo con los valores de una métrica de percentil (nan si no tiene)."""
+    if nombre != 'eficiencia_agua':
+        return datos[nombre]
+    agua = datos['consumo_agua_por_hectarea']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(agua > 0, datos['produccion_por_hectarea'] * 1000 / agua, np.nan)
+
+
+def valor_metrica(prediccion, nombre):
+    """Valor de una métrica de percentil para una instancia (None si no tiene)."""
+    if nombre != 'eficiencia_agua':
+        return getattr(prediccion, nombre)
+    produccion, agua = prediccion.produccion_por_hectarea, prediccion.consumo_agua_por_hectarea
+    # Misma operación que _metrica, para que el valor coincida con el de la copia
+    return produccion * 1000 / agua if produccion is not None and agua else None
+
+
+def _ordenar(datos):
+    """{métrica: {(tipo_arbol_id, region_id): valores ordenados}}, sin nulos."""
+    ordenados = {}
+    for nombre in METRICAS_PERCENTIL:
+        valores = _metrica(datos, nombre)
+        validos = ~np.isnan(valores)
+        tipos, regiones, valores = datos['tipo_arbol_id'][validos], datos['region_id'][validos], valores[validos]
+        orden = np.lexsort((valores, regiones, tipos))
+        tipos, regiones, valores = tipos[orden], regiones[orden], valores[orden]
+        cortes = np.flatnonzero((np.diff(tipos) != 0) | (np.diff(regiones) != 0)) + 1
+        inicios, fines = np.r_[0, cortes], np.r_[cortes, len(valores)]
+        ordenados[nombre] = {
+            (int(tipos[i]), int(regiones[i])): valores[i:j] for i, j in zip(inicios.tolist(), fines.tolist()) if j > i
+        }
+    return ordenados
+
+
+def _actualizar_ordenados(ordenados, agregadas, quitadas):
+    """
+    Copia de `ordenados` con las filas agregadas y quitadas (dicts de
+    columnas). Los arreglos no se modifican: np.insert/np.delete crean otros,
+    así las Columnas anteriores siguen siendo válidas.
+    """
+    nuevos = {}
+    for nombre, celdas in ordenados.items():
+        celdas = dict(celdas)
+        for filas, agregar in ((agregadas, True), (quitadas, False)):
+            claves = zip(filas['tipo_arbol_id'].tolist(), filas['region_id'].tolist(), _metrica(filas, nombre).tolist())
+            for tipo, region, valor in claves:
+                if np.isnan(valor):
+                    continue
+                actual = celdas.get((tipo, region), np.empty(0))
+                posicion = np.searchsorted(actual, valor)
+                if agregar:
+                    actual = np.insert(actual, posicion, valor)
+                elif posicion < len(actual) and actual[posicion] == valor:
+                    actual = np.delete(actual, posicion)
+                if len(actual):
+                    celdas[(tipo, region)] = actual
+                else:
+                    celdas.pop((tipo, region), None)
+        nuevos[nombre] = celdas
+    return nuevos
+
+
+class Columnas:
+    """
+    Vista inmutable de la copia (una actualización posterior crea otra).
+
+    Además de las columnas guarda, para cada medida, la suma y la cantidad
+    de valores no nulos por celda (tipo de árbol x región). Los promedios
+    agrupados se obtienen sumando filas o columnas de esa matriz, sin
+    recorrer las predicciones.
+    """
+
+    def __init__(self, datos, ordenados=None, bloques=None):
+        self.datos = datos
+        self.ordenados = ordenados if ordenados is not None else _ordenar(datos)
+        self.bloques = bloques if bloques is not None else similares.construir(datos)
+        self.tipos, codigo_tipo = np.unique(datos['tipo_arbol_id'], return_inverse=True)
+        self.regiones, codigo_region = np.unique(datos['region_id'], return_inverse=True)
+        forma = (len(self.tipos), len(self.regiones))
+        celda = codigo_tipo * forma[1] + codigo_region
+        self.cuentas = np.bincount(celda, minlength=forma[0] * forma[1]).reshape(forma)
+        self.sumas, self.validos = {}, {}
+        for nombre, tipo in COLUMNAS.items():
+            if tipo is not np.float64:
+                continue
+            valores = datos[nombre]
+            validos = ~np.isnan(valores)
+            self.sumas[nombre] = np.bincount(
+                celda, weights=np.where(validos, valores, 0.0), minlength=forma[0] * forma[1],
+            ).reshape(forma)
+            self.validos[nombre] = np.bincount(celda, weights=validos, minlength=forma[0] * forma[1]).reshape(forma)
+
+    def __len__(self):
+        return len(self.datos['id'])
+
+    def fila(self, id_prediccion):
+        """Posición de una predicción en las columnas, o None si no está."""
+        posicion = np.searchsorted(self.datos['id'], id_prediccion)
+        if posicion < len(self) and self.datos['id'][posicion] == id_prediccion:
+            return int(posicion)
+        return None
+
+    def agrupar(self, clave, promedios, tipo_arbol=TODOS, region=TODOS, excluir_tipo=None,
+                excluir_id=None, ordenar_por=None, limite=None, contar=None):
+        """
+        Equivalente en memoria de
+        filter(estado='completada', tipo_arbol=..., region=...).exclude(...)
+        .values(clave).annotate(Avg(...), Count('id')).order_by('-ordenar_por')[:limite].
+
+        `clave` es 'tipo_arbol' o 'region' y `promedios` {nombre: columna}.
+        Los promedios ignoran los nulos como Avg y los grupos sin valor para
+        `ordenar_por` van al final. region=None filtra las predicciones sin
+        región; sin indicarla no se filtra.
+        """
+        tipos = np.ones(len(self.tipos), dtype=bool)
+        if tipo_arbol is not TODOS:
+            tipos &= self.tipos == tipo_arbol
+        if excluir_tipo is not None:
+            tipos &= self.tipos != excluir_tipo
+        regiones = np.ones(len(self.regiones), dtype=bool)
+        if region is not TODOS:
+            regiones &= self.regiones == (SIN_REGION if region is None else region)
+
+        # Se suma sobre la dimensión que no es la clave
+        eje = 1 if clave == 'tipo_arbol' else 0
+        seleccion = np.ix_(tipos, regiones)
+        etiquetas = self.tipos[tipos] if clave == 'tipo_arbol' else self.regiones[regiones]
+        cuentas = self.cuentas[seleccion].sum(axis=eje)
+        sumas = {c: self.sumas[c][seleccion].sum(axis=eje) for c in promedios.values()}
+        validos = {c: self.validos[c][seleccion].sum(axis=eje) for c in promedios.values()}
+
+        # La predicción excluida se descuenta de su grupo si cae en la selección
+        posicion = self.fila(excluir_id) if excluir_id is not None else None
+        if posicion is not None:
+            tipo, reg = self.datos['tipo_arbol_id'][posicion], self.datos['region_id'][posicion]
+            if tipos[np.searchsorted(self.tipos, tipo)] and regiones[np.searchsorted(self.regiones, reg)]:
+                grupo = np.flatnonzero(etiquetas == (tipo if clave == 'tipo_arbol' else reg))[0]
+                cuentas[grupo] -= 1
+                for columna in sumas:
+                    valor = self.datos[columna][posicion]
+                    if not np.isnan(valor):
+                        sumas[columna][grupo] -= valor
+                        validos[columna][grupo] -= 1
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            resultados = {
+                nombre: np.where(validos[c] > 0, sumas[c] / validos[c], np.nan) for nombre, c in promedios.items()
+            }
+        if contar:
+            resultados[contar] = cuentas
+
+        orden = np.flatnonzero(cuentas > 0)
+        if ordenar_por:
+            valores = resultados[ordenar_por][orden]
+            orden = orden[np.lexsort((-np.nan_to_num(valores, nan=0.0), np.isnan(valores)))]
+        if limite is not None:
+            orden = orden[:limite]
+
+        filas = []
+        for i in orden.tolist():
+            fila = {clave: None if etiquetas[i] == SIN_REGION else int(etiquetas[i])}
+            for nombre, valores in resultados.items():
+                valor = valores[i].item()
+                fila[nombre] = None if isinstance(valor, float) and np.isnan(valor) else valor
+            filas.append(fila)
+        return filas
+
+    def percentil(self, metrica, valor, tipo_arbol, region):
+        """
+        Posición de `valor` entre las predicciones completadas del mismo
+        tipo de árbol y región (region=None: las sin región), por búsqueda
+        binaria en los valores ordenados de esa celda.
+
+        Devuelve {'percentil', 'top', 'posicion', 'total'} o None si no hay
+        valor o pares: percentil es el porcentaje de pares bajo el valor
+        (los empates cuentan la mitad), posicion el lugar en el ranking
+        (1 = mejor; los empatados comparten el mejor puesto) y top la
+        posición como porcentaje del total ("top 15%").
+        """
+        if valor is None or np.isnan(valor):
+            return None
+        pares = self.ordenados[metrica].get((tipo_arbol, SIN_REGION if region is None else region))
+        if pares is None:
+            return None
+        total = len(pares)
+        menores = int(np.searchsorted(pares, valor, side='left'))
+        hasta_iguales = int(np.searchsorted(pares, valor, side='right'))
+        posicion = total - hasta_iguales + 1
+        return {
+            'percentil': (menores + (hasta_iguales - menores) / 2) / total * 100,
+            'top': posicion / total * 100,
+            'posicion': posicion,
+            'total': total,
+        }
+
+    def percentiles(self, prediccion):
+        """
+        Percentil de cada métrica de una predicción frente a su tipo de
+        árbol y región: lista de {'metrica', 'nombre', 'valor', 'percentil',
+        'top', 'posicion', 'total'} (los cuatro últimos None sin pares).
+        """
+        filas = []
+        for metrica, nombre in METRICAS_PERCENTIL.items():
+            valor = valor_metrica(prediccion, metrica)
+            resultado = self.percentil(metrica, valor, prediccion.tipo_arbol_id, prediccion.region_id)
+            filas.append({
+                'metrica': metrica, 'nombre': nombre, 'valor': valor,
+                **(resultado or dict.fromkeys(('percentil', 'top', 'posicion', 'total'))),
+            })
+        return filas
+
+    def similares(self, prediccion, k=10, misma_especie=True):
+        """
+        Las k predicciones completadas más parecidas a `prediccion` (sin
+        contarla): lista de (id, distancia), de la más parecida a la menos.
+        """
+        posicion = self.fila(prediccion.id)
+        if posicion is not None:
+            fila = {n: self.datos[n][posicion:posicion + 1] for n in COLUMNAS}
+        else:
+            comuna = prediccion.comuna
+            fila = {n: np.array([getattr(prediccion, n)]) for n in ('hectareas', 'edad_arboles', 'densidad_plantacion')}
+            fila['latitud'] = np.array([comuna.latitud if comuna.latitud is not None else comuna.region.latitud], dtype=float)
+            fila['longitud'] = np.array([comuna.longitud if comuna.longitud is not None else comuna.region.longitud], dtype=float)
+        consulta = similares.caracteristicas(
+            fila['hectareas'], fila['edad_arboles'], fila['densidad_plantacion'], fila['latitud'], fila['longitud'],
+        )[0]
+        return similares.buscar(
+            self.bloques, prediccion.tipo_arbol_id,
+            [codigo(c, getattr(prediccion, c)) for c in similares.CATEGORIAS],
+            consulta, k=k, misma_especie=misma_especie, excluir_id=prediccion.id,
+        )
+
+
+class Instantanea:
+    """Columnas de las predicciones completadas, ordenadas por id."""
+
+    def __init__(self):
+        self.datos = _columnas([])
+        self.ordenados = _ordenar(self.datos)
+        self.bloques = similares.construir(self.datos)
+        self.columnas = Columnas(self.datos, self.ordenados, self.bloques)
+        self.cargada = False
+        self.marca = None
+        self.ultimo_id = 0
+        self.ultimo_borrado = 0
+        self.revisada = 0.0
+        self._candado = threading.Lock()
+        # Aparte del anterior, que el hilo mantiene durante toda la carga
+        self._candado_hilo = threading.Lock()
+        self._hilo = None
+
+    def _consulta(self):
+        # Sin alias fijo: el router lee de la réplica solo dentro de
+        # usar_replica, así las vistas que acaban de escribir leen del primario.
+        # Ubicación de la comuna o, si no la tiene, la de su región
+        return Prediccion.objects.order_by().annotate(
+            latitud=Coalesce('comuna__latitud', 'region__latitud'),
+            longitud=Coalesce('comuna__longitud', 'region__longitud'),
+        )
+
+    def actualizar(self, forzar=False):
+        """
+        Devuelve las Columnas vigentes. Sin copia cargada (o con `forzar`) la
+        carga o actualiza antes de volver; si no, a lo más una vez cada
+        SNAPSHOT_REFRESH_SECONDS, lanza la actualización en segundo plano.
+        """
+        if forzar or not self.cargada:
+            with self._candado:
+                if forzar or not self.cargada:
+                    self._refrescar()
+            return self.columnas
+        intervalo = getattr(settings, 'SNAPSHOT_REFRESH_SECONDS', 5)
+        if time.monotonic() - self.revisada >= intervalo:
+            self.en_segundo_plano()
+        return self.columnas
+
+    def en_segundo_plano(self):
+        """Lanza la carga o actualización en un hilo, si no hay otro en curso."""
+        with self._candado_hilo:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._hilo = threading.Thread(target=self._refrescar_en_hilo, name='instantanea', daemon=True)
+            self._hilo.start()
+
+    def _refrescar_en_hilo(self):
+        try:
+            with self._candado:
+                self._refrescar()
+        finally:
+            # Las conexiones son por hilo: las de este no las cierra nadie más
+            connections.close_all()
+
+    def _refrescar(self):
+        consulta = self._consulta()
+        if not self.cargada:
+            self._cargar(consulta)
+            cambio = True
+        else:
+            cambio = self._aplicar_cambios(consulta)
+        if cambio:
+            self.columnas = Columnas(self.datos, self.ordenados, self.bloques)
+        self.revisada = time.monotonic()
+
+    def reiniciar_tras_fork(self):
+        # Un fork con el hilo a medio cargar dejaría el candado tomado para siempre
+        self._candado = threading.Lock()
+        self._candado_hilo = threading.Lock()
+        self._hilo = None
+
+    def _cargar(self, consulta):
+        # Las marcas se leen antes que las filas: lo que llegue entre medio se
+        # relee en la próxima actualización
+        marca = consulta.aggregate(m=Max('fecha_actualizacion'))['m']
+        self.ultimo_id = Prediccion.objects.aggregate(m=Max('id'))['m'] or 0
+        self.ultimo_borrado = PrediccionEliminada.objects.aggregate(m=Max('id'))['m'] or 0
+        filas = consulta.filter(estado='completada').order_by('id').values_list(*COLUMNAS)
+        self.datos = _columnas(list(filas))
+        self.ordenados = _ordenar(self.datos)
+        self.bloques = similares.construir(self.datos)
+        self.marca = marca
+        self.cargada = True
+
+    def _aplicar_cambios(self, consulta):
+        """Lleva la copia a la marca actual; devuelve False si no cambió nada."""
+        borrados = list(
+            PrediccionEliminada.objects.filter(id__gt=self.ultimo_borrado).values_list('id', 'prediccion_id')
+        )
+        # Se relee desde un margen antes de la marca: una transacción lenta
+        # puede confirmar filas con una fecha anterior a la última lectura
+        margen = datetime.timedelta(seconds=getattr(settings, 'SNAPSHOT_MARGIN_SECONDS', 60))
+        campos = ('fecha_actualizacion', 'estado', *COLUMNAS)
+        leidas = {fila[2]: fila for fila in consulta.filter(id__gt=self.ultimo_id).values_list(*campos)}
+        if self.marca is not None:
+            leidas.update(
+                (fila[2], fila) for fila in
+                consulta.filter(fecha_actualizacion__gte=self.marca - margen).values_list(*campos)
+            )
+        if leidas:
+            ultima = max(fila[0] for fila in leidas.values())
+            self.marca = max(self.marca, ultima) if self.marca is not None else ultima
+            self.ultimo_id = max(self.ultimo_id, max(leidas))
+        if borrados:
+            self.ultimo_borrado = max(b[0] for b in borrados)
+
+        datos, agregadas, quitadas = _reemplazar(
+            self.datos, list(leidas) + [b[1] for b in borrados],
+            [fila[2:] for fila in leidas.values() if fila[1] == 'completada'],
+        )
+        if not len(agregadas['id']) and not len(quitadas['id']):
+            return False
+        if len(agregadas['id']) + len(quitadas['id']) > MAX_CAMBIOS_INCREMENTALES:
+            self.ordenados = _ordenar(datos)
+            self.bloques = similares.construir(datos)
+        else:
+            self.ordenados = _actualizar_ordenados(self.ordenados, agregadas, quitadas)
+            self.bloques = similares.actualizar(self.bloques, agregadas, quitadas)
+        self.datos = datos
+        return True
+
+
+def _reemplazar(datos, ids_leidos, completadas):
+    """
+    Reemplaza en `datos` las filas de `ids_leidos` por `completadas` (tuplas
+    de values_list, solo las que siguen completadas). Las filas releídas sin
+    cambios (las del margen, casi siempre) no cuentan como cambio.
+    Devuelve (datos, agregadas, quitadas).
+    """
+    nuevas = _columnas(sorted(completadas))
+    if len(nuevas['id']):
+        posiciones = np.minimum(np.searchsorted(datos['id'], nuevas['id']), max(len(datos['id']) - 1, 0))
+        iguales = datos['id'][posiciones] == nuevas['id'] if len(datos['id']) else np.zeros(len(nuevas['id']), bool)
+        for nombre in COLUMNAS:
+            actual, nuevo = datos[nombre][posiciones[iguales]], nuevas[nombre][iguales]
+            mismos = actual == nuevo
+            if actual.dtype.kind == 'f':
+                mismos |= np.isnan(actual) & np.isnan(nuevo)
+            iguales[iguales] = mismos
+        sin_cambio = nuevas['id'][iguales]
+        nuevas = {n: v[~iguales] for n, v in nuevas.items()}
+    else:
+        sin_cambio = np.empty(0, dtype=np.int64)
+    ids_cambiados = np.setdiff1d(np.asarray(ids_leidos, dtype=np.int64), sin_cambio)
+    salen = np.isin(datos['id'], ids_cambiados)
+    quitadas = {n: v[salen] for n, v in datos.items()}
+    if not len(nuevas['id']) and not salen.any():
+        return datos, nuevas, quitadas
+    datos = {n: np.concatenate([datos[n][~salen], nuevas[n]]) for n in COLUMNAS}
+    orden = np.argsort(datos['id'], kind='stable')
+    return {n: v[orden] for n, v in datos.items()}, nuevas, quitadas
+
+
+_instantanea = Instantanea()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_instantanea.reiniciar_tras_fork)
+
+
+def obtener():
+    """Columnas del proceso, actualizadas si corresponde."""
+    return _instantanea.actualizar()
+
+
+def sincronizar():
+    """Carga o actualiza la copia antes de volver (comandos y benchmarks)."""
+    return _instantanea.actualizar(forzar=True)
+
+
+def precargar():
+    """Carga la copia en segundo plano al iniciar el worker (SNAPSHOT_PRELOAD)."""
+    if getattr(settings, 'SNAPSHOT_PRELOAD', True):
+        _instantanea.en_segundo_plano()
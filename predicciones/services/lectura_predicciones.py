@@ -0,0 +1,109 @@
+# predicciones/services/lectura_predicciones.py
+"""
+Lectura liviana de predicciones para la API JSON.
+
+Cada campo público se traduce a una ruta del ORM y la consulta es un
+values_list() con solo las columnas pedidas (y solo los JOIN que esas
+columnas necesitan): no se instancian modelos ni se renderizan plantillas.
+La serialización usa orjson cuando está instalado.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from ..models import Prediccion
+
+try:
+    import orjson
+except ImportError:  # la API funciona igual, solo más lenta
+    orjson = None
+
+# Campo público -> ruta en Prediccion
+CAMPOS = {
+    'id': 'id',
+    'tipo_arbol': 'tipo_arbol__tipo',
+    'tipo_arbol_id': 'tipo_arbol_id',
+    'comuna': 'comuna__nombre',
+    'comuna_id': 'comuna_id',
+    'region': 'region__nombre',
+    'region_id': 'region_id',
+    'hectareas': 'hectareas',
+    'edad_arboles': 'edad_arboles',
+    'densidad_plantacion': 'densidad_plantacion',
+    'tipo_riego': 'tipo_riego',
+    'tipo_suelo': 'tipo_suelo',
+    'fertilizacion': 'fertilizacion',
+    'estado': 'estado',
+    'produccion_total': 'produccion_total',
+    'produccion_por_hectarea': 'produccion_por_hectarea',
+    'confiabilidad': 'confiabilidad',
+    'inversion_estimada': 'inversion_estimada',
+    'ingresos_proyectados_5anos': 'ingresos_proyectados_5anos',
+    'roi_proyectado': 'roi_proyectado',
+    'consumo_agua_total': 'consumo_agua_total',
+    'consumo_agua_por_hectarea': 'consumo_agua_por_hectarea',
+    'van': 'van',
+    'tir': 'tir',
+    'periodo_recuperacion': 'periodo_recuperacion',
+    'flujos_caja': 'flujos_caja',
+    'fecha_creacion': 'fecha_creacion',
+    'fecha_actualizacion': 'fecha_actualizacion',
+}
+# Sin fields=: todo menos los flujos anuales (el campo más pesado)
+CAMPOS_DEFECTO = tuple(c for c in CAMPOS if c != 'flujos_caja')
+
+FILTROS = {'estado': 'estado', 'tipo_arbol': 'tipo_arbol_id', 'comuna': 'comuna_id', 'region': 'region_id'}
+
+LIMITE_DEFECTO = 100
+LIMITE_MAXIMO = 10000
+
+
+def campos_pedidos(texto):
+    """'id,roi_proyectado' -> ('id', 'roi_proyectado'); lanza ValueError con campos desconocidos."""
+    if not texto:
+        return CAMPOS_DEFECTO
+    campos = tuple(dict.fromkeys(c.strip() for c in texto.split(',') if c.strip()))
+    desconocidos = [c for c in campos if c not in CAMPOS]
+    if desconocidos or not campos:
+        raise ValueError(f"Campos desconocidos: {', '.join(desconocidos) or '(vacío)'}. Disponibles: {', '.join(CAMPOS)}.")
+    return campos
+
+
+def consultar(campos, filtros=None, ids=None, despues_de=None, limite=LIMITE_DEFECTO):
+    """
+    Página de predicciones ordenada por id (paginación por cursor).
+
+    Devuelve (filas, siguiente): las filas como dicts con `campos` y el id a
+    pasar como `despues_de` para la página siguiente (None si no hay más).
+    """
+    if not 1 <= limite <= LIMITE_MAXIMO:
+        raise ValueError(f"'limite' debe estar entre 1 y {LIMITE_MAXIMO}.")
+    consulta = Prediccion.objects.order_by('id')
+    for nombre, valor in (filtros or {}).items():
+        consulta = consulta.filter(**{FILTROS[nombre]: valor})
+    if ids is not None:
+        consulta = consulta.filter(id__in=ids)
+    if despues_de is not None:
+        consulta = consulta.filter(id__gt=despues_de)
+
+    # El id siempre se lee para calcular el cursor, aunque no se haya pedido
+    rutas = [CAMPOS[c] for c in campos]
+    con_id = 'id' in campos
+    if not con_id:
+        rutas.append('id')
+    filas = list(consulta.values_list(*rutas)[:limite + 1])
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = filas[-1][-1 if not con_id else campos.index('id')]
+    if con_id:
+        return [dict(zip(campos, fila)) for fila in filas], siguiente
+    return [dict(zip(campos, fila[:-1])) for fila in filas], siguiente
+
+
+def serializar(datos):
+    """JSON en bytes (orjson si está disponible)."""
+    if orjson is not None:
+        return orjson.dumps(datos)
+    return json.dumps(datos, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
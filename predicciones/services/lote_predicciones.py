@@ -0,0 +1,113 @@
+# predicciones/services/lote_predicciones.py
+"""
+Creación de muchas predicciones en una sola solicitud.
+
+Valida cada fila con las mismas reglas que PrediccionForm (campos, choices y
+rangos del modelo) pero con una sola consulta por tabla de referencia,
+puntúa el lote con el modelo vectorizado y lo guarda con bulk_create.
+"""
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from ..models import Comuna, Prediccion, TipoArbol
+from . import datos_sinteticos, puntaje, tendencias
+
+# Los mismos campos que PrediccionForm
+CAMPOS = (
+    'tipo_arbol', 'comuna', 'hectareas', 'edad_arboles',
+    'densidad_plantacion', 'tipo_riego', 'tipo_suelo', 'fertilizacion',
+)
+CAMPOS_REFERENCIA = ('tipo_arbol', 'comuna')
+MAX_FILAS = 1000
+
+
+def _clave(campo, valor):
+    """Id de una referencia (tipo_arbol/comuna); lanza ValidationError si no es un entero."""
+    if valor in (None, ''):
+        raise ValidationError('Este campo es obligatorio.')
+    return Prediccion._meta.get_field(campo).target_field.to_python(valor)
+
+
+def validar(filas):
+    """
+    Valida una lista de dicts de entrada.
+
+    Devuelve (limpias, tipos, regiones_por_comuna, errores): las filas con
+    los valores ya convertidos, los TipoArbol por id, la región de cada
+    comuna usada y una lista {"fila": i, "errores": {campo: [mensajes]}}.
+    Lanza ValueError si el cuerpo no es una lista válida.
+    """
+    if not isinstance(filas, list) or not filas:
+        raise ValueError("Debe enviar una lista no vacía de predicciones.")
+    if len(filas) > MAX_FILAS:
+        raise ValueError(f"Máximo {MAX_FILAS} predicciones por solicitud (recibidas {len(filas)}).")
+
+    # Una consulta por tabla de referencia para todo el lote
+    ids_comuna = set()
+    for fila in filas:
+        if isinstance(fila, dict):
+            try:
+                ids_comuna.add(_clave('comuna', fila.get('comuna')))
+            except ValidationError:
+                pass
+    tipos = TipoArbol.objects.in_bulk()
+    regiones = dict(Comuna.objects.filter(pk__in=ids_comuna).values_list('pk', 'region_id'))
+    existentes = {'tipo_arbol': tipos, 'comuna': regiones}
+
+    limpias, errores = [], []
+    for i, fila in enumerate(filas):
+        if not isinstance(fila, dict):
+            errores.append({'fila': i, 'errores': {'__all__': ['Cada predicción debe ser un objeto JSON.']}})
+            continue
+        limpia, errores_fila = {}, {}
+        for campo in CAMPOS:
+            try:
+                if campo in CAMPOS_REFERENCIA:
+                    valor = _clave(campo, fila.get(campo))
+                    if valor not in existentes[campo]:
+                        raise ValidationError(f'No existe {campo} con id {valor}.')
+                else:
+                    valor = Prediccion._meta.get_field(campo).clean(fila.get(campo), None)
+            except ValidationError as e:
+                errores_fila[campo] = e.messages
+                continue
+            limpia[campo] = valor
+        if errores_fila:
+            errores.append({'fila': i, 'errores': errores_fila})
+        limpias.append(limpia)
+    return limpias, tipos, regiones, errores
+
+
+def crear(limpias, tipos, regiones, usuario, rng=None):
+    """Puntúa y guarda filas validadas; devuelve las instancias creadas (con pk)."""
+    lista_tipos = list(tipos.values())
+    posicion = {t.pk: i for i, t in enumerate(lista_tipos)}
+    entradas = {
+        'tipo_idx': np.array([posicion[f['tipo_arbol']] for f in limpias]),
+        'hectareas': np.array([f['hectareas'] for f in limpias], dtype=float),
+        'edad_arboles': np.array([f['edad_arboles'] for f in limpias]),
+        'densidad_plantacion': np.array([f['densidad_plantacion'] for f in limpias]),
+        'tipo_riego': np.array([f['tipo_riego'] for f in limpias], dtype=object),
+        'tipo_suelo': np.array([f['tipo_suelo'] for f in limpias], dtype=object),
+        'fertilizacion': np.array([f['fertilizacion'] for f in limpias], dtype=object),
+    }
+    resultado = datos_sinteticos.puntuar_entradas(entradas, lista_tipos, rng or np.random.default_rng())
+
+    objetos = []
+    for i, fila in enumerate(limpias):
+        prediccion = Prediccion(
+            usuario=usuario,
+            tipo_arbol_id=fila['tipo_arbol'],
+            comuna_id=fila['comuna'],
+            region_id=regiones[fila['comuna']],
+            **{campo: fila[campo] for campo in CAMPOS if campo not in CAMPOS_REFERENCIA},
+        )
+        puntaje.asignar_fila(prediccion, resultado, i)
+        objetos.append(prediccion)
+
+    with transaction.atomic():
+        Prediccion.objects.bulk_create(objetos)
+        # bulk_create no emite post_save: los resúmenes se actualizan aquí
+        tendencias.aplicar(tendencias.acumular(objetos))
+    return objetos
@@ -0,0 +1,141 @@
+# predicciones/services/metricas.py
+"""
+Métricas de rendimiento en memoria con salida en formato de texto Prometheus.
+
+Registra histogramas de latencia por vista (nombre de URL), cantidad y
+tiempo de consultas SQL por request y duración de las llamadas HTTP
+salientes (OpenRouter, FastAPI). El registro es por proceso: con varios
+workers cada uno expone sus propias series.
+
+Todo queda desactivado salvo que settings.METRICS_ENABLED sea True; en ese
+caso el middleware se descarta al arrancar y `medir_http` no mide nada.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Límites superiores (le) de los buckets
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+METRICAS = {
+    'agropredict_request_duration_seconds': (
+        'Latencia de las vistas por nombre de URL', BUCKETS_SEGUNDOS),
+    'agropredict_request_db_queries': (
+        'Consultas SQL ejecutadas por request', BUCKETS_CONSULTAS),
+    'agropredict_request_db_duration_seconds': (
+        'Tiempo total en consultas SQL por request', BUCKETS_SEGUNDOS),
+    'agropredict_http_client_duration_seconds': (
+        'Duración de las llamadas HTTP salientes', BUCKETS_SEGUNDOS),
+}
+
+
+def habilitado():
+    return getattr(settings, 'METRICS_ENABLED', False)
+
+
+class Histograma:
+    """Conteos por bucket (no acumulados), suma y total de observaciones."""
+    __slots__ = ('limites', 'conteos', 'suma', 'total')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.conteos = [0] * (len(limites) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.conteos[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+
+class Registro:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observar(self, nombre, etiquetas, valor):
+        """Agrega una observación a la serie `nombre` con las etiquetas dadas."""
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = Histograma(METRICAS[nombre][1])
+            serie.observar(valor)
+
+    def limpiar(self):
+        with self._lock:
+            self._series.clear()
+
+    def exportar(self):
+        """Texto en formato de exposición Prometheus 0.0.4."""
+        with self._lock:
+            copia = {
+                clave: (list(h.conteos), h.suma, h.total, h.limites)
+                for clave, h in self._series.items()
+            }
+
+        lineas = []
+        for nombre, (ayuda, _) in METRICAS.items():
+            series = sorted((etq, datos) for (n, etq), datos in copia.items() if n == nombre)
+            if not series:
+                continue
+            lineas.append(f'# HELP {nombre} {ayuda}')
+            lineas.append(f'# TYPE {nombre} histogram')
+            for etiquetas, (conteos, suma, total, limites) in series:
+                base = ','.join(f'{k}="{_escapar(v)}"' for k, v in etiquetas)
+                prefijo = base + ',' if base else ''
+                acumulado = 0
+                for limite, conteo in zip(limites + ('+Inf',), conteos):
+                    acumulado += conteo
+                    lineas.append(f'{nombre}_bucket{{{prefijo}le="{limite}"}} {acumulado}')
+                llaves = f'{{{base}}}' if base else ''
+                lineas.append(f'{nombre}_sum{llaves} {suma:.6f}')
+                lineas.append(f'{nombre}_count{llaves} {total}')
+        return '\n'.join(lineas) + '\n'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registro = Registro()
+
+
+class ContadorConsultas:
+    """execute_wrapper que cuenta y cronometra las consultas SQL."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+@contextmanager
+def medir_http(servicio):
+    """Cronometra una llamada HTTP saliente; resultado 'ok' o 'error'."""
+    if not habilitado():
+        yield
+        return
+    inicio = time.perf_counter()
+    resultado = 'error'
+    try:
+        yield
+        resultado = 'ok'
+    finally:
+        registro.observar(
+            'agropredict_http_client_duration_seconds',
+            {'servicio': servicio, 'resultado': resultado},
+            time.perf_counter() - inicio,
+        )
@@ -0,0 +1,177 @@
+# predicciones/services/optimizador.py
+"""
+Optimizador de cartera de cultivos con restricciones de tierra y agua.
+
+Cada opción es un par (tipo de árbol, comuna) con su rendimiento, ganancia
+anual y consumo de agua por hectárea. La asignación resuelve la relajación
+lineal
+
+    max  Σ valor_i · x_i
+    s.a. Σ x_i ≤ hectáreas,  Σ agua_i · x_i ≤ agua_m3,  0 ≤ x_i ≤ límite_i
+
+mediante un precio sombra del agua (relajación lagrangiana): para un precio
+μ la mejor asignación es un llenado voraz por `valor_i - μ · agua_i`; μ se
+ajusta por bisección hasta el punto de quiebre y las dos asignaciones que lo
+rodean se combinan para agotar exactamente el agua. Cada evaluación es un
+ordenamiento de NumPy, por lo que miles de opciones se resuelven en
+milisegundos.
+"""
+import math
+
+import numpy as np
+from django.db.models import Avg, Count
+
+from ..models import Comuna, Prediccion, TipoArbol
+
+OBJETIVOS = ('ganancia', 'produccion')
+ITERACIONES_PRECIO_AGUA = 60
+
+
+def _llenado_voraz(valor, agua, limite, hectareas, precio_agua):
+    """Mejor asignación de la tierra para un precio del agua dado (mochila fraccionaria)."""
+    neto = valor - precio_agua * agua
+    orden = np.argsort(-neto, kind='stable')
+    orden = orden[neto[orden] > 0]
+    x = np.zeros_like(valor)
+    acumulado = np.cumsum(limite[orden])
+    completos = acumulado <= hectareas
+    x[orden[completos]] = limite[orden[completos]]
+    if not completos.all():
+        # La primera opción que no cabe entera recibe la tierra restante
+        i = np.argmin(completos)
+        x[orden[i]] = hectareas - (acumulado[i - 1] if i > 0 else 0.0)
+    return x
+
+
+def asignar(valor, agua, limite, hectareas, agua_m3):
+    """
+    Resuelve la asignación para arreglos de opciones.
+
+    Devuelve (hectáreas por opción, precio sombra del agua por m³).
+    """
+    valor = np.asarray(valor, dtype=float)
+    agua = np.asarray(agua, dtype=float)
+    limite = np.asarray(limite, dtype=float)
+
+    # Sin precio al agua: si la asignación ya respeta el presupuesto, es óptima
+    x = _llenado_voraz(valor, agua, limite, hectareas, 0.0)
+    if x @ agua <= agua_m3:
+        return x, 0.0
+
+    bajo, alto = 0.0, float(np.max(valor / np.maximum(agua, 1e-9)))
+    x_bajo, x_alto = x, _llenado_voraz(valor, agua, limite, hectareas, alto)
+    for _ in range(ITERACIONES_PRECIO_AGUA):
+        medio = (bajo + alto) / 2
+        x = _llenado_voraz(valor, agua, limite, hectareas, medio)
+        if x @ agua > agua_m3:
+            bajo, x_bajo = medio, x
+        else:
+            alto, x_alto = medio, x
+
+    # En el precio de equilibrio ambas asignaciones son óptimas para el
+    # lagrangiano; la combinación que agota exactamente el agua es óptima
+    # para el programa lineal original
+    agua_bajo, agua_alto = x_bajo @ agua, x_alto @ agua
+    theta = (agua_m3 - agua_alto) / (agua_bajo - agua_alto)
+    return theta * x_bajo + (1 - theta) * x_alto, alto
+
+
+def construir_opciones(comunas, tipos):
+    """
+    Métricas por hectárea de cada par (tipo, comuna).
+
+    Usa el promedio de las predicciones completadas del par; si no hay, cae
+    al modelo base del tipo de árbol (rendimiento_base y consumo de agua por
+    defecto).
+    """
+    observadas = {
+        (fila['tipo_arbol'], fila['comuna']): fila
+        for fila in Prediccion.objects.filter(
+            estado='completada',
+            comuna__in=[c.pk for c in comunas],
+            tipo_arbol__in=[t.pk for t in tipos],
+        ).values('tipo_arbol', 'comuna').annotate(
+            produccion_ha=Avg('produccion_por_hectarea'),
+            agua_ha=Avg('consumo_agua_por_hectarea'),
+            roi=Avg('roi_proyectado'),
+            total=Count('id'),
+        )
+    }
+
+    opciones = []
+    for tipo in tipos:
+        agua_defecto = Prediccion.AGUA_BASE_POR_HECTAREA.get(tipo.tipo, 5000)
+        for comuna in comunas:
+            fila = observadas.get((tipo.pk, comuna.pk))
+            produccion_ha = (fila and fila['produccion_ha']) or tipo.rendimiento_base
+            if fila and fila['agua_ha']:
+                agua_ha = fila['agua_ha']
+            elif tipo.consumo_agua_m3_ton:
+                agua_ha = produccion_ha * tipo.consumo_agua_m3_ton
+            else:
+                agua_ha = agua_defecto
+            opciones.append({
+                'tipo_arbol': tipo.tipo,
+                'tipo_arbol_id': tipo.pk,
+                'comuna': comuna.nombre,
+                'comuna_id': comuna.pk,
+                'region': comuna.region.nombre,
+                'produccion_ha': produccion_ha,
+                'agua_ha': agua_ha,
+                'ganancia_ha': produccion_ha * tipo.precio_promedio_ton - tipo.costo_mantenimiento_anual,
+                'roi': fila['roi'] if fila else tipo.calcular_roi_proyectado(1),
+                'predicciones': fila['total'] if fila else 0,
+            })
+    return opciones
+
+
+def optimizar(hectareas, agua_m3, comunas=None, tipos=None,
+              max_fraccion_por_opcion=1.0, objetivo='ganancia'):
+    """Plan de asignación de tierra para las comunas y tipos indicados."""
+    if objetivo not in OBJETIVOS:
+        raise ValueError(f"Objetivo inválido: {objetivo}")
+    if not (math.isfinite(hectareas) and math.isfinite(agua_m3)):
+        raise ValueError("Las hectáreas y el agua deben ser números finitos")
+    if hectareas <= 0 or agua_m3 < 0:
+        raise ValueError("Las hectáreas deben ser positivas y el agua no negativa")
+    if not 0 < max_fraccion_por_opcion <= 1:
+        raise ValueError("max_fraccion_por_opcion debe estar entre 0 y 1")
+
+    comunas = list(comunas if comunas is not None else Comuna.objects.select_related('region'))
+    tipos = list(tipos if tipos is not None else TipoArbol.objects.all())
+    opciones = construir_opciones(comunas, tipos)
+    if not opciones:
+        raise ValueError("No hay opciones de cultivo para las comunas y tipos indicados")
+
+    clave = 'ganancia_ha' if objetivo == 'ganancia' else 'produccion_ha'
+    valor = np.array([o[clave] for o in opciones])
+    agua = np.array([o['agua_ha'] for o in opciones])
+    limite = np.full(len(opciones), hectareas * max_fraccion_por_opcion)
+    x, precio_agua = asignar(valor, agua, limite, hectareas, agua_m3)
+
+    plan = []
+    for opcion, ha in zip(opciones, x.tolist()):
+        if ha <= 1e-9:
+            continue
+        plan.append({
+            **opcion,
+            'hectareas': round(ha, 2),
+            'agua_m3': round(ha * opcion['agua_ha'], 1),
+            'produccion_ton': round(ha * opcion['produccion_ha'], 2),
+            'ganancia_anual': round(ha * opcion['ganancia_ha'], 0),
+        })
+    plan.sort(key=lambda p: -p['hectareas'])
+
+    return {
+        'objetivo': objetivo,
+        'opciones_evaluadas': len(opciones),
+        'plan': plan,
+        'totales': {
+            'hectareas': round(float(x.sum()), 2),
+            'agua_m3': round(float(x @ agua), 1),
+            'produccion_ton': round(float(x @ np.array([o['produccion_ha'] for o in opciones])), 2),
+            'ganancia_anual': round(float(x @ np.array([o['ganancia_ha'] for o in opciones])), 0),
+        },
+        'restricciones': {'hectareas': hectareas, 'agua_m3': agua_m3},
+        'precio_sombra_agua_m3': round(precio_agua, 4),
+    }
@@ -0,0 +1,127 @@
+# predicciones/services/perfiles.py
+"""
+Perfilado opcional de requests con cProfile.
+
+Una request se perfila si trae la cabecera X-Profile con el token
+configurado, si un usuario staff agrega ?profile=1 o si cae en la tasa de
+muestreo. El perfil se guarda en formato pstats (compatible con snakeviz y
+`python -m pstats`) junto a un JSON con los metadatos de la request.
+"""
+import cProfile
+import json
+import pstats
+import random
+import re
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+CABECERA = 'X-Profile'
+PARAMETRO = 'profile'
+MAX_PERFILES_DEFECTO = 200
+PATRON_NOMBRE = re.compile(r'^[\w.-]+\.prof$')
+
+
+def configuracion():
+    return {
+        'habilitado': getattr(settings, 'PROFILING_ENABLED', False),
+        'tasa': getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0),
+        'token': getattr(settings, 'PROFILING_TOKEN', ''),
+        'directorio': Path(getattr(settings, 'PROFILING_DIR', Path(settings.BASE_DIR) / 'logs' / 'perfiles')),
+        'max_perfiles': getattr(settings, 'PROFILING_MAX_FILES', MAX_PERFILES_DEFECTO),
+    }
+
+
+def motivo_perfilado(request, config):
+    """'cabecera', 'staff', 'muestreo' o None si la request no se perfila."""
+    token = config['token']
+    if token and request.headers.get(CABECERA) == token:
+        return 'cabecera'
+    if request.GET.get(PARAMETRO) == '1':
+        usuario = getattr(request, 'user', None)
+        if usuario is not None and usuario.is_staff:
+            return 'staff'
+    if config['tasa'] > 0 and random.random() < config['tasa']:
+        return 'muestreo'
+    return None
+
+
+def perfilar(funcion):
+    """
+    Ejecuta `funcion()` bajo cProfile. Devuelve (resultado, perfil, segundos).
+
+    Si ya hay otro perfilador activo (solo se permite uno a la vez) se
+    ejecuta sin perfilar y el perfil es None.
+    """
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()
+    except ValueError:
+        perfil = None
+    inicio = time.perf_counter()
+    try:
+        resultado = funcion()
+    finally:
+        if perfil is not None:
+            perfil.disable()
+    return resultado, perfil, time.perf_counter() - inicio
+
+
+def guardar(perfil, metadatos, config):
+    """Escribe el .prof y su .json, y elimina los más antiguos sobre el máximo."""
+    directorio = config['directorio']
+    directorio.mkdir(parents=True, exist_ok=True)
+    vista = re.sub(r'[^\w-]', '_', metadatos['vista'])
+    ahora = time.time()
+    marca = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(ahora))}.{int(ahora * 1000) % 1000:03d}"
+    nombre = f"{marca}-{vista}-{metadatos['duracion_ms']:.0f}ms-{metadatos['pid']}"
+    perfil.dump_stats(directorio / f'{nombre}.prof')
+    (directorio / f'{nombre}.json').write_text(json.dumps(metadatos, ensure_ascii=False))
+
+    antiguos = sorted(directorio.glob('*.prof'), key=lambda p: p.stat().st_mtime)[:-config['max_perfiles']]
+    for ruta in antiguos:
+        ruta.unlink(missing_ok=True)
+        ruta.with_suffix('.json').unlink(missing_ok=True)
+    return nombre
+
+
+def top_funciones(ruta, limite=15):
+    """Funciones con mayor tiempo acumulado de un archivo .prof."""
+    estadisticas = pstats.Stats(str(ruta)).stats
+    filas = []
+    for (archivo, linea, funcion), (_, llamadas, propio, acumulado, _) in estadisticas.items():
+        filas.append({
+            'funcion': funcion,
+            'ubicacion': f'{archivo}:{linea}',
+            'llamadas': llamadas,
+            'tiempo_propio_ms': propio * 1000,
+            'tiempo_acumulado_ms': acumulado * 1000,
+        })
+    filas.sort(key=lambda f: -f['tiempo_acumulado_ms'])
+    return filas[:limite]
+
+
+def listar(directorio, limite=50, top=15):
+    """Perfiles más recientes con sus metadatos y funciones principales."""
+    if not directorio.exists():
+        return []
+    rutas = sorted(directorio.glob('*.prof'), key=lambda p: p.stat().st_mtime, reverse=True)[:limite]
+    perfiles = []
+    for ruta in rutas:
+        meta = ruta.with_suffix('.json')
+        try:
+            metadatos = json.loads(meta.read_text()) if meta.exists() else {}
+            funciones = top_funciones(ruta, top)
+        except (OSError, ValueError, EOFError):
+            continue
+        perfiles.append({'nombre': ruta.name, **metadatos, 'funciones': funciones})
+    return perfiles
+
+
+def ruta_perfil(directorio, nombre):
+    """Ruta de un .prof por nombre, validando que no salga del directorio."""
+    if not PATRON_NOMBRE.match(nombre):
+        return None
+    ruta = directorio / nombre
+    return ruta if ruta.exists() else None
@@ -0,0 +1,251 @@
+# predicciones/services/programa_riego.py
+"""
+Calendario de riego de temporada para las parcelas de un predio.
+
+Generaliza la calculadora de agua (una lámina fija cada `frecuencia` días):
+el suelo de cada parcela se simula día a día con el balde de
+services/balance_suelo y se riega cuando hace falta, reponiendo lo
+consumido (lámina neta) dividido por la eficiencia del sistema (lámina
+bruta). El volumen es la lámina bruta x 10 m³/ha x hectáreas.
+
+Cada parcela tiene un plazo: los días que faltan para que su agotamiento
+supere el agua fácilmente aprovechable (`agotamiento` x capacidad) y la
+planta empiece a sufrir. Las parcelas que comparten una bomba compiten
+por su capacidad diaria (m³/día). Cada día, y para cada bomba, las
+candidatas se ordenan por plazo (primero el más cercano) y se riegan hoy
+solo las necesarias para que las demás quepan en los días siguientes:
+
+    hoy = max_j (volumen acumulado hasta j - capacidad x plazo_j)
+
+Sin bombas saturadas esto riega cada parcela justo a tiempo (menos eventos
+y láminas más grandes); con una bomba saturada adelanta riegos a los días
+con capacidad libre. Las candidatas son las parcelas con un agotamiento de
+al menos `anticipacion` x agua fácilmente aprovechable, para no programar
+láminas pequeñas. Una lámina no supera la infiltración diaria del suelo
+ni lo que le queda a la bomba ese día.
+
+Todo paso diario opera sobre todas las parcelas y bombas con NumPy.
+"""
+import csv
+import datetime
+import io
+
+import numpy as np
+
+from .balance_suelo import AGOTAMIENTO_DEFECTO, MAX_DIAS, Balde, _por_dia, leer_parcelas
+from .calculadoras import M3_HA_POR_MM
+
+# Eficiencia de aplicación por tipo de riego
+EFICIENCIA_RIEGO = {
+    'goteo': 0.9,
+    'micro_aspersion': 0.85,
+    'aspersion': 0.75,
+    'gravedad': 0.5,
+}
+EFICIENCIA_DEFECTO = 0.7
+ANTICIPACION = 0.5
+MAX_PARCELAS = 2000
+
+
+def programar(et0, kc, capacidad, hectareas, eficiencia=EFICIENCIA_DEFECTO, bomba=0, capacidad_bombas=np.inf,
+              lluvia=0, agotamiento=AGOTAMIENTO_DEFECTO, infiltracion_max=np.inf, inicial=1.0,
+              anticipacion=ANTICIPACION):
+    """
+    Programa los riegos de la temporada.
+
+    `et0` y `lluvia` son series diarias (mm) comunes o por parcela y `kc`
+    un valor por parcela o una matriz (parcelas, dias). `bomba` es el índice
+    de la bomba de cada parcela en `capacidad_bombas` (m³/día).
+
+    Devuelve {'eventos': columnas dia, parcela, lamina_neta, lamina_bruta y
+    volumen_m3; 'parcelas': por parcela eventos, volumen_m3, etc_real,
+    deficit, dias_deficit, percolacion y escorrentia; 'bombas': volumen
+    diario por bomba (bombas, dias)}.
+    """
+    capacidad = np.atleast_1d(np.asarray(capacidad, dtype=float))
+    parcelas = len(capacidad)
+    hectareas = np.broadcast_to(np.asarray(hectareas, dtype=float), (parcelas,))
+    eficiencia = np.broadcast_to(np.asarray(eficiencia, dtype=float), (parcelas,))
+    bomba = np.broadcast_to(np.asarray(bomba, dtype=np.int64), (parcelas,))
+    capacidad_bombas = np.atleast_1d(np.asarray(capacidad_bombas, dtype=float))
+    if np.any(capacidad <= 0) or np.any(hectareas <= 0):
+        raise ValueError("La capacidad de agua aprovechable y las hectáreas deben ser positivas.")
+    if np.any((eficiencia <= 0) | (eficiencia > 1)):
+        raise ValueError("'eficiencia' debe estar entre 0 y 1.")
+    if np.any(capacidad_bombas <= 0):
+        raise ValueError("La capacidad de cada bomba debe ser positiva.")
+    if bomba.min() < 0 or bomba.max() >= len(capacidad_bombas):
+        raise ValueError("Cada parcela debe usar una bomba definida.")
+
+    et0 = _por_dia(et0, parcelas, None, 'et0')
+    dias = len(et0)
+    if not 1 <= dias <= MAX_DIAS:
+        raise ValueError(f"La serie debe tener entre 1 y {MAX_DIAS} días.")
+    lluvia = _por_dia(lluvia, parcelas, dias, 'lluvia')
+    kc = np.asarray(kc)
+    kc = np.broadcast_to(np.atleast_1d(kc)[:, None], (parcelas, dias)).T if kc.ndim <= 1 \
+        else np.ascontiguousarray(kc.T)
+
+    balde = Balde(capacidad, agotamiento, infiltracion_max, inicial)
+    facil = np.asarray(agotamiento, dtype=float) * capacidad  # agua fácilmente aprovechable
+    minimo = anticipacion * facil
+    # m³ por mm de lámina neta en cada parcela
+    m3_por_mm = M3_HA_POR_MM * hectareas / eficiencia
+
+    totales = {c: np.zeros(parcelas) for c in ('etc_real', 'etc_potencial', 'escorrentia', 'percolacion')}
+    dias_deficit = np.zeros(parcelas, dtype=np.int64)
+    uso_bombas = np.zeros((dias, len(capacidad_bombas)))
+    eventos = []
+    for d in range(dias):
+        etc = np.broadcast_to(kc[d] * et0[d], (parcelas,))
+        lluvia_dia = np.broadcast_to(lluvia[d], (parcelas,))
+        # Lámina que deja el balde lleno al final del día
+        necesidad = balde.agotamiento + etc - lluvia_dia
+        candidatas = np.flatnonzero((necesidad >= minimo) & (necesidad > 0))
+        riego = np.zeros(parcelas)
+        if len(candidatas):
+            regadas, netas = _elegir(
+                candidatas, necesidad, etc, facil, balde.infiltracion_max - lluvia_dia,
+                m3_por_mm, bomba, capacidad_bombas, dias - d,
+            )
+            riego[regadas] = netas
+            volumen = netas * m3_por_mm[regadas]
+            uso_bombas[d] = np.bincount(bomba[regadas], volumen, minlength=len(capacidad_bombas))
+            eventos.append((np.full(len(regadas), d), regadas, netas, volumen))
+
+        etc_real, escorrentia, percolacion, con_deficit = balde.paso(etc, lluvia_dia + riego)
+        totales['etc_potencial'] += etc
+        totales['etc_real'] += etc_real
+        totales['escorrentia'] += escorrentia
+        totales['percolacion'] += percolacion
+        dias_deficit += con_deficit
+
+    if eventos:
+        dia, parcela, neta, volumen = (np.concatenate(c) for c in zip(*eventos))
+    else:
+        dia = parcela = np.empty(0, dtype=np.int64)
+        neta = volumen = np.empty(0)
+    return {
+        'eventos': {
+            'dia': dia,
+            'parcela': parcela,
+            'lamina_neta': np.round(neta, 1),
+            'lamina_bruta': np.round(neta / eficiencia[parcela], 1),
+            'volumen_m3': np.round(volumen, 1),
+        },
+        'parcelas': {
+            'eventos': np.bincount(parcela, minlength=parcelas),
+            'volumen_m3': np.round(np.bincount(parcela, volumen, minlength=parcelas), 1),
+            'etc_real': np.round(totales['etc_real'], 1),
+            'deficit': np.round(totales['etc_potencial'] - totales['etc_real'], 1),
+            'dias_deficit': dias_deficit,
+            'percolacion': np.round(totales['percolacion'], 1),
+            'escorrentia': np.round(totales['escorrentia'], 1),
+        },
+        'bombas': np.round(uso_bombas.T, 1),
+    }
+
+
+def _elegir(candidatas, necesidad, etc, facil, infiltrable, m3_por_mm, bomba, capacidad_bombas, restantes):
+    """Parcelas que se riegan hoy y su lámina neta, según los plazos de cada bomba."""
+    netas = np.minimum(necesidad[candidatas], np.maximum(infiltrable[candidatas], 0))
+    holgura = facil[candidatas] - necesidad[candidatas]
+    # Días hasta superar el agua fácilmente aprovechable (0: hoy)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plazo = np.where(holgura < 0, 0, np.floor(holgura / etc[candidatas]) + 1)
+    plazo = np.nan_to_num(np.minimum(plazo, restantes), nan=restantes)
+
+    b = bomba[candidatas]
+    orden = np.lexsort((plazo, b))
+    b, plazo, netas, candidatas = b[orden], plazo[orden], netas[orden], candidatas[orden]
+    volumen = netas * m3_por_mm[candidatas]
+    inicios = np.r_[0, np.flatnonzero(np.diff(b)) + 1]
+    largos = np.diff(np.r_[inicios, len(b)])
+    acumulado = np.cumsum(volumen)
+    acumulado -= np.repeat(acumulado[inicios] - volumen[inicios], largos)
+
+    capacidad = capacidad_bombas[b]
+    # Lo que la bomba alcanza a entregar antes del plazo (sin contar hoy)
+    with np.errstate(invalid='ignore'):
+        futura = np.where(plazo > 0, capacidad * plazo, 0)
+    requerido = np.maximum.reduceat(np.maximum(acumulado - futura, 0), inicios)
+    anterior = acumulado - volumen
+    hoy = (anterior < np.repeat(requerido, largos)) & (anterior < capacidad) & (netas > 0)
+    # La primera que no cabe entera recibe lo que queda de la bomba
+    parcial = hoy & (acumulado > capacidad)
+    netas[parcial] = (capacidad - anterior)[parcial] / m3_por_mm[candidatas[parcial]]
+    return candidatas[hoy], netas[hoy]
+
+
+def exportar_csv(programa, inicio, nombres, bombas):
+    """Calendario de eventos como CSV (fecha, parcela, bomba, láminas y volumen)."""
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(['fecha', 'parcela', 'bomba', 'lamina_neta_mm', 'lamina_bruta_mm', 'volumen_m3'])
+    eventos = programa['eventos']
+    for dia, parcela, neta, bruta, volumen in zip(*(eventos[c].tolist() for c in (
+        'dia', 'parcela', 'lamina_neta', 'lamina_bruta', 'volumen_m3'
+    ))):
+        escritor.writerow([
+            (inicio + datetime.timedelta(days=dia)).isoformat(), nombres[parcela], bombas[parcela],
+            neta, bruta, volumen,
+        ])
+    return salida.getvalue()
+
+
+def leer_predio(datos, dias, inicio):
+    """
+    Parcelas y bombas de la solicitud: las columnas de
+    balance_suelo.leer_parcelas más hectareas, eficiencia o tipo_riego,
+    bomba y nombre, y {'bombas': {nombre: m³/día}}. Devuelve (argumentos de
+    `programar`, nombres de parcela, bomba de cada parcela). Lanza
+    ValueError si no son válidos.
+    """
+    parcelas = datos.get('parcelas')
+    if not isinstance(parcelas, dict):
+        raise ValueError("Indique 'parcelas' como un objeto de columnas.")
+    parametros = leer_parcelas(parcelas, dias, inicio, adicionales={
+        'hectareas': float, 'eficiencia': float, 'tipo_riego': str, 'bomba': str, 'nombre': str,
+    })
+    n = len(parametros['capacidad'])
+    if n > MAX_PARCELAS:
+        raise ValueError(f"Máximo {MAX_PARCELAS} parcelas por predio.")
+    hectareas = parametros.pop('hectareas')
+    if hectareas is None:
+        raise ValueError("Indique 'hectareas'.")
+
+    eficiencia, tipos_riego = parametros.pop('eficiencia'), parametros.pop('tipo_riego')
+    if eficiencia is None and tipos_riego is not None:
+        desconocidos = set(tipos_riego.tolist()) - set(EFICIENCIA_RIEGO)
+        if desconocidos:
+            raise ValueError(f"Tipos de riego desconocidos: {', '.join(sorted(desconocidos))}")
+        eficiencia = np.array([EFICIENCIA_RIEGO[t] for t in tipos_riego.tolist()])
+
+    nombres = parametros.pop('nombre')
+    nombres = nombres.tolist() if nombres is not None else [f'Parcela {i + 1}' for i in range(n)]
+    bombas = parametros.pop('bomba')
+    definidas = datos.get('bombas') or {}
+    if not isinstance(definidas, dict):
+        raise ValueError("'bombas' debe ser un objeto {nombre: m³ por día}.")
+    if bombas is None:
+        if len(definidas) > 1:
+            raise ValueError("Con varias bombas indique la 'bomba' de cada parcela.")
+        bombas = [next(iter(definidas), 'principal')] * n
+    else:
+        bombas = bombas.tolist()
+        faltantes = set(bombas) - set(definidas)
+        if definidas and faltantes:
+            raise ValueError(f"Bombas sin capacidad definida: {', '.join(sorted(faltantes))}")
+    orden = sorted(set(bombas))
+    try:
+        capacidad_bombas = [float(definidas[b]) if b in definidas else np.inf for b in orden]
+    except (TypeError, ValueError):
+        raise ValueError("La capacidad de cada bomba debe ser un número (m³ por día).")
+    posicion = {b: i for i, b in enumerate(orden)}
+    parametros.update(
+        hectareas=hectareas,
+        eficiencia=EFICIENCIA_DEFECTO if eficiencia is None else eficiencia,
+        bomba=np.array([posicion[b] for b in bombas], dtype=np.int64),
+        capacidad_bombas=np.array(capacidad_bombas),
+    )
+    return parametros, nombres, bombas
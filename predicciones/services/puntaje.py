@@ -0,0 +1,148 @@
+# predicciones/services/puntaje.py
+"""
+Modelo de predicción vectorizado.
+
+Replica `Prediccion.calcular_prediccion` sobre arreglos para puntuar miles de
+predicciones en una sola pasada. Las tablas de factores viven aquí y el
+modelo las usa también, de modo que ambos caminos dan el mismo resultado.
+"""
+import numpy as np
+
+from . import flujo_caja
+
+FACTORES_RIEGO = {
+    'goteo': 1.1,
+    'micro_aspersion': 1.05,
+    'aspersion': 0.95,
+    'gravedad': 0.85,
+}
+
+FACTORES_SUELO = {
+    'franco': 1.1,
+    'arcilloso': 0.95,
+    'limoso': 1.0,
+    'arenoso': 0.9,
+}
+
+FACTORES_FERTILIZACION = {
+    'mixta': 1.15,
+    'quimica': 1.05,
+    'organica': 1.0,
+    'ninguna': 0.8,
+}
+
+# Densidad (árboles/ha): < 200, 200-400, > 400
+LIMITES_DENSIDAD = np.array([200, 400])
+FACTORES_DENSIDAD = np.array([0.85, 1.0, 0.95])
+
+FACTOR_REGIONAL_MIN = 0.9
+FACTOR_REGIONAL_MAX = 1.1
+
+CONFIABILIDAD_BASE = 85
+CONFIABILIDAD_VARIACION = (-15, 10)
+CONFIABILIDAD_RANGO = (70, 95)
+
+ANOS_ANALISIS = 5
+
+
+def factor_densidad(densidad):
+    """Factor por densidad de plantación para uno o varios valores."""
+    densidad = np.asarray(densidad)
+    return FACTORES_DENSIDAD[
+        (densidad >= LIMITES_DENSIDAD[0]).astype(int) + (densidad > LIMITES_DENSIDAD[1]).astype(int)
+    ]
+
+
+def factor_categoria(valores, factores):
+    """Mapea un arreglo de categorías (texto) a su factor; 1.0 si no existe."""
+    valores = np.asarray(valores, dtype=object)
+    unicos, inversa = np.unique(valores.astype(str), return_inverse=True)
+    tabla = np.array([factores.get(v, 1.0) for v in unicos])
+    return tabla[inversa.reshape(valores.shape)]
+
+
+def calcular_lote(rendimiento_base, edad_arboles, densidad_plantacion, tipo_riego,
+                  tipo_suelo, fertilizacion, hectareas, consumo_agua_m3_ton,
+                  agua_base_por_hectarea, precio_promedio_ton,
+                  costo_plantacion_hectarea, costo_mantenimiento_anual, rng=None):
+    """
+    Calcula todos los campos de resultado de un lote de predicciones.
+
+    Los argumentos son arreglos del mismo largo (los del tipo de árbol ya
+    expandidos por fila). Devuelve un diccionario de columnas con los mismos
+    nombres que los campos de Prediccion; los valores económicos quedan en
+    NaN cuando el tipo no tiene precio, igual que en el modelo.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    hectareas = np.asarray(hectareas, dtype=float)
+    n = len(hectareas)
+
+    produccion_ha = (
+        np.asarray(rendimiento_base, dtype=float)
+        * flujo_caja.factor_edad(edad_arboles)
+        * factor_densidad(densidad_plantacion)
+        * factor_categoria(tipo_riego, FACTORES_RIEGO)
+        * factor_categoria(tipo_suelo, FACTORES_SUELO)
+        * factor_categoria(fertilizacion, FACTORES_FERTILIZACION)
+        * rng.uniform(FACTOR_REGIONAL_MIN, FACTOR_REGIONAL_MAX, n)
+    )
+    produccion_total = produccion_ha * hectareas
+
+    # Consumo de agua
+    agua_ton = np.asarray(consumo_agua_m3_ton, dtype=float)
+    por_produccion = (produccion_total > 0) & (agua_ton > 0)
+    agua_ha = np.where(
+        por_produccion,
+        produccion_ha * agua_ton,
+        np.asarray(agua_base_por_hectarea, dtype=float),
+    )
+
+    # Análisis económico (solo si el tipo tiene precio)
+    precio = np.asarray(precio_promedio_ton, dtype=float)
+    plantacion = np.asarray(costo_plantacion_hectarea, dtype=float)
+    mantenimiento = np.asarray(costo_mantenimiento_anual, dtype=float)
+    con_precio = precio > 0
+    inversion = np.where(con_precio, (plantacion + mantenimiento * ANOS_ANALISIS) * hectareas, np.nan)
+    ingresos = np.where(con_precio, produccion_ha * hectareas * precio * ANOS_ANALISIS, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi = np.where(con_precio & (inversion > 0), (ingresos - inversion) / inversion * 100, np.nan)
+
+    confiabilidad = np.clip(
+        (CONFIABILIDAD_BASE + rng.uniform(*CONFIABILIDAD_VARIACION, n)).astype(int),
+        *CONFIABILIDAD_RANGO,
+    )
+
+    flujos = flujo_caja.evaluar(
+        produccion_ha, edad_arboles, hectareas, precio, plantacion, mantenimiento,
+    )
+    sin_precio = ~con_precio
+    for campo in ('van', 'tir', 'periodo_recuperacion'):
+        flujos[campo] = np.where(sin_precio, np.nan, flujos[campo])
+
+    return {
+        'produccion_por_hectarea': produccion_ha,
+        'produccion_total': produccion_total,
+        'consumo_agua_por_hectarea': agua_ha,
+        'consumo_agua_total': agua_ha * hectareas,
+        'inversion_estimada': inversion,
+        'ingresos_proyectados_5anos': ingresos,
+        'roi_proyectado': roi,
+        'confiabilidad': confiabilidad,
+        'van': flujos['van'],
+        'tir': flujos['tir'],
+        'periodo_recuperacion': flujos['periodo_recuperacion'],
+        'flujos': np.where(sin_precio[:, None], np.nan, flujos['flujos']),
+    }
+
+
+def asignar_fila(prediccion, resultado, fila):
+    """Copia la fila `fila` de `calcular_lote` a una instancia de Prediccion."""
+    for campo in ('produccion_por_hectarea', 'produccion_total', 'consumo_agua_por_hectarea',
+                  'consumo_agua_total', 'inversion_estimada', 'ingresos_proyectados_5anos',
+                  'roi_proyectado', 'van', 'tir', 'periodo_recuperacion'):
+        valor = float(resultado[campo][fila])
+        setattr(prediccion, campo, None if np.isnan(valor) else valor)
+    prediccion.confiabilidad = int(resultado['confiabilidad'][fila])
+    flujos = resultado['flujos'][fila]
+    prediccion.flujos_caja = None if np.isnan(flujos).any() else [round(v, 2) for v in flujos.tolist()]
+    prediccion.estado = 'completada'
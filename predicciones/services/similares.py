@@ -0,0 +1,172 @@
+# predicciones/services/similares.py
+"""
+Huertos similares: k vecinos más cercanos entre las predicciones completadas.
+
+La distancia combina, con escalas fijas (una unidad = una diferencia
+"notoria"), el tamaño (razón de hectáreas), la edad, la densidad y la
+ubicación, más una unidad por cada condición distinta (riego, suelo,
+fertilización y, si se buscan todas las especies, el tipo de árbol).
+
+Las filas se agrupan en bloques por (tipo de árbol, riego, suelo,
+fertilización). Dentro de un bloque las condiciones no aportan nada, así que
+la distancia es un cálculo vectorizado sobre cinco columnas; los bloques se
+recorren de menor a mayor penalización por condiciones y la búsqueda se
+detiene cuando esa penalización ya supera al k-ésimo mejor encontrado.
+Cada bloque está ordenado por la coordenada norte-sur, de modo que con un
+radio conocido (el k-ésimo mejor) solo se calcula la franja que cabe en él.
+
+Los bloques viven en la copia en memoria de services/instantanea, que los
+actualiza de forma incremental (solo los bloques con filas cambiadas).
+"""
+import math
+
+import numpy as np
+
+CATEGORIAS = ('tipo_riego', 'tipo_suelo', 'fertilizacion')
+
+# Escalas: cuánto de cada variable equivale a una condición distinta
+ESCALA_HECTAREAS = math.log(2)  # el doble o la mitad de superficie
+ESCALA_EDAD = 5  # años
+ESCALA_DENSIDAD = 200  # árboles por hectárea
+ESCALA_DISTANCIA_KM = 100
+# Sin coordenadas (comuna ni región) la ubicación cuenta como una unidad
+DISTANCIA_SIN_UBICACION = 1.0
+
+RADIO_TIERRA_KM = 6371.0
+K_MAXIMO = 100
+
+
+def caracteristicas(hectareas, edad, densidad, latitud, longitud):
+    """Matriz (n, 5) de variables escaladas; nan donde falta la ubicación."""
+    lat = np.radians(latitud)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        columnas = (
+            np.log(hectareas) / ESCALA_HECTAREAS,
+            edad / ESCALA_EDAD,
+            densidad / ESCALA_DENSIDAD,
+            # Proyección equirectangular: basta para distancias entre comunas
+            RADIO_TIERRA_KM * np.radians(longitud) * np.cos(lat) / ESCALA_DISTANCIA_KM,
+            RADIO_TIERRA_KM * lat / ESCALA_DISTANCIA_KM,
+        )
+    return np.column_stack(columnas).astype(np.float32)
+
+
+COLUMNA_NORTE_SUR = 4
+
+
+def _claves(datos):
+    return np.column_stack([datos['tipo_arbol_id']] + [datos[c] for c in CATEGORIAS])
+
+
+def _ordenar_bloque(ids, matriz):
+    """Bloque ordenado por la coordenada norte-sur (las filas sin ubicación al final)."""
+    orden = np.argsort(matriz[:, COLUMNA_NORTE_SUR], kind='stable')
+    return ids[orden], np.ascontiguousarray(matriz[orden])
+
+
+def construir(datos):
+    """{(tipo_arbol_id, riego, suelo, fertilizacion): (ids, matriz)} desde las columnas de la copia."""
+    if not len(datos['id']):
+        return {}
+    claves = _claves(datos)
+    # Una clave entera por fila (los códigos de choices van de -1 a 3)
+    codigo = claves[:, 0]
+    for columna in range(1, claves.shape[1]):
+        codigo = codigo * 8 + claves[:, columna] + 1
+    orden = np.argsort(codigo, kind='stable')
+    cortes = np.flatnonzero(np.diff(codigo[orden])) + 1
+    unicas = claves[orden[np.r_[0, cortes]]]
+    matriz = caracteristicas(
+        datos['hectareas'], datos['edad_arboles'], datos['densidad_plantacion'],
+        datos['latitud'], datos['longitud'],
+    )
+    bloques = {}
+    for clave, filas in zip(unicas.tolist(), np.split(orden, cortes)):
+        bloques[tuple(clave)] = _ordenar_bloque(datos['id'][filas], matriz[filas])
+    return bloques
+
+
+def actualizar(bloques, agregadas, quitadas):
+    """
+    Copia de `bloques` con las filas agregadas y quitadas (dicts de
+    columnas); solo se rehacen (y reordenan) los bloques que tocan esas filas.
+    """
+    nuevos = dict(bloques)
+    quitar = {}
+    for clave, id_fila in zip(map(tuple, _claves(quitadas).tolist()), quitadas['id'].tolist()):
+        quitar.setdefault(clave, []).append(id_fila)
+    for clave, ids_quitados in quitar.items():
+        if clave in nuevos:
+            ids, matriz = nuevos[clave]
+            conservar = ~np.isin(ids, ids_quitados)
+            nuevos[clave] = (ids[conservar], matriz[conservar])
+
+    for clave, (ids, matriz) in construir(agregadas).items():
+        if clave in nuevos:
+            ids, matriz = _ordenar_bloque(
+                np.concatenate([nuevos[clave][0], ids]), np.concatenate([nuevos[clave][1], matriz]),
+            )
+        nuevos[clave] = (ids, matriz)
+    return {clave: bloque for clave, bloque in nuevos.items() if len(bloque[0])}
+
+
+def buscar(bloques, tipo_arbol, categorias, consulta, k=10, misma_especie=True, excluir_id=None):
+    """
+    Los k vecinos más cercanos: lista de (id, distancia) de menor a mayor.
+
+    `categorias` son los códigos (riego, suelo, fertilizacion) y
+    `consulta` la fila de `caracteristicas` de la predicción buscada.
+    """
+    if not 1 <= k <= K_MAXIMO:
+        raise ValueError(f"'k' debe estar entre 1 y {K_MAXIMO}.")
+    claves = list(bloques)
+    if not claves:
+        return []
+    diferentes = np.array(claves) != np.array([tipo_arbol, *categorias])
+    penalizaciones = diferentes.sum(axis=1)
+    if misma_especie:
+        penalizaciones[diferentes[:, 0]] = -1
+
+    norte_sur = consulta[COLUMNA_NORTE_SUR]
+    mejores_ids = np.empty(0, dtype=np.int64)
+    mejores_d2 = np.empty(0, dtype=np.float32)
+    # Los bloques con la misma penalización se calculan juntos
+    for penalizacion in np.unique(penalizaciones[penalizaciones >= 0]).tolist():
+        completos = len(mejores_ids) == k
+        # Todo bloque está al menos a sqrt(penalización): si el k-ésimo mejor
+        # ya está más cerca, ni estos ni los siguientes pueden entrar
+        if completos and penalizacion >= mejores_d2[-1]:
+            break
+        radio = np.sqrt(mejores_d2[-1] - penalizacion) if completos else np.inf
+        partes_ids, partes_matriz = [], []
+        for i in np.flatnonzero(penalizaciones == penalizacion).tolist():
+            ids, matriz = bloques[claves[i]]
+            if completos and not np.isnan(norte_sur):
+                # Solo la franja norte-sur dentro del radio (y las filas sin ubicación)
+                inicio, fin, con_ubicacion = np.searchsorted(
+                    matriz[:, COLUMNA_NORTE_SUR], [norte_sur - radio, norte_sur + radio, np.inf],
+                )
+                partes_ids += [ids[inicio:fin], ids[con_ubicacion:]]
+                partes_matriz += [matriz[inicio:fin], matriz[con_ubicacion:]]
+            else:
+                partes_ids.append(ids)
+                partes_matriz.append(matriz)
+        ids, matriz = np.concatenate(partes_ids), np.concatenate(partes_matriz)
+        if not len(ids):
+            continue
+
+        diferencias = np.square(matriz - consulta)
+        diferencias[np.isnan(diferencias)] = DISTANCIA_SIN_UBICACION / 2  # x e y
+        d2 = diferencias.sum(axis=1) + penalizacion
+        if excluir_id is not None:
+            d2[ids == excluir_id] = np.inf
+        if len(d2) > k:
+            parte = np.argpartition(d2, k - 1)[:k]
+            ids, d2 = ids[parte], d2[parte]
+        ids = np.concatenate([mejores_ids, ids])
+        d2 = np.concatenate([mejores_d2, d2])
+        orden = np.argsort(d2, kind='stable')[:k]
+        mejores_ids, mejores_d2 = ids[orden], d2[orden]
+
+    finitos = np.isfinite(mejores_d2)
+    return list(zip(mejores_ids[finitos].tolist(), np.sqrt(mejores_d2[finitos]).round(3).tolist()))
@@ -0,0 +1,262 @@
+# predicciones/services/tendencias.py
+"""
+Resúmenes diarios y mensuales de predicciones por tipo de árbol y región.
+
+ResumenDiario y ResumenMensual guardan, por (fecha, tipo_arbol, region),
+cuántas predicciones se crearon y las sumas de hectáreas, producción,
+inversión y agua de las completadas. Se mantienen de forma incremental:
+
+- save()/delete() de una Prediccion aplican la diferencia entre su aporte
+  anterior y el nuevo (receptores conectados en PrediccionesConfig.ready);
+- los caminos masivos (bulk_create, update) llaman a `acumular`/`aplicar`
+  o a `cambiar_region`.
+
+Lo que escape a esos caminos se corrige con
+`python manage.py reconstruir_tendencias`.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import Prediccion, ResumenDiario, ResumenMensual
+
+MODELOS = {'dia': ResumenDiario, 'mes': ResumenMensual}
+
+# Campos de Prediccion que determinan su aporte a los resúmenes
+CAMPOS = (
+    'fecha_creacion', 'tipo_arbol_id', 'region_id', 'estado',
+    'hectareas', 'produccion_total', 'inversion_estimada', 'consumo_agua_total',
+)
+MEDIDAS = ('total', 'completadas', 'hectareas', 'produccion_total', 'inversion_total', 'consumo_agua_total')
+
+# Sobre este rango (días) la consulta usa los resúmenes mensuales
+MAX_DIAS_SERIE_DIARIA = 92
+AGRUPACIONES = ('tipo_arbol', 'region')
+# Sobre esta cantidad de claves `aplicar` lee y escribe las filas en lote
+MAX_CLAVES_POR_FILA = 200
+
+
+def fecha_local(momento):
+    """Día calendario (zona horaria del sitio) de un datetime."""
+    if timezone.is_aware(momento):
+        momento = timezone.localtime(momento)
+    return momento.date()
+
+
+def valores(prediccion):
+    """Los CAMPOS de una instancia, como dict."""
+    return {campo: getattr(prediccion, campo) for campo in CAMPOS}
+
+
+def aporte(datos):
+    """
+    Aporte de una predicción (dict de CAMPOS) a cada resumen:
+    {(periodo, fecha, tipo_arbol_id, region_id): (medidas...)}.
+    """
+    if not datos or datos['fecha_creacion'] is None:
+        return {}
+    dia = fecha_local(datos['fecha_creacion'])
+    if datos['estado'] == 'completada':
+        medidas = (
+            1, 1, datos['hectareas'] or 0, datos['produccion_total'] or 0,
+            datos['inversion_estimada'] or 0, datos['consumo_agua_total'] or 0,
+        )
+    else:
+        medidas = (1, 0, 0, 0, 0, 0)
+    tipo, region = datos['tipo_arbol_id'], datos['region_id']
+    return {('dia', dia, tipo, region): medidas, ('mes', dia.replace(day=1), tipo, region): medidas}
+
+
+def _sumar(total, clave, medidas, signo=1):
+    actual = total.get(clave, (0,) * len(MEDIDAS))
+    total[clave] = tuple(a + signo * m for a, m in zip(actual, medidas))
+
+
+def combinar(*pares):
+    """Suma aportes: combinar((aporte_a, 1), (aporte_b, -1)) = a - b."""
+    total = {}
+    for aportes, signo in pares:
+        for clave, medidas in aportes.items():
+            _sumar(total, clave, medidas, signo)
+    return total
+
+
+def acumular(predicciones):
+    """Aporte conjunto de muchas instancias (por ejemplo antes de un bulk_create)."""
+    total = {}
+    for prediccion in predicciones:
+        for clave, medidas in aporte(valores(prediccion)).items():
+            _sumar(total, clave, medidas)
+    return total
+
+
+def aplicar(aportes):
+    """Suma los aportes a las filas de resumen, creándolas si no existen."""
+    if len(aportes) > MAX_CLAVES_POR_FILA:
+        return _aplicar_en_lote(aportes)
+    with transaction.atomic():
+        for (periodo, fecha, tipo, region), medidas in aportes.items():
+            if not any(medidas):
+                continue
+            modelo = MODELOS[periodo]
+            filas = modelo.objects.filter(fecha=fecha, tipo_arbol_id=tipo, region_id=region)
+            incrementos = {m: F(m) + v for m, v in zip(MEDIDAS, medidas) if v}
+            if filas.update(**incrementos):
+                if medidas[0] < 0:
+                    # Sin predicciones en el periodo la fila sobra
+                    filas.filter(total__lte=0).delete()
+                continue
+            try:
+                # Punto de guardado propio: si otro proceso creó la fila
+                # entre el UPDATE y el INSERT, se vuelve a actualizar
+                with transaction.atomic():
+                    modelo.objects.create(
+                        fecha=fecha, tipo_arbol_id=tipo, region_id=region, **dict(zip(MEDIDAS, medidas)),
+                    )
+            except IntegrityError:
+                filas.update(**incrementos)
+
+
+def _aplicar_en_lote(aportes):
+    """
+    Variante de `aplicar` para muchos periodos a la vez (cargas masivas):
+    lee las filas afectadas en una consulta por periodo y las escribe en
+    lote en lugar de un UPDATE por clave.
+    """
+    with transaction.atomic(using=router.db_for_write(ResumenDiario)):
+        for periodo, modelo in MODELOS.items():
+            propios = {(f, t, r): m for (p, f, t, r), m in aportes.items() if p == periodo and any(m)}
+            if not propios:
+                continue
+            existentes = modelo.objects.filter(
+                fecha__in={f for f, _, _ in propios}, tipo_arbol_id__in={t for _, t, _ in propios},
+            )
+            filas = {(e.fecha, e.tipo_arbol_id, e.region_id): e for e in existentes}
+            actualizar, crear, vacias = [], [], []
+            for clave, medidas in propios.items():
+                fila = filas.get(clave)
+                if fila is None:
+                    fecha, tipo, region = clave
+                    crear.append(modelo(fecha=fecha, tipo_arbol_id=tipo, region_id=region, **dict(zip(MEDIDAS, medidas))))
+                    continue
+                for medida, valor in zip(MEDIDAS, medidas):
+                    setattr(fila, medida, getattr(fila, medida) + valor)
+                (vacias if fila.total <= 0 else actualizar).append(fila)
+            _actualizar_filas(modelo, actualizar)
+            modelo.objects.bulk_create(crear, batch_size=5000)
+            modelo.objects.filter(pk__in=[f.pk for f in vacias]).delete()
+
+
+def _actualizar_filas(modelo, filas):
+    """UPDATE por pk con executemany (bulk_update arma un CASE por fila y es mucho más lento)."""
+    if not filas:
+        return
+    conexion = connections[router.db_for_write(modelo)]
+    columnas = [modelo._meta.get_field(m).column for m in MEDIDAS]
+    sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+        conexion.ops.quote_name(modelo._meta.db_table),
+        ', '.join(f'{conexion.ops.quote_name(c)} = %s' for c in columnas),
+        conexion.ops.quote_name(modelo._meta.pk.column),
+    )
+    with conexion.cursor() as cursor:
+        cursor.executemany(sql, [[getattr(f, m) for m in MEDIDAS] + [f.pk] for f in filas])
+
+
+def agregar(queryset):
+    """Aportes de un queryset de predicciones, agregados en la base."""
+    completada = Q(estado='completada')
+    filas = queryset.annotate(dia=TruncDate('fecha_creacion')).values('dia', 'tipo_arbol', 'region').annotate(
+        total=Count('id'),
+        completadas=Count('id', filter=completada),
+        suma_hectareas=Sum('hectareas', filter=completada),
+        suma_produccion=Sum('produccion_total', filter=completada),
+        suma_inversion=Sum('inversion_estimada', filter=completada),
+        suma_agua=Sum('consumo_agua_total', filter=completada),
+    ).order_by()
+    aportes = {}
+    for fila in filas:
+        medidas = (
+            fila['total'], fila['completadas'], fila['suma_hectareas'] or 0, fila['suma_produccion'] or 0,
+            fila['suma_inversion'] or 0, fila['suma_agua'] or 0,
+        )
+        dia, tipo, region = fila['dia'], fila['tipo_arbol'], fila['region']
+        _sumar(aportes, ('dia', dia, tipo, region), medidas)
+        _sumar(aportes, ('mes', dia.replace(day=1), tipo, region), medidas)
+    return aportes
+
+
+def cambiar_region(queryset, region_id):
+    """queryset.update(region_id=...) trasladando sus totales de región."""
+    with transaction.atomic():
+        antes = agregar(queryset)
+        # La fecha se mueve para que la copia en memoria (services/instantanea) vea el cambio
+        actualizadas = queryset.update(region_id=region_id, fecha_actualizacion=timezone.now())
+        despues = {(periodo, fecha, tipo, region_id): medidas for (periodo, fecha, tipo, _), medidas in antes.items()}
+        aplicar(combinar((despues, 1), (antes, -1)))
+    return actualizadas
+
+
+def reconstruir(desde=None):
+    """
+    Recalcula los resúmenes desde la fecha `desde` (por completo si es None).
+
+    El recálculo parte del primer día del mes de `desde` para que los
+    resúmenes mensuales queden completos. Devuelve (diarios, mensuales).
+    """
+    predicciones = Prediccion.objects.all()
+    if desde is not None:
+        desde = desde.replace(day=1)
+        inicio = datetime.datetime.combine(desde, datetime.time.min)
+        if settings.USE_TZ:
+            inicio = timezone.make_aware(inicio)
+        predicciones = predicciones.filter(fecha_creacion__gte=inicio)
+
+    creadas = {}
+    with transaction.atomic():
+        aportes = agregar(predicciones)
+        for periodo, modelo in MODELOS.items():
+            existentes = modelo.objects.all()
+            if desde is not None:
+                existentes = existentes.filter(fecha__gte=desde)
+            existentes.delete()
+            filas = [
+                modelo(fecha=fecha, tipo_arbol_id=tipo, region_id=region, **dict(zip(MEDIDAS, medidas)))
+                for (p, fecha, tipo, region), medidas in aportes.items() if p == periodo
+            ]
+            modelo.objects.bulk_create(filas, batch_size=5000)
+            creadas[periodo] = len(filas)
+    return creadas['dia'], creadas['mes']
+
+
+def consultar(desde, hasta, periodo=None, tipo_arbol=None, region=None, agrupar=None):
+    """
+    Serie de totales por periodo entre `desde` y `hasta` (fechas, inclusive).
+
+    Sin `periodo` se usan los resúmenes diarios para rangos de hasta
+    MAX_DIAS_SERIE_DIARIA días y los mensuales para rangos mayores.
+    `agrupar` ('tipo_arbol' o 'region') separa la serie por esa clave.
+    Lanza ValueError con parámetros inválidos.
+    """
+    if desde > hasta:
+        raise ValueError("'desde' debe ser anterior a 'hasta'.")
+    if periodo is None:
+        periodo = 'dia' if (hasta - desde).days <= MAX_DIAS_SERIE_DIARIA else 'mes'
+    if periodo not in MODELOS:
+        raise ValueError(f"Periodo desconocido: {periodo!r} (use 'dia' o 'mes').")
+    if agrupar is not None and agrupar not in AGRUPACIONES:
+        raise ValueError(f"Agrupación desconocida: {agrupar!r} (use 'tipo_arbol' o 'region').")
+
+    inicio = desde.replace(day=1) if periodo == 'mes' else desde
+    filas = MODELOS[periodo].objects.filter(fecha__gte=inicio, fecha__lte=hasta)
+    if tipo_arbol is not None:
+        filas = filas.filter(tipo_arbol_id=tipo_arbol)
+    if region is not None:
+        filas = filas.filter(region_id=region)
+
+    claves = ['fecha'] + ([agrupar] if agrupar else [])
+    serie = filas.values(*claves).annotate(**{m: Sum(m) for m in MEDIDAS}).order_by(*claves)
+    return periodo, list(serie)
@@ -21,6 +21,16 @@ urlpatterns = [
 
     # === APIs ===
     path('api/comunas/', views.api_comunas_por_region, name='api_comunas'),
+    path('api/dashboard/stats/', views.api_dashboard_stats, name='api_dashboard_stats'),
+    path('api/tendencias/', views.api_tendencias, name='api_tendencias'),
+    path('api/clima/', views.api_clima, name='api_clima'),
+    path('api/demanda-hidrica/', views.api_demanda_hidrica, name='api_demanda_hidrica'),
+    path('api/predicciones/', views.api_predicciones, name='api_predicciones'),
+    path('api/predicciones/lote/', views.api_predicciones_lote, name='api_predicciones_lote'),
+    path('api/predicciones/<int:pk>/percentiles/', views.api_prediccion_percentiles, name='api_prediccion_percentiles'),
+    path('api/predicciones/<int:pk>/similares/', views.api_prediccion_similares, name='api_prediccion_similares'),
+    path('api/optimizador/', views.api_optimizador_cartera, name='api_optimizador_cartera'),
+    path('api/geocodificacion/inversa/', views.api_geocodificacion_inversa, name='api_geocodificacion_inversa'),
 
     # === IA ===
     path('ia/', views.ia_consulta, name='ia_consulta'),
@@ -30,6 +40,11 @@ urlpatterns = [
     path('ms/ping/', views.ms_ping_view, name='ms_ping'),
     path('ms/echo/', views.ms_echo_view, name='ms_echo'),
 
+    # === MÉTRICAS ===
+    path('metrics/', views.metricas_prometheus, name='metricas_prometheus'),
+    path('perfiles/', views.perfiles_lista, name='perfiles_lista'),
+    path('perfiles/<str:nombre>/', views.perfil_descarga, name='perfil_descarga'),
+
     # === CALCULADORAS ===
     path('calculadoras/', views.calculadoras_agricolas, name='calculadoras_agricolas'),
     path('calculadoras/fertilizacion/', views.calculadora_fertilizacion, name='calculadora_fertilizacion'),
@@ -37,4 +52,14 @@ urlpatterns = [
     path('calculadoras/roi/', views.calculadora_roi, name='calculadora_roi'),
     path('calculadoras/siembra/', views.calculadora_siembra, name='calculadora_siembra'),
     path('calculadoras/balance-hidrico/', views.calculadora_balance_hidrico, name='calculadora_balance_hidrico'),
+    path('calculadoras/csv/', views.calculadora_csv, name='calculadora_csv'),
+
+    # === API CALCULADORAS (LOTES) ===
+    path('api/calculadoras/fertilizacion/', views.api_calculadora_lote, {'calculadora': 'fertilizacion'}, name='api_calculadora_fertilizacion'),
+    path('api/calculadoras/agua/', views.api_calculadora_lote, {'calculadora': 'agua'}, name='api_calculadora_agua'),
+    path('api/calculadoras/roi/', views.api_calculadora_lote, {'calculadora': 'roi'}, name='api_calculadora_roi'),
+    path('api/calculadoras/siembra/', views.api_calculadora_lote, {'calculadora': 'siembra'}, name='api_calculadora_siembra'),
+    path('api/calculadoras/balance-hidrico/', views.api_calculadora_lote, {'calculadora': 'balance_hidrico'}, name='api_calculadora_balance_hidrico'),
+    path('api/calculadoras/balance-hidrico/simulacion/', views.api_balance_suelo, name='api_balance_suelo'),
+    path('api/riego/programa/', views.api_programa_riego, name='api_programa_riego'),
 ]
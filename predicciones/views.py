@@ -1,30 +1,36 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
 from django.core.paginator import Paginator
-from django.db.models import Count, Avg, Sum, Q
+from django.db.models import Count, Avg, Max, Sum, Q
 from django.conf import settings
-from openai import OpenAI
 from django.contrib.auth import get_user_model
-from .models import Prediccion, TipoArbol, Comuna, Region, DatoClimatico, AnalisisPrediccion
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from django.utils.text import get_valid_filename
+from django.core.exceptions import SuspiciousFileOperation
+from .routers import usar_replica
+from .models import (
+    Prediccion, PrediccionEliminada, TipoArbol, Comuna, Region, DatoClimatico, AnalisisPrediccion,
+)
 from .forms import PrediccionForm, AnalisisPrediccionForm
 from .services.fastapi_client import ping as ms_ping, echo as ms_echo
-import os, json, requests
-
-User = get_user_model()
-
-# ==========================================
-# CONFIGURACIÓN DE IA
-# ==========================================
-OPENROUTER_API_KEY = os.getenv(
-    "OPENROUTER_API_KEY",
-    "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"
+from .services import (
+    balance_suelo, calculadoras, clima, demanda_hidrica, flujo_caja, geocodificacion, ia_cliente,
+    instantanea, lectura_predicciones, lote_predicciones, metricas, optimizador, perfiles, programa_riego,
+    tendencias,
 )
+from .services.idempotencia import idempotente
+import functools
+import hmac
+import os, json
+import datetime
 
-client = OpenAI(
-    api_key=OPENROUTER_API_KEY,
-    base_url="https://openrouter.ai/api/v1"
-)
+User = get_user_model()
 
 # ==========================================
 # VISTAS DE IA
@@ -40,10 +46,11 @@ def ia_consulta(request):
         return JsonResponse({"error": "Debe incluir el parámetro 'q'."}, status=400)
 
     try:
-        chat = client.chat.completions.create(
-            model="deepseek/deepseek-r1:free",
-            messages=[{"role": "user", "content": pregunta}]
-        )
+        with metricas.medir_http("openrouter"):
+            chat = ia_cliente.obtener_cliente().chat.completions.create(
+                model="deepseek/deepseek-r1:free",
+                messages=[{"role": "user", "content": pregunta}]
+            )
         respuesta = chat.choices[0].message.content
         return JsonResponse({"input": pregunta, "respuesta": respuesta})
     except Exception as e:
@@ -54,7 +61,15 @@ def ia_consulta(request):
 # FUNCIONES AUXILIARES
 # ==========================================
 def obtener_datos_clima(comuna):
-    """Obtiene datos climáticos (simulados)."""
+    """
+    Clima de la comuna desde la grilla interpolada (services/clima); sin
+    observaciones cercanas, datos simulados.
+    """
+    datos = clima.obtener().comuna(comuna.id)
+    if datos is not None:
+        if not datos['observada']:
+            datos['descripcion'] = f"Estimado desde estaciones a {datos['distancia_km']:.0f} km"
+        return datos
     try:
         lat = comuna.latitud or -33.4489
         lon = comuna.longitud or -70.6693
@@ -72,16 +87,33 @@ def obtener_datos_clima(comuna):
 # ==========================================
 # DASHBOARD PRINCIPAL
 # ==========================================
-def dashboard(request):
-    total_predicciones = Prediccion.objects.count()
-    predicciones_completadas = Prediccion.objects.filter(estado='completada').count()
-    predicciones_recientes = Prediccion.objects.select_related(
-        'tipo_arbol', 'comuna__region'
-    ).order_by('-fecha_creacion')[:5]
-
-    stats_por_arbol = list(Prediccion.objects.filter(
+def con_nombres(filas):
+    """
+    Agrega 'tipo_arbol__tipo' y 'region__nombre' a filas agrupadas por las
+    claves `tipo_arbol` / `region` de Prediccion.
+
+    Los agregados agrupan solo por esas columnas (sin JOIN a TipoArbol,
+    Comuna ni Region) y los nombres salen de las tablas de referencia, que
+    son pequeñas.
+    """
+    filas = list(filas)
+    if any('tipo_arbol' in f for f in filas):
+        tipos = TipoArbol.objects.in_bulk([f['tipo_arbol'] for f in filas])
+        for f in filas:
+            f['tipo_arbol__id'] = f['tipo_arbol']
+            f['tipo_arbol__tipo'] = tipos[f['tipo_arbol']].tipo if f['tipo_arbol'] in tipos else None
+    if any('region' in f for f in filas):
+        regiones = Region.objects.in_bulk([f['region'] for f in filas if f['region'] is not None])
+        for f in filas:
+            f['region__nombre'] = regiones[f['region']].nombre if f['region'] in regiones else None
+    return filas
+
+
+def estadisticas_dashboard():
+    """Agregados de los gráficos del dashboard (por tipo de árbol y por región)."""
+    stats_por_arbol = con_nombres(Prediccion.objects.filter(
         estado='completada'
-    ).values('tipo_arbol__tipo').annotate(
+    ).values('tipo_arbol').annotate(
         total=Count('id'),
         promedio_produccion=Avg('produccion_por_hectarea'),
         promedio_confiabilidad=Avg('confiabilidad'),
@@ -89,15 +121,40 @@ def dashboard(request):
         promedio_agua=Avg('consumo_agua_por_hectarea')
     ).order_by('-total')[:5])
 
-    stats_por_region = list(Prediccion.objects.filter(
+    stats_por_region = con_nombres(Prediccion.objects.filter(
         estado='completada'
-    ).values('comuna__region__nombre').annotate(
+    ).values('region').annotate(
         total=Count('id'),
         total_hectareas=Sum('hectareas'),
         produccion_total=Sum('produccion_total'),
         inversion_total=Sum('inversion_estimada')
     ).order_by('-total')[:5])
 
+    return {'stats_por_arbol': stats_por_arbol, 'stats_por_region': stats_por_region}
+
+
+def etag_dashboard(request):
+    """
+    Versión de los datos del dashboard: última fecha_actualizacion, último
+    id (filas insertadas con fechas antiguas) y último borrado registrado
+    (los borrados no mueven la fecha). Cada máximo sale de un índice, sin
+    contar la tabla.
+    """
+    ultima = Prediccion.objects.aggregate(m=Max('fecha_actualizacion'))['m']
+    ultimo_id = Prediccion.objects.aggregate(m=Max('id'))['m'] or 0
+    ultimo_borrado = PrediccionEliminada.objects.aggregate(m=Max('id'))['m'] or 0
+    return f'{ultima.timestamp() if ultima else 0:.6f}-{ultimo_id}-{ultimo_borrado}'
+
+
+@usar_replica
+def dashboard(request):
+    total_predicciones = Prediccion.objects.count()
+    predicciones_completadas = Prediccion.objects.filter(estado='completada').count()
+    predicciones_recientes = Prediccion.objects.select_related(
+        'tipo_arbol', 'comuna__region'
+    ).order_by('-fecha_creacion')[:5]
+
+    # Los gráficos se cargan aparte desde api_dashboard_stats
     santiago = Comuna.objects.filter(nombre__icontains='Santiago').first()
     datos_clima = obtener_datos_clima(santiago) if santiago else None
 
@@ -105,8 +162,6 @@ def dashboard(request):
         'total_predicciones': total_predicciones,
         'predicciones_completadas': predicciones_completadas,
         'predicciones_recientes': predicciones_recientes,
-        'stats_por_arbol': json.dumps(stats_por_arbol),
-        'stats_por_region': json.dumps(stats_por_region),
         'datos_clima': datos_clima,
         'comuna_clima': santiago,
         'tasa_completado': round(
@@ -117,6 +172,88 @@ def dashboard(request):
     return render(request, 'predicciones/dashboard.html', context)
 
 
+@usar_replica
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=etag_dashboard)
+def api_dashboard_stats(request):
+    """
+    Agregados del dashboard en JSON. Con If-None-Match y datos sin cambios
+    responde 304 sin recalcularlos; no-cache obliga al navegador a
+    revalidar en cada visita.
+    """
+    return JsonResponse(estadisticas_dashboard())
+
+
+@usar_replica
+def api_clima(request):
+    """
+    Temperatura y humedad de todas las comunas con coordenadas: observadas
+    (última medición) o interpoladas desde las estaciones más cercanas.
+    """
+    return HttpResponse(
+        lectura_predicciones.serializar(clima.obtener().columnas()), content_type='application/json',
+    )
+
+
+@usar_replica
+def api_demanda_hidrica(request):
+    """
+    Demanda mensual de agua (m³) de las predicciones completadas, repartida
+    según la curva de coeficiente de cultivo de cada especie.
+
+    Parámetros GET: agrupar ('region' o 'tipo_arbol', que agrupa por región
+    y tipo), region y tipo_arbol (ids) y formato ('csv' para descargar).
+    """
+    try:
+        tipo_arbol = int(request.GET['tipo_arbol']) if request.GET.get('tipo_arbol') else None
+        region = int(request.GET['region']) if request.GET.get('region') else None
+    except ValueError:
+        return JsonResponse({"error": "'tipo_arbol' y 'region' deben ser ids numéricos."}, status=400)
+    try:
+        filas = demanda_hidrica.mensual(
+            instantanea.obtener(), agrupar=request.GET.get('agrupar') or 'region',
+            region=region, tipo_arbol=tipo_arbol,
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    filas = con_nombres(filas)
+    if request.GET.get('formato') == 'csv':
+        response = HttpResponse(demanda_hidrica.exportar_csv(filas), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="demanda_hidrica.csv"'
+        return response
+    return HttpResponse(
+        lectura_predicciones.serializar({'meses': demanda_hidrica.MESES, 'filas': filas}),
+        content_type='application/json',
+    )
+
+
+@usar_replica
+def api_tendencias(request):
+    """
+    Serie temporal desde los resúmenes diarios/mensuales.
+
+    Parámetros GET: desde y hasta (AAAA-MM-DD, por defecto los últimos dos
+    años), periodo ('dia' o 'mes', por defecto según el rango), tipo_arbol y
+    region (ids) y agrupar ('tipo_arbol' o 'region').
+    """
+    try:
+        hasta = datetime.date.fromisoformat(request.GET['hasta']) if request.GET.get('hasta') else timezone.localdate()
+        desde = datetime.date.fromisoformat(request.GET['desde']) if request.GET.get('desde') \
+            else hasta - datetime.timedelta(days=730)
+        tipo_arbol = int(request.GET['tipo_arbol']) if request.GET.get('tipo_arbol') else None
+        region = int(request.GET['region']) if request.GET.get('region') else None
+    except ValueError:
+        return JsonResponse({"error": "Fechas en formato AAAA-MM-DD e ids numéricos."}, status=400)
+    try:
+        periodo, serie = tendencias.consultar(
+            desde, hasta, periodo=request.GET.get('periodo') or None,
+            tipo_arbol=tipo_arbol, region=region, agrupar=request.GET.get('agrupar') or None,
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({'periodo': periodo, 'desde': desde, 'hasta': hasta, 'serie': con_nombres(serie)})
+
+
 # ==========================================
 # PREDICCIONES
 # ==========================================
@@ -154,24 +291,79 @@ def prediccion_detalle(request, pk):
         }
     )
 
-    otras_especies = Prediccion.objects.filter(
-        comuna__region=prediccion.comuna.region,
-        estado='completada'
-    ).exclude(id=prediccion.id).values(
-        'tipo_arbol__tipo', 'tipo_arbol__id'
-    ).annotate(
-        promedio_roi=Avg('roi_proyectado'),
-        promedio_produccion=Avg('produccion_por_hectarea')
-    ).order_by('-promedio_roi')[:3]
+    columnas = instantanea.obtener()
+    otras_especies = con_nombres(columnas.agrupar(
+        'tipo_arbol',
+        {'promedio_roi': 'roi_proyectado', 'promedio_produccion': 'produccion_por_hectarea'},
+        region=prediccion.region_id, excluir_id=prediccion.id, ordenar_por='promedio_roi', limite=3,
+    ))
 
     context = {
         'prediccion': prediccion,
         'analisis': analisis,
         'otras_especies': otras_especies,
+        'percentiles': columnas.percentiles(prediccion),
     }
     return render(request, 'predicciones/prediccion_detalle.html', context)
 
 
+@usar_replica
+def api_prediccion_percentiles(request, pk):
+    """
+    Percentil de ROI, producción por hectárea y eficiencia hídrica de una
+    predicción entre las completadas de su tipo de árbol y región.
+    """
+    prediccion = get_object_or_404(Prediccion.objects.select_related('tipo_arbol', 'region'), pk=pk)
+    return JsonResponse({
+        'prediccion': prediccion.pk,
+        'tipo_arbol': prediccion.tipo_arbol.tipo,
+        'region': prediccion.region.nombre if prediccion.region else None,
+        'metricas': instantanea.obtener().percentiles(prediccion),
+    })
+
+
+# Campos de cada huerto similar (nombres de lectura_predicciones.CAMPOS)
+CAMPOS_SIMILARES = (
+    'id', 'tipo_arbol', 'comuna', 'region', 'hectareas', 'edad_arboles', 'densidad_plantacion',
+    'tipo_riego', 'tipo_suelo', 'fertilizacion', 'produccion_por_hectarea', 'roi_proyectado',
+)
+
+
+def huertos_similares(prediccion, k, misma_especie=True):
+    """Las predicciones más parecidas (services/similares) con sus datos y la distancia."""
+    vecinos = instantanea.obtener().similares(prediccion, k=k, misma_especie=misma_especie)
+    if not vecinos:
+        return []
+    filas, _ = lectura_predicciones.consultar(CAMPOS_SIMILARES, ids=[i for i, _ in vecinos], limite=len(vecinos))
+    por_id = {fila['id']: fila for fila in filas}
+    return [dict(por_id[i], distancia=distancia) for i, distancia in vecinos if i in por_id]
+
+
+@usar_replica
+def api_prediccion_similares(request, pk):
+    """
+    Huertos más parecidos a una predicción (superficie, edad, densidad,
+    riego, suelo, fertilización y ubicación) entre las completadas.
+
+    Parámetros GET: k (hasta 100, por defecto 10) y todas_especies=1 para
+    no limitarse al mismo tipo de árbol.
+    """
+    prediccion = get_object_or_404(Prediccion, pk=pk)
+    try:
+        k = int(request.GET.get('k') or 10)
+    except ValueError:
+        return JsonResponse({"error": "'k' debe ser un entero."}, status=400)
+    try:
+        similares = huertos_similares(prediccion, k, misma_especie=request.GET.get('todas_especies') != '1')
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return HttpResponse(
+        lectura_predicciones.serializar({'prediccion': prediccion.pk, 'similares': similares}),
+        content_type='application/json',
+    )
+
+
+@usar_replica
 def lista_predicciones(request):
     """Lista general de predicciones (público)."""
     predicciones_list = Prediccion.objects.select_related(
@@ -187,7 +379,7 @@ def lista_predicciones(request):
     if estado:
         predicciones_list = predicciones_list.filter(estado=estado)
     if region:
-        predicciones_list = predicciones_list.filter(comuna__region__pk=region)
+        predicciones_list = predicciones_list.filter(region_id=region)
 
     paginator = Paginator(predicciones_list, 10)
     page_number = request.GET.get('page')
@@ -203,6 +395,105 @@ def lista_predicciones(request):
     return render(request, 'predicciones/prediccion_lista.html', context)
 
 
+@usar_replica
+def api_predicciones(request):
+    """
+    Lectura de predicciones en JSON, paginada por id.
+
+    Parámetros GET: fields (lista separada por comas; ver
+    lectura_predicciones.CAMPOS), estado, tipo_arbol, comuna, region, ids
+    (separados por comas), despues (cursor de la página anterior) y limite
+    (hasta 10000). Lee con values_list() solo las columnas pedidas.
+    """
+    try:
+        filtros = {
+            nombre: request.GET[nombre] if nombre == 'estado' else int(request.GET[nombre])
+            for nombre in lectura_predicciones.FILTROS if request.GET.get(nombre)
+        }
+        ids = [int(i) for i in request.GET['ids'].split(',') if i.strip()] if request.GET.get('ids') else None
+        despues = int(request.GET['despues']) if request.GET.get('despues') else None
+        limite = int(request.GET.get('limite') or lectura_predicciones.LIMITE_DEFECTO)
+    except ValueError:
+        return JsonResponse({"error": "tipo_arbol, comuna, region, ids, despues y limite deben ser enteros."}, status=400)
+    try:
+        campos = lectura_predicciones.campos_pedidos(request.GET.get('fields'))
+        filas, siguiente = lectura_predicciones.consultar(campos, filtros, ids, despues, limite)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return HttpResponse(
+        lectura_predicciones.serializar({'resultados': filas, 'siguiente': siguiente}),
+        content_type='application/json',
+    )
+
+
+def autor_api(vista):
+    """
+    Las escrituras por API exigen un autor: una sesión con permiso para
+    crear predicciones o "Authorization: Bearer <PREDICTIONS_API_TOKEN>"
+    (autor PREDICTIONS_API_USER), queda en request.autor_api. Solo se
+    aceptan cuerpos application/json: un formulario o un text/plain de otro
+    sitio no pasan.
+    """
+    @functools.wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        autorizacion = request.headers.get('Authorization')
+        token = getattr(settings, 'PREDICTIONS_API_TOKEN', '')
+        if autorizacion is not None:
+            if not token or not hmac.compare_digest(autorizacion, f'Bearer {token}'):
+                return JsonResponse({"error": "Token inválido."}, status=401)
+            autor = User.objects.filter(username=getattr(settings, 'PREDICTIONS_API_USER', '') or None).first()
+            if autor is None:
+                return JsonResponse(
+                    {"error": "El token no tiene un usuario asociado (PREDICTIONS_API_USER)."}, status=403,
+                )
+        elif request.user.is_authenticated:
+            if not request.user.has_perm('predicciones.add_prediccion'):
+                return JsonResponse({"error": "No tiene permiso para crear predicciones."}, status=403)
+            autor = request.user
+        else:
+            response = JsonResponse({"error": "Inicie sesión o envíe 'Authorization: Bearer <token>'."}, status=401)
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+        if request.content_type != 'application/json':
+            return JsonResponse({"error": "El cuerpo debe enviarse como application/json."}, status=415)
+        request.autor_api = autor
+        return vista(request, *args, **kwargs)
+    return envoltura
+
+
+@csrf_exempt
+@require_POST
+@autor_api
+@idempotente
+def api_predicciones_lote(request):
+    """
+    Crea varias predicciones en una solicitud (integraciones, p. ej. un ERP).
+
+    Cuerpo JSON: una lista (o {"predicciones": [...]}) de objetos con los
+    campos de PrediccionForm: tipo_arbol y comuna (ids), hectareas,
+    edad_arboles, densidad_plantacion, tipo_riego, tipo_suelo y
+    fertilizacion. Si alguna fila es inválida no se guarda ninguna y se
+    devuelven los errores por fila. Con la cabecera Idempotency-Key los
+    reintentos devuelven la respuesta original sin crear duplicados.
+    Requiere autor (ver autor_api).
+    """
+    datos = leer_json(request)
+    if isinstance(datos, dict):
+        datos = datos.get('predicciones')
+    try:
+        limpias, tipos, regiones, errores = lote_predicciones.validar(datos)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if errores:
+        return JsonResponse({"error": "Hay predicciones inválidas; no se guardó ninguna.", "filas": errores}, status=400)
+
+    creadas = lote_predicciones.crear(limpias, tipos, regiones, request.autor_api)
+    return JsonResponse({
+        "creadas": len(creadas),
+        "ids": [p.pk for p in creadas],
+    }, status=201)
+
+
 # ==========================================
 # ANÁLISIS DE PREDICCIÓN
 # ==========================================
@@ -226,26 +517,28 @@ def analisis_prediccion(request):
     return render(request, 'predicciones/analisis_prediccion.html', context)
 
 
+@usar_replica
 def analisis_prediccion_detalle(request, pk):
     prediccion = get_object_or_404(Prediccion, pk=pk)
 
-    misma_especie_otras_regiones = Prediccion.objects.filter(
-        tipo_arbol=prediccion.tipo_arbol, estado='completada'
-    ).exclude(id=prediccion.id).values('comuna__region__nombre').annotate(
-        promedio_roi=Avg('roi_proyectado'),
-        promedio_produccion=Avg('produccion_por_hectarea'),
-        promedio_inversion=Avg('inversion_estimada')
-    ).order_by('-promedio_roi')
-
-    alternativas_region = Prediccion.objects.filter(
-        comuna__region=prediccion.comuna.region, estado='completada'
-    ).exclude(tipo_arbol=prediccion.tipo_arbol).values(
-        'tipo_arbol__tipo', 'tipo_arbol__id'
-    ).annotate(
-        promedio_roi=Avg('roi_proyectado'),
-        promedio_produccion=Avg('produccion_por_hectarea'),
-        total_predicciones=Count('id')
-    ).order_by('-promedio_roi')[:5]
+    # Promedios sobre la copia en memoria de las predicciones completadas
+    columnas = instantanea.obtener()
+    misma_especie_otras_regiones = con_nombres(columnas.agrupar(
+        'region',
+        {
+            'promedio_roi': 'roi_proyectado',
+            'promedio_produccion': 'produccion_por_hectarea',
+            'promedio_inversion': 'inversion_estimada',
+        },
+        tipo_arbol=prediccion.tipo_arbol_id, excluir_id=prediccion.id, ordenar_por='promedio_roi',
+    ))
+
+    alternativas_region = con_nombres(columnas.agrupar(
+        'tipo_arbol',
+        {'promedio_roi': 'roi_proyectado', 'promedio_produccion': 'produccion_por_hectarea'},
+        region=prediccion.region_id, excluir_tipo=prediccion.tipo_arbol_id,
+        ordenar_por='promedio_roi', limite=5, contar='total_predicciones',
+    ))
 
     analisis_riesgo = {
         'roi_esperado': prediccion.roi_proyectado or 0,
@@ -258,11 +551,19 @@ def analisis_prediccion_detalle(request, pk):
         'prediccion': prediccion,
         'misma_especie_otras_regiones': misma_especie_otras_regiones,
         'alternativas_region': alternativas_region,
+        'percentiles': columnas.percentiles(prediccion),
+        'huertos_similares': huertos_similares(prediccion, 5),
         'analisis_riesgo': analisis_riesgo,
+        'curva_flujos': flujo_caja.curva_recuperacion(prediccion.flujos_caja),
+        'tasa_descuento': flujo_caja.parametros_economicos()[0] * 100,
     }
     return render(request, 'predicciones/analisis_prediccion_detalle.html', context)
 
 
+MAX_SELECCIONABLES = 100
+
+
+@usar_replica
 def comparacion_predicciones(request):
     """Comparación libre (sin restricción de usuario)."""
     prediccion_ids = request.GET.getlist('predicciones')
@@ -276,18 +577,39 @@ def comparacion_predicciones(request):
             estado='completada'
         ).select_related('tipo_arbol', 'comuna__region').order_by('-fecha_creacion')[:5]
 
+    # Promedio de cada especie (todas las regiones) para situar cada predicción
+    columnas = instantanea.obtener()
+    por_especie = {
+        fila['tipo_arbol']: fila for fila in columnas.agrupar(
+            'tipo_arbol',
+            {'roi_promedio_especie': 'roi_proyectado', 'produccion_promedio_especie': 'produccion_por_hectarea'},
+        )
+    }
+
     comparacion_data = []
     for p in predicciones:
+        especie = por_especie.get(p.tipo_arbol_id, {})
         comparacion_data.append({
             'prediccion': p,
             'roi_por_hectarea': (p.roi_proyectado or 0) / p.hectareas if p.hectareas else 0,
             'inversion_por_hectarea': (p.inversion_estimada or 0) / p.hectareas if p.hectareas else 0,
-            'eficiencia_agua': (p.produccion_por_hectarea or 0) / (p.consumo_agua_por_hectarea or 1)
+            'eficiencia_agua': (p.produccion_por_hectarea or 0) / (p.consumo_agua_por_hectarea or 1),
+            'roi_promedio_especie': especie.get('roi_promedio_especie'),
+            'produccion_promedio_especie': especie.get('produccion_promedio_especie'),
         })
 
+    # El selector muestra las más recientes (y las ya elegidas), no toda la tabla
+    seleccionables = Prediccion.objects.filter(estado='completada').select_related(
+        'tipo_arbol', 'comuna'
+    ).order_by('-fecha_creacion')
+    todas_predicciones = list(seleccionables[:MAX_SELECCIONABLES])
+    mostradas = {p.id for p in todas_predicciones}
+    todas_predicciones += [p for p in predicciones if p.id not in mostradas]
+
     context = {
         'comparacion_data': comparacion_data,
-        'todas_predicciones': Prediccion.objects.filter(estado='completada')
+        'todas_predicciones': todas_predicciones,
+        'prediccion_ids_selected': prediccion_ids,
     }
     return render(request, 'predicciones/comparacion_predicciones.html', context)
 
@@ -327,6 +649,10 @@ def generar_recomendacion_automatica(prediccion):
 
 
 def calcular_tiempo_recuperacion(prediccion):
+    if prediccion.periodo_recuperacion is not None:
+        return f"{prediccion.periodo_recuperacion:.1f} años"
+    if prediccion.flujos_caja:
+        return "No se recupera"
     if not prediccion.inversion_estimada or not prediccion.produccion_por_hectarea:
         return "No disponible"
     ingresos = (prediccion.produccion_por_hectarea *
@@ -380,89 +706,366 @@ def calculadoras_agricolas(request):
         {'nombre': 'Riego', 'descripcion': 'Cálculo lámina y frecuencia de riego', 'icono': 'fas fa-tint', 'url': 'calculadora_agua', 'categoria': 'Agua'},
         {'nombre': 'ROI Agrícola', 'descripcion': 'Retorno y recuperación de inversión', 'icono': 'fas fa-chart-line', 'url': 'calculadora_roi', 'categoria': 'Economía'},
         {'nombre': 'Densidad de Siembra', 'descripcion': 'Cantidad óptima de plantas', 'icono': 'fas fa-seedling', 'url': 'calculadora_siembra', 'categoria': 'Siembra'},
-        {'nombre': 'Balance Hídrico', 'descripcion': 'Balance entre precipitación y evapotranspiración', 'icono': 'fas fa-cloud-rain', 'url': 'calculadora_balance_hidrico', 'categoria': 'Agua'}
+        {'nombre': 'Balance Hídrico', 'descripcion': 'Balance entre precipitación y evapotranspiración', 'icono': 'fas fa-cloud-rain', 'url': 'calculadora_balance_hidrico', 'categoria': 'Agua'},
+        {'nombre': 'Carga de Parcelas (CSV)', 'descripcion': 'Fertilización y riego para una planilla completa de parcelas', 'icono': 'fas fa-file-csv', 'url': 'calculadora_csv', 'categoria': 'Lotes'}
     ]
     return render(request, 'calculadoras/index.html', {'calculadoras': calculadoras})
 
 
-def calculadora_fertilizacion(request):
-    resultado = None
-    if request.method == 'POST':
-        rendimiento_esperado = float(request.POST.get('rendimiento_esperado', 0))
-        cultivo = request.POST.get('cultivo')
-        superficie = float(request.POST.get('superficie', 1))
-        nitrogeno_suelo = float(request.POST.get('nitrogeno_suelo', 0))
-        fosforo_suelo = float(request.POST.get('fosforo_suelo', 0))
-        potasio_suelo = float(request.POST.get('potasio_suelo', 0))
-        formula_npk = request.POST.get('formula_npk', '15-15-15').split('-')
-        n_fert = float(formula_npk[0]) / 100
-        p_fert = float(formula_npk[1]) / 100
-        k_fert = float(formula_npk[2]) / 100
-
-        coef = {'N': 3.5, 'P2O5': 1.5, 'K2O': 5.5}
-        extr_n = rendimiento_esperado * coef['N']
-        extr_p = rendimiento_esperado * coef['P2O5']
-        extr_k = rendimiento_esperado * coef['K2O']
-        factor = 3900 / 1000000
-        disp_n = nitrogeno_suelo * factor
-        disp_p = fosforo_suelo * factor * 0.8
-        disp_k = potasio_suelo * factor * 0.9
-        req_n = max(0, extr_n - disp_n)
-        req_p = max(0, extr_p - disp_p)
-        req_k = max(0, extr_k - disp_k)
-        dosis = max(req_n / n_fert if n_fert > 0 else 0,
-                    req_p / p_fert if p_fert > 0 else 0,
-                    req_k / k_fert if k_fert > 0 else 0)
-        resultado = {'dosis_npk_ha': round(dosis, 1),
-                     'dosis_total': round(dosis * superficie, 1)}
+def calculo_formulario(request, nombre):
+    """
+    Ejecuta la calculadora `nombre` con los campos enviados en el formulario,
+    con las mismas validaciones de rango que la API por lotes. Devuelve
+    {columna: valor} o None, con el error en messages.
+    """
+    campos = {c: request.POST[c] for c in calculadoras.PARAMETROS[nombre] if c in request.POST}
+    try:
+        _, calculo = calculadoras.calcular_lote(nombre, campos)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return None
+    return {columna: calculadoras.a_lista(valores)[0] for columna, valores in calculo.items()}
 
+
+def calculadora_fertilizacion(request):
+    resultado = calculo_formulario(request, 'fertilizacion') if request.method == 'POST' else None
     return render(request, 'calculadoras/fertilizacion.html', {'resultado': resultado})
 
 
 def calculadora_agua(request):
-    resultado = None
-    if request.method == 'POST':
-        et0 = float(request.POST.get('et0', 0))
-        kc = float(request.POST.get('kc', 1))
-        eficiencia = float(request.POST.get('eficiencia', 0.7))
-        frecuencia = int(request.POST.get('frecuencia', 7))
-        lamina_diaria = et0 * kc
-        lamina_evento = lamina_diaria * frecuencia / eficiencia
-        volumen_evento = lamina_evento * 10
-        resultado = {'lamina_diaria': round(lamina_diaria, 1),
-                     'lamina_evento': round(lamina_evento, 1),
-                     'volumen_evento': round(volumen_evento, 1)}
+    resultado = calculo_formulario(request, 'agua') if request.method == 'POST' else None
     return render(request, 'calculadoras/agua.html', {'resultado': resultado})
 
 
 def calculadora_roi(request):
-    resultado = None
-    if request.method == 'POST':
-        inversion = float(request.POST.get('inversion', 0))
-        beneficio = float(request.POST.get('beneficio_anual', 0))
-        roi = (beneficio / inversion) * 100 if inversion > 0 else 0
-        payback = inversion / beneficio if beneficio > 0 else None
-        resultado = {'roi': round(roi, 1),
-                     'payback': round(payback, 1) if payback else None}
+    resultado = calculo_formulario(request, 'roi') if request.method == 'POST' else None
     return render(request, 'calculadoras/roi.html', {'resultado': resultado})
 
 
 def calculadora_siembra(request):
-    resultado = None
-    if request.method == 'POST':
-        densidad = float(request.POST.get('densidad_planta', 3000))
-        supervivencia = float(request.POST.get('supervivencia', 0.9))
-        plantas = densidad / supervivencia
-        resultado = {'plantas_necesarias': int(round(plantas, 0))}
+    resultado = calculo_formulario(request, 'siembra') if request.method == 'POST' else None
     return render(request, 'calculadoras/siembra.html', {'resultado': resultado})
 
 
 def calculadora_balance_hidrico(request):
-    resultado = None
-    if request.method == 'POST':
-        precipitacion = float(request.POST.get('precipitacion', 0))
-        etc = float(request.POST.get('etc', 0))
-        infiltracion = float(request.POST.get('infiltracion', 0))
-        balance = precipitacion - etc - infiltracion
-        resultado = {'balance': round(balance, 1)}
+    resultado = calculo_formulario(request, 'balance_hidrico') if request.method == 'POST' else None
     return render(request, 'calculadoras/balance_hidrico.html', {'resultado': resultado})
+
+
+# ==========================================
+# API DE CALCULADORAS (LOTES)
+# ==========================================
+MAX_FILAS_LOTE = 100000
+
+
+def leer_json(request):
+    """Decodifica el cuerpo JSON de la solicitud; devuelve None si es inválido."""
+    try:
+        return json.loads(request.body or b'{}')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+@csrf_exempt
+@require_POST
+def api_calculadora_lote(request, calculadora):
+    """
+    Ejecuta una calculadora sobre muchas parcelas en una sola pasada.
+
+    Recibe un JSON orientado a columnas, por ejemplo
+    {"et0": [5.1, 4.8], "kc": [1.0, 0.8], "eficiencia": 0.9}
+    y devuelve {"filas": 2, "resultados": {"lamina_diaria": [...], ...}}.
+    """
+    datos = leer_json(request)
+    if not isinstance(datos, dict):
+        return JsonResponse({"error": "El cuerpo debe ser un objeto JSON."}, status=400)
+    try:
+        filas, resultados = calculadoras.calcular_lote(calculadora, datos, max_filas=MAX_FILAS_LOTE)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({
+        "calculadora": calculadora,
+        "filas": filas,
+        "resultados": {k: calculadoras.a_lista(v) for k, v in resultados.items()},
+    })
+
+
+@csrf_exempt
+@require_POST
+def api_geocodificacion_inversa(request):
+    """
+    Comuna más cercana a muchos puntos GPS (apps de terreno).
+
+    Recibe {"latitud": [-33.45, ...], "longitud": [-70.66, ...], "max_km": 50}
+    (max_km opcional) y devuelve las columnas comuna_id, comuna, region_id,
+    region y distancia_km, con null donde no hay comuna dentro de max_km.
+    """
+    datos = leer_json(request)
+    if not isinstance(datos, dict):
+        return JsonResponse({"error": "El cuerpo debe ser un objeto JSON."}, status=400)
+    try:
+        latitud, longitud = geocodificacion.leer_puntos(datos)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    try:
+        max_km = float(datos['max_km']) if datos.get('max_km') is not None else None
+    except (TypeError, ValueError):
+        return JsonResponse({"error": "'max_km' debe ser un número."}, status=400)
+    resultados = geocodificacion.geocodificar(latitud, longitud, max_km=max_km)
+    return HttpResponse(
+        lectura_predicciones.serializar({"puntos": len(latitud), "resultados": resultados}),
+        content_type='application/json',
+    )
+
+
+def leer_serie_diaria(datos):
+    """
+    Serie diaria de ET0 de una solicitud de simulación: "et0" (común o por
+    parcela) o "comuna" (id, estimada desde DatoClimatico) con "dias" (por
+    defecto 365); "inicio" por defecto son los últimos días. Devuelve
+    (et0, inicio, dias, dias_observados); lanza ValueError si no es válida.
+    """
+    et0 = datos.get('et0')
+    if et0 is not None and not isinstance(et0, list):
+        raise ValueError("'et0' debe ser una lista (común o una por parcela).")
+    try:
+        if et0 is not None:
+            # Una serie común o una por parcela
+            dias = len(et0[0]) if et0 and isinstance(et0[0], list) else len(et0)
+        else:
+            dias = int(datos.get('dias') or 365)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("'dias' debe ser un número.")
+    # Antes de armar los parámetros por parcela, que son matrices (parcelas, dias)
+    if not 1 <= dias <= balance_suelo.MAX_DIAS:
+        raise ValueError(f"La serie debe tener entre 1 y {balance_suelo.MAX_DIAS} días.")
+    try:
+        inicio = datetime.date.fromisoformat(datos['inicio']) if datos.get('inicio') \
+            else timezone.localdate() - datetime.timedelta(days=dias)
+    except (TypeError, ValueError):
+        raise ValueError("'inicio' debe ser una fecha AAAA-MM-DD.")
+    if et0 is not None:
+        return et0, inicio, dias, None
+
+    if datos.get('comuna') is None:
+        raise ValueError("Indique 'et0' o 'comuna'.")
+    comuna = Comuna.objects.select_related('region').filter(pk=datos['comuna']).first() \
+        if str(datos['comuna']).isdigit() else None
+    if comuna is None:
+        raise ValueError("Comuna no encontrada.")
+    serie = balance_suelo.serie_comuna(comuna, inicio, dias)
+    return serie['et0'], inicio, dias, serie['dias_observados']
+
+
+@csrf_exempt
+@require_POST
+def api_balance_suelo(request):
+    """
+    Simulación diaria del balance hídrico del suelo de muchas parcelas.
+
+    Recibe {"parcelas": {"tipo_arbol": [...], "tipo_suelo": [...]}, "inicio":
+    "2025-01-01", "et0": [...], "lluvia": [...]} o, en vez de "et0",
+    "comuna" y "dias" (ver leer_serie_diaria). Con "diario": true devuelve
+    también el almacenamiento de cada día.
+    """
+    datos = leer_json(request)
+    if not isinstance(datos, dict) or not isinstance(datos.get('parcelas'), dict):
+        return JsonResponse({"error": "El cuerpo debe ser un objeto JSON con 'parcelas'."}, status=400)
+    diario = bool(datos.get('diario'))
+    try:
+        et0, inicio, dias, dias_observados = leer_serie_diaria(datos)
+        parametros = balance_suelo.leer_parcelas(datos['parcelas'], dias, inicio)
+        if diario and len(parametros['capacidad']) > balance_suelo.MAX_PARCELAS_DIARIO:
+            raise ValueError(f"'diario' admite hasta {balance_suelo.MAX_PARCELAS_DIARIO} parcelas.")
+        resultados = balance_suelo.simular(et0, lluvia=datos.get('lluvia') or 0, diario=diario, **parametros)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return HttpResponse(lectura_predicciones.serializar({
+        "parcelas": len(parametros['capacidad']),
+        "inicio": inicio.isoformat(),
+        "dias": dias,
+        "dias_observados": dias_observados,
+        "resultados": {k: v.tolist() for k, v in resultados.items()},
+    }), content_type='application/json')
+
+
+@csrf_exempt
+@require_POST
+def api_programa_riego(request):
+    """
+    Calendario de riego de la temporada para las parcelas de un predio.
+
+    Recibe la serie como api_balance_suelo y {"parcelas": {"nombre": [...],
+    "hectareas": [...], "tipo_arbol": [...], "tipo_suelo": [...],
+    "tipo_riego": [...], "bomba": [...]}, "bombas": {"norte": 800}}, con la
+    capacidad de cada bomba en m³/día (sin "bombas", sin límite). Devuelve
+    los eventos, el resumen por parcela y el uso de cada bomba; con
+    "formato": "csv" (o ?formato=csv), el calendario como CSV.
+    """
+    datos = leer_json(request)
+    if not isinstance(datos, dict):
+        return JsonResponse({"error": "El cuerpo debe ser un objeto JSON."}, status=400)
+    try:
+        et0, inicio, dias, dias_observados = leer_serie_diaria(datos)
+        parametros, nombres, bombas = programa_riego.leer_predio(datos, dias, inicio)
+        programa = programa_riego.programar(et0, lluvia=datos.get('lluvia') or 0, **parametros)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    if (datos.get('formato') or request.GET.get('formato')) == 'csv':
+        response = HttpResponse(
+            programa_riego.exportar_csv(programa, inicio, nombres, bombas), content_type='text/csv; charset=utf-8',
+        )
+        response['Content-Disposition'] = 'attachment; filename="programa_riego.csv"'
+        return response
+
+    eventos = programa['eventos']
+    fechas = [(inicio + datetime.timedelta(days=d)).isoformat() for d in range(dias)]
+    uso = programa['bombas']
+    return HttpResponse(lectura_predicciones.serializar({
+        "inicio": inicio.isoformat(),
+        "dias": dias,
+        "dias_observados": dias_observados,
+        "eventos": {
+            "fecha": [fechas[d] for d in eventos['dia'].tolist()],
+            "parcela": [nombres[p] for p in eventos['parcela'].tolist()],
+            "bomba": [bombas[p] for p in eventos['parcela'].tolist()],
+            **{k: eventos[k].tolist() for k in ('lamina_neta', 'lamina_bruta', 'volumen_m3')},
+        },
+        "parcelas": {"nombre": nombres, **{k: v.tolist() for k, v in programa['parcelas'].items()}},
+        "bombas": {
+            "nombre": sorted(set(bombas)),
+            # null: bomba sin límite
+            "capacidad_m3_dia": [
+                None if c == float('inf') else c for c in parametros['capacidad_bombas'].tolist()
+            ],
+            "volumen_m3": uso.sum(axis=1).round(1).tolist(),
+            "pico_m3_dia": uso.max(axis=1).tolist(),
+        },
+    }), content_type='application/json')
+
+
+def calculadora_csv(request):
+    """
+    Carga de una planilla CSV de parcelas (GET muestra el formulario).
+
+    El POST procesa el archivo por bloques y devuelve en streaming el mismo
+    CSV con las columnas de fertilización y riego agregadas.
+    """
+    # pandas se importa solo al usar esta vista (no al cargar las vistas)
+    from .services import csv_parcelas
+
+    if request.method == 'POST':
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            messages.error(request, 'Debe seleccionar un archivo CSV.')
+            return redirect('calculadora_csv')
+        try:
+            contenido = csv_parcelas.procesar_csv(archivo)
+        except csv_parcelas.ErrorPlanilla as e:
+            messages.error(request, str(e))
+            return redirect('calculadora_csv')
+        # El nombre viene del cliente: solo letras, números, guiones y puntos
+        try:
+            nombre = get_valid_filename(os.path.splitext(os.path.basename(archivo.name))[0])
+        except SuspiciousFileOperation:
+            nombre = 'parcelas'
+        response = StreamingHttpResponse(contenido, content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = content_disposition_header(True, f'{nombre}_resultados.csv')
+        return response
+
+    context = {
+        'columnas': csv_parcelas.COLUMNAS_ENTRADA,
+        'alias': csv_parcelas.ALIAS_COLUMNAS,
+    }
+    return render(request, 'calculadoras/carga_csv.html', context)
+
+
+# ==========================================
+# OPTIMIZADOR DE CARTERA
+# ==========================================
+@csrf_exempt
+@require_POST
+def api_optimizador_cartera(request):
+    """
+    Reparte hectáreas entre tipos de árbol y comunas bajo un derecho de agua.
+
+    Cuerpo JSON: {"hectareas": 50, "agua_m3": 300000, "comunas": [ids],
+    "region": id, "tipos": ["palto", ...], "max_fraccion_por_opcion": 0.3,
+    "objetivo": "ganancia" | "produccion"}. Sin comunas ni región se
+    consideran todas las comunas.
+    """
+    datos = leer_json(request)
+    if not isinstance(datos, dict):
+        return JsonResponse({"error": "El cuerpo debe ser un objeto JSON."}, status=400)
+
+    try:
+        hectareas = float(datos['hectareas'])
+        agua_m3 = float(datos['agua_m3'])
+        max_fraccion = float(datos.get('max_fraccion_por_opcion', 1.0))
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"error": "Debe indicar 'hectareas' y 'agua_m3' numéricos."}, status=400)
+
+    def es_id(valor):
+        return isinstance(valor, int) and not isinstance(valor, bool)
+
+    filtro_comunas, region, filtro_tipos = datos.get('comunas'), datos.get('region'), datos.get('tipos')
+    if filtro_comunas and not (isinstance(filtro_comunas, list) and all(map(es_id, filtro_comunas))):
+        return JsonResponse({"error": "'comunas' debe ser una lista de ids numéricos."}, status=400)
+    if region and not es_id(region):
+        return JsonResponse({"error": "'region' debe ser un id numérico."}, status=400)
+    if filtro_tipos and not (isinstance(filtro_tipos, list) and all(isinstance(t, str) for t in filtro_tipos)):
+        return JsonResponse({"error": "'tipos' debe ser una lista de nombres de tipo."}, status=400)
+
+    comunas = Comuna.objects.select_related('region')
+    if filtro_comunas:
+        comunas = comunas.filter(pk__in=filtro_comunas)
+    if region:
+        comunas = comunas.filter(region_id=region)
+    tipos = TipoArbol.objects.all()
+    if filtro_tipos:
+        tipos = tipos.filter(tipo__in=filtro_tipos)
+
+    try:
+        resultado = optimizador.optimizar(
+            hectareas, agua_m3, comunas=comunas, tipos=tipos,
+            max_fraccion_por_opcion=max_fraccion,
+            objetivo=datos.get('objetivo', 'ganancia'),
+        )
+    except (ValueError, TypeError) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(resultado)
+
+
+# ==========================================
+# MÉTRICAS
+# ==========================================
+def metricas_prometheus(request):
+    """Exposición Prometheus de las métricas del proceso (404 si están desactivadas)."""
+    if not metricas.habilitado():
+        raise Http404
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(metricas.registro.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ==========================================
+# PERFILES (SOLO STAFF)
+# ==========================================
+@staff_member_required
+def perfiles_lista(request):
+    config = perfiles.configuracion()
+    context = {
+        'perfiles': perfiles.listar(config['directorio']),
+        'config': config,
+    }
+    return render(request, 'predicciones/perfiles.html', context)
+
+
+@staff_member_required
+def perfil_descarga(request, nombre):
+    ruta = perfiles.ruta_perfil(perfiles.configuracion()['directorio'], nombre)
+    if ruta is None:
+        raise Http404
+    return FileResponse(open(ruta, 'rb'), as_attachment=True, filename=nombre)